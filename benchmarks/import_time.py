@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# measures how long it takes to import `start.py`, i.e. the start-up cost of each mining job,
+# and checks that no heavy library is loaded before a stage needs it
+# example: python benchmarks/import_time.py --repeat 10 --max_seconds 0.5
+##########
+
+##########
+# Import libraries
+##########
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# libraries which should only be loaded by the stages which use them (see src/lazy_imports.py)
+HEAVY_LIBRARIES = ['numpy', 'pandas', 'networkx', 'seaborn', 'matplotlib', 'scipy', 'dulwich', 'dateutil']
+
+# run in a fresh interpreter: imports `start` and lists the heavy libraries actually loaded
+# (modules imported with `lazy_import()` are in `sys.modules` before they are loaded, as `_LazyModule`)
+CHILD_CODE = """
+import json, sys, time
+start_time = time.perf_counter()
+import start
+duration = time.perf_counter() - start_time
+loaded = sorted(name for name, module in list(sys.modules.items())
+                if name.split('.')[0] in {heavy!r} and type(module).__name__ != '_LazyModule')
+print(json.dumps({{'duration': duration, 'loaded': sorted(set(name.split('.')[0] for name in loaded))}}))
+"""
+
+def measure_import(python=sys.executable):
+    """
+    Imports `start` in a fresh interpreter.
+
+    Returns
+    =======
+
+    tuple: import time (seconds, measured in the interpreter), wall time of the whole interpreter (seconds)
+    and names of the heavy libraries loaded by the import
+    """
+    wall_start = time.perf_counter()
+    result = subprocess.run([python, '-c', CHILD_CODE.format(heavy=HEAVY_LIBRARIES)],
+                            cwd=SOURCE_DIR, capture_output=True, text=True, check=True)
+    wall_time = time.perf_counter() - wall_start
+    measure = json.loads(result.stdout.strip().splitlines()[-1])
+    return measure['duration'], wall_time, measure['loaded']
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the time needed to import start.py.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of measures (fresh interpreters).")
+    parser.add_argument("--max_seconds", type=float, default=None,
+                        help="Fail (exit code 1) if the median import time is longer.")
+    arguments = parser.parse_args()
+
+    durations, wall_times = list(), list()
+    for i in range(arguments.repeat):
+        duration, wall_time, loaded = measure_import()
+        durations.append(duration)
+        wall_times.append(wall_time)
+    report = {
+        'import_time_median': statistics.median(durations),
+        'import_time_min': min(durations),
+        'interpreter_wall_time_median': statistics.median(wall_times),
+        'heavy_libraries_loaded': loaded
+    }
+    print(json.dumps(report, indent=4))
+
+    failed = False
+    if len(loaded) > 0:
+        print(f"Heavy libraries loaded at import: {', '.join(loaded)}", file=sys.stderr)
+        failed = True
+    if arguments.max_seconds is not None and report['import_time_median'] > arguments.max_seconds:
+        print(f"Median import time {report['import_time_median']:.3f}s is above {arguments.max_seconds}s", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# times and measures the memory of the deduplication of commits, each graph builder and each exporter,
+# on synthetic commit histories (see synthetic_commits.py) of several sizes, offline
+# example: python benchmarks/run_benchmarks.py --scales 1000 10000 100000 --output results.json
+#          python benchmarks/run_benchmarks.py --scales 1000 10000 --compare results.json
+##########
+
+##########
+# Import libraries
+##########
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic_commits import generate_commits, split_into_forks
+
+import networkx as nx
+from commit_store import CommitStore
+from commit_table import write_commit_table
+from export_writers import JSONArrayWriter
+from graph_formats import write_graph
+from build_commit_history import build_commit_history
+from commit_dag import CommitDAG
+from build_file_change_history import build_file_change_history, bulk_build_file_change_history
+from build_committer_graph import build_committer_graph
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+##########
+# Benchmarks
+##########
+
+class Inputs:
+    """
+    Inputs of the benchmarks at one scale: the synthetic commits, their forks, and the graphs
+    built from them (built once, on first use, outside of the measures).
+    """
+
+    def __init__(self, n_commits, parameters):
+        self.commits = generate_commits(n_commits, seed=parameters['seed'],
+                                        merge_ratio=parameters['merge_ratio'], branch_ratio=parameters['branch_ratio'],
+                                        files_per_commit=parameters['files_per_commit'], n_authors=parameters['n_authors'])
+        self.forks = split_into_forks(self.commits, n_forks=parameters['n_forks'],
+                                      fork_overlap=parameters['fork_overlap'], seed=parameters['seed'])
+        self._graphs = dict()
+
+    def fresh_commits(self):
+        # `label_branches()` may complete the refs of the commits, so each run gets its own refs
+        return [dict(commit, refs=list(commit['refs'])) for commit in self.commits]
+
+    def graph(self, name):
+        if name not in self._graphs:
+            if name == 'commit_history':
+                graph = nx.DiGraph()
+                build_commit_history(self.fresh_commits(), graph)
+                for node, attributes in graph.nodes(data=True):
+                    attributes['refs'], attributes['parents'] = str(attributes['refs']), str(attributes['parents'])
+            elif name == 'file_change_history':
+                graph = nx.DiGraph()
+                bulk_build_file_change_history(self.commits, graph)
+            else:
+                graph = nx.MultiDiGraph()
+                build_committer_graph(self.graph('file_change_history'), graph)
+            self._graphs[name] = graph
+        return self._graphs[name]
+
+def _deduplicate(inputs, directory):
+    commit_store = CommitStore()
+    for fork_name, commits in inputs.forks:
+        for commit in commits:
+            commit_store.add(commit, fork_name)
+    return sum(len(commits) for fork_name, commits in inputs.forks)
+
+def _commit_history(inputs, directory):
+    build_commit_history(inputs.fresh_commits(), nx.DiGraph())
+    return len(inputs.commits)
+
+def _commit_dag(inputs, directory):
+    CommitDAG.from_commits(inputs.commits)
+    return len(inputs.commits)
+
+def _file_change_history(inputs, directory):
+    graph = nx.DiGraph()
+    build_file_change_history(inputs.commits, graph)
+    return graph.number_of_nodes()
+
+def _file_change_history_bulk(inputs, directory):
+    graph = nx.DiGraph()
+    bulk_build_file_change_history(inputs.commits, graph)
+    return graph.number_of_nodes()
+
+def _committer_graph(inputs, directory):
+    build_committer_graph(inputs.graph('file_change_history'), nx.MultiDiGraph())
+    return inputs.graph('file_change_history').number_of_edges()
+
+def _export_commits_JSON(inputs, directory):
+    with JSONArrayWriter(os.path.join(directory, 'commits.json')) as writer:
+        for commit in inputs.commits:
+            writer.add(commit)
+    return len(inputs.commits)
+
+def _export_commit_table(inputs, directory):
+    write_commit_table(inputs.commits, os.path.join(directory, 'commit_table'))
+    return len(inputs.commits)
+
+def _graph_export(graph_name, graph_format, compress=False):
+    def export(inputs, directory):
+        graph = inputs.graph(graph_name)
+        write_graph(graph, os.path.join(directory, graph_name), graph_format, compress=compress)
+        return graph.number_of_nodes() + graph.number_of_edges()
+    return export
+
+# (name, function(inputs, temporary directory) -> number of items processed)
+BENCHMARKS = [
+    ('dedup', _deduplicate),
+    ('build_commit_history', _commit_history),
+    ('build_commit_dag', _commit_dag),
+    ('build_file_change_history', _file_change_history),
+    ('build_file_change_history_bulk', _file_change_history_bulk),
+    ('build_committer_graph', _committer_graph),
+    ('export_commits_json', _export_commits_JSON),
+    ('export_commit_table', _export_commit_table),
+    ('export_commit_history_graphml', _graph_export('commit_history', 'graphml')),
+    ('export_commit_history_edgelist', _graph_export('commit_history', 'edgelist')),
+    ('export_file_change_history_graphml', _graph_export('file_change_history', 'graphml')),
+    ('export_file_change_history_graphml_gz', _graph_export('file_change_history', 'graphml', compress=True)),
+    ('export_file_change_history_json', _graph_export('file_change_history', 'json')),
+    ('export_file_change_history_edgelist', _graph_export('file_change_history', 'edgelist')),
+    ('export_committer_graph_graphml', _graph_export('committer_graph', 'graphml')),
+    ('export_committer_graph_json', _graph_export('committer_graph', 'json')),
+]
+
+def measure(function, inputs, repeat=1, memory=True):
+    """
+    Runs a benchmark `repeat` times and keeps the fastest run, then once more under `tracemalloc`
+    (which slows Python down) to measure the peak of memory allocated by the run.
+
+    Returns
+    =======
+
+    dict: number of items processed, wall time and CPU time (seconds), peak memory (bytes, None if not measured)
+    """
+    wall_times, cpu_times = list(), list()
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            items = function(inputs, directory)
+            wall_times.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+    peak_memory = None
+    if memory:
+        with tempfile.TemporaryDirectory() as directory:
+            tracemalloc.start()
+            function(inputs, directory)
+            current, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    wall_time = min(wall_times)
+    return {
+        'items': items,
+        'wall_time': wall_time,
+        'cpu_time': min(cpu_times),
+        'peak_memory': peak_memory,
+        'items_per_second': items / wall_time if wall_time > 0 else None
+    }
+
+##########
+# Reports
+##########
+
+def environment():
+    # versions needed to compare results across machines and versions of the code
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    import numpy
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__,
+        'networkx': nx.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+
+def compare(results, baseline):
+    """
+    Prints the ratio of the wall times and peak memory of `results` to those of `baseline` (results of a previous run),
+    for the benchmarks run at the same scale in both.
+    """
+    previous = {(result['scale'], result['benchmark']): result for result in baseline['results']}
+    print(f"{'scale':>10} {'benchmark':<40} {'time ratio':>10} {'memory ratio':>12}")
+    for result in results['results']:
+        before = previous.get((result['scale'], result['benchmark']))
+        if before is None:
+            continue
+        time_ratio = result['wall_time'] / before['wall_time'] if before['wall_time'] else float('nan')
+        if result['peak_memory'] is not None and before['peak_memory']:
+            memory_ratio = f"{result['peak_memory'] / before['peak_memory']:12.2f}"
+        else:
+            memory_ratio = f"{'-':>12}"
+        print(f"{result['scale']:>10} {result['benchmark']:<40} {time_ratio:10.2f} {memory_ratio}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the graph builders and exporters on synthetic commit histories.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000], help="Numbers of commits.")
+    parser.add_argument("--benchmarks", type=str, nargs="+", default=None, choices=[name for name, function in BENCHMARKS],
+                        help="Benchmarks to run (all by default).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--merge_ratio", type=float, default=0.1, help="Share of merge commits.")
+    parser.add_argument("--branch_ratio", type=float, default=0.05, help="Share of commits starting a branch.")
+    parser.add_argument("--files_per_commit", type=float, default=3, help="Average number of files changed by a commit.")
+    parser.add_argument("--n_authors", type=int, default=20, help="Number of authors.")
+    parser.add_argument("--n_forks", type=int, default=4, help="Number of forks the commits are distributed over.")
+    parser.add_argument("--fork_overlap", type=float, default=0.8, help="Share of the commits contained by all forks.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each benchmark, the fastest is kept.")
+    parser.add_argument("--no_memory", action="store_true", help="Don't measure the peak memory (faster).")
+    parser.add_argument("--output", type=str, default=None, help="JSON file to write the results to.")
+    parser.add_argument("--compare", type=str, default=None, help="JSON file with the results of a previous run to compare with.")
+    arguments = parser.parse_args()
+
+    parameters = {name: getattr(arguments, name) for name in
+                  ['seed', 'merge_ratio', 'branch_ratio', 'files_per_commit', 'n_authors', 'n_forks', 'fork_overlap', 'repeat']}
+    results = {'environment': environment(), 'parameters': parameters, 'results': list()}
+    for n_commits in arguments.scales:
+        inputs = Inputs(n_commits, parameters)
+        for name, function in BENCHMARKS:
+            if arguments.benchmarks is not None and name not in arguments.benchmarks:
+                continue
+            result = dict(scale=n_commits, benchmark=name,
+                          **measure(function, inputs, repeat=arguments.repeat, memory=not arguments.no_memory))
+            results['results'].append(result)
+            memory = '-' if result['peak_memory'] is None else f"{result['peak_memory'] / 2**20:.1f} MB"
+            print(f"{n_commits:>10} {name:<40} {result['wall_time']:8.3f} s {memory:>10}", file=sys.stderr)
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if arguments.compare is not None:
+        with open(arguments.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# seeded generator of synthetic commit histories, with the same structure as the commits fetched by perceval,
+# so the graph builders and exporters can be benchmarked offline at any scale
+##########
+
+##########
+# Import libraries
+##########
+import hashlib
+import os
+import random
+import sys
+
+# the modules of the pipeline are in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from timestamps import format_git_date
+
+FIRST_COMMIT_DATE = 1514764800 # 2018-01-01 00:00:00 UTC
+TIME_ZONES = [0, 60, 120, -300, -420, 330]
+
+def _skewed_choice(rng, n_items, skew):
+    # a few items are chosen often, most rarely (as authors and files in real repositories)
+    return (int(rng.paretovariate(skew)) - 1) % n_items
+
+def generate_commits(n_commits, seed=0, merge_ratio=0.1, branch_ratio=0.05, files_per_commit=3,
+                     n_files=None, n_authors=20):
+    """
+    Generates a commit history (perceval format, oldest commit first).
+
+    Each commit extends one of the branch heads, starts a new branch from an earlier commit
+    (probability `branch_ratio`), or merges two branch heads (probability `merge_ratio`).
+    The remaining heads get branch refs ("refs/heads/...").
+
+    Parameters
+    ==========
+
+    `n_commits` : int, required
+    `seed` : int, optional, the same seed always gives the same history
+    `merge_ratio` : float, optional, share of merge commits
+    `branch_ratio` : float, optional, share of commits starting a branch
+    `files_per_commit` : float, optional, average number of files changed by a commit
+    `n_files` : int, optional, number of files in the repository (by default a tenth of the number of commits, at least 10)
+    `n_authors` : int, optional, number of authors
+
+    Returns
+    =======
+
+    list of dicts
+    """
+    rng = random.Random(seed)
+    if n_files is None:
+        n_files = max(10, n_commits // 10)
+    file_paths = ['src/module_' + str(i // 50) + '/file_' + str(i) + '.py' for i in range(n_files)]
+    authors = ['Author ' + str(i) + ' <author' + str(i) + '@example.org>' for i in range(n_authors)]
+    known_files = set()
+
+    commits = list()
+    heads = list() # indices of the commits at the head of a branch
+    epoch = FIRST_COMMIT_DATE
+    for i in range(n_commits):
+        sha = hashlib.sha1(f"{seed}-{i}".encode('ascii')).hexdigest()
+        draw = rng.random()
+        if i == 0:
+            parents = list()
+            heads.append(i)
+        elif draw < merge_ratio and len(heads) >= 2:
+            first, second = rng.sample(range(len(heads)), 2)
+            parents = [commits[heads[first]]['commit'], commits[heads[second]]['commit']]
+            heads[first] = i
+            del heads[second]
+        elif draw < merge_ratio + branch_ratio:
+            parents = [commits[rng.randrange(i)]['commit']]
+            heads.append(i)
+        else:
+            head = rng.randrange(len(heads))
+            parents = [commits[heads[head]]['commit']]
+            heads[head] = i
+
+        epoch += rng.randint(1, 7200)
+        author_index = _skewed_choice(rng, n_authors, 1.2)
+        author = authors[author_index]
+        date = format_git_date(epoch, TIME_ZONES[author_index % len(TIME_ZONES)]) # same format as perceval
+
+        files = list()
+        n_changes = rng.randint(1, max(1, int(2 * files_per_commit) - 1))
+        for path_index in sorted(set(_skewed_choice(rng, n_files, 0.6) for j in range(n_changes))):
+            path = file_paths[path_index]
+            action = 'M' if path in known_files else 'A'
+            known_files.add(path)
+            files.append({
+                'action': action,
+                'added': str(rng.randint(0, 200)),
+                'file': path,
+                'indexes': ['0000000' if action == 'A' else sha[:7], sha[7:14]],
+                'modes': ['000000' if action == 'A' else '100644', '100644'],
+                'removed': '0' if action == 'A' else str(rng.randint(0, 100))
+            })
+
+        commits.append({
+            'Author': author,
+            'AuthorDate': date,
+            'Commit': author,
+            'CommitDate': date,
+            'commit': sha,
+            'files': files,
+            'message': f"Change {i}",
+            'parents': parents,
+            'refs': list()
+        })
+
+    for branch, head in enumerate(heads):
+        commits[head]['refs'] = ['HEAD -> refs/heads/master'] if branch == 0 else ['refs/heads/branch-' + str(branch)]
+    return commits
+
+def split_into_forks(commits, n_forks=1, fork_overlap=0.8, seed=0):
+    """
+    Distributes a commit history over forks, as fetched fork by fork: every fork contains the oldest
+    `fork_overlap` share of the commits (shared history), and the other commits are split between the forks.
+
+    Parameters
+    ==========
+
+    `commits` : list of dicts, required, e.g. generated by `generate_commits()`
+    `n_forks` : int, optional, number of forks, the first one being the parent repository
+    `fork_overlap` : float, optional, in [0, 1]
+    `seed` : int, optional
+
+    Returns
+    =======
+
+    list of (fork name, list of commits), the commits shared between forks being the same dicts
+    """
+    rng = random.Random(seed)
+    n_shared = int(round(fork_overlap * len(commits)))
+    forks = [('owner' + str(k) + '/repo', list(commits[:n_shared])) for k in range(n_forks)]
+    for commit in commits[n_shared:]:
+        forks[rng.randrange(n_forks)][1].append(commit)
+    return forks
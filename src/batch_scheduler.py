@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Run the processing of a list of repositories as a batch of jobs which survives failures and restarts:
+# a journal records, for each repository, its status and the stages it completed, failures which go away
+# by themselves (rate limits, network errors) are retried with an increasing delay, and a run started again
+# skips the repositories already done and resumes the others from their last completed stage.
+
+##########
+# Import libraries
+##########
+
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import count
+
+import requests
+from perceval.errors import RepositoryError
+from get_Github_forks import GitHubAPIError
+from instrumentation import count_http_request
+
+# longest delay before retrying a repository, in seconds
+MAX_RETRY_DELAY = 3600
+
+# messages of git about failures of the network or of the server while cloning or fetching,
+# e.g. "fatal: unable to access '...': Could not resolve host: github.com" or "error: RPC failed; curl 56 ..."
+TRANSIENT_GIT_ERRORS = re.compile(
+    r"could not resolve host|failed to connect|connection (?:timed out|reset|refused)|operation timed out|timed out after"
+    r"|the remote end hung up unexpectedly|early eof|rpc failed|unexpected disconnect|gnutls|ssl_|ssl connect"
+    r"|the requested url returned error: (?:429|5\d\d)|temporary failure in name resolution",
+    re.IGNORECASE)
+
+##########
+# Journal
+##########
+
+class JobJournal:
+    """
+    Journal of the jobs of a batch, one JSON file per repository in `<data_dir>/journal/`.
+
+    The entry of a repository records its status (key "status": "running", "waiting" for a retry, "done" or "failed"),
+    the number of attempts (key "attempts"), the error of the last attempt and whether it is transient
+    (keys "error" and "transient"), its wall time (key "wall_time") and the stages completed (key "stages"),
+    with the data needed to resume after them (see `Checkpoints`).
+
+    Each file is written under a temporary name and then moved in place, so an interrupted run never leaves
+    a truncated entry behind. Only one process writes the entry of a repository at a time: the worker processing
+    it, or the scheduler before and after.
+
+    Parameters
+    ==========
+
+    `data_dir` : str, required, output directory for downloaded data
+    """
+
+    def __init__(self, data_dir):
+        self.journal_dir = os.path.join(data_dir, 'journal')
+
+    def entry_path(self, repository_name):
+        return os.path.join(self.journal_dir, repository_name.replace('/', '-') + '.json')
+
+    def load(self, repository_name):
+        """
+        Returns the entry of a repository ("<owner>/<repo>"), or a new entry if there is none.
+        """
+        entry_path = self.entry_path(repository_name)
+        if os.path.isfile(entry_path):
+            try:
+                with open(entry_path, 'r') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError) as journal_error:
+                # an unreadable entry only costs us processing the repository again
+                logging.warning(f"Ignoring unreadable journal entry {entry_path}: {journal_error}")
+        return {'repository': repository_name, 'status': None, 'attempts': 0, 'stages': dict(),
+                'error': None, 'transient': False, 'wall_time': None}
+
+    def save(self, entry):
+        entry['updated'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        entry_path = self.entry_path(entry['repository'])
+        if not os.path.isdir(self.journal_dir):
+            os.makedirs(self.journal_dir, exist_ok=True)
+        with open(entry_path + '.tmp', 'w') as f:
+            json.dump(entry, f, sort_keys=True, indent=4)
+        os.replace(entry_path + '.tmp', entry_path)
+
+    def reset(self, repository_name):
+        """
+        Forgets the status and the stages completed by previous runs.
+        """
+        entry = self.load(repository_name)
+        entry.update(status=None, stages=dict(), error=None, transient=False)
+        self.save(entry)
+
+    def start_attempt(self, repository_name):
+        entry = self.load(repository_name)
+        entry['status'] = 'running'
+        entry['attempts'] += 1
+        self.save(entry)
+
+    def finish_attempt(self, result, retry_delay=None):
+        """
+        Records the result of an attempt (see `run_repository()` in start.py), which is retried after `retry_delay` seconds if given.
+        """
+        entry = self.load(result['repository'])
+        if result['status'] == 'ok':
+            entry['status'] = 'done'
+        else:
+            entry['status'] = 'failed' if retry_delay is None else 'waiting'
+        entry['error'] = result['error']
+        entry['transient'] = result.get('transient', False)
+        if result.get('report') is not None:
+            entry['wall_time'] = result['report']['wall_time']
+        self.save(entry)
+
+class Checkpoints:
+    """
+    Stages completed by the processing of one repository, recorded in its journal entry (see `JobJournal`).
+    Without a journal, nothing is recorded and no stage is ever completed.
+
+    Parameters
+    ==========
+
+    `journal` : JobJournal, optional
+    `repository_name` : str, required, "<owner>/<repo>"
+    """
+
+    def __init__(self, journal, repository_name):
+        self.journal = journal
+        self.repository_name = repository_name
+        self.stages = dict() if journal is None else journal.load(repository_name)['stages']
+
+    def completed(self, stage):
+        return stage in self.stages
+
+    def data(self, stage):
+        """
+        Returns the data recorded with a completed stage (see `complete()`).
+        """
+        return self.stages[stage]
+
+    def complete(self, stage, **data):
+        """
+        Records that `stage` is completed, with the data needed to resume after it (JSON serialisable).
+        """
+        self.stages[stage] = dict(data, completed=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        if self.journal is not None:
+            entry = self.journal.load(self.repository_name)
+            entry['stages'] = self.stages
+            self.journal.save(entry)
+
+##########
+# Failures
+##########
+
+def is_transient_error(error):
+    """
+    Returns True if an error raised by the processing of a repository is likely to go away by itself,
+    so the repository is worth processing again later: rate limits and server errors of the GitHub API,
+    network errors, and the failures of git clones and fetches caused by the network or the server
+    (see `TRANSIENT_GIT_ERRORS`). Other failures of git, e.g. a repository which doesn't exist, are not transient.
+    """
+    if isinstance(error, GitHubAPIError):
+        return error.transient
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError, requests.exceptions.JSONDecodeError)):
+        # the latter: an error page (e.g. "502 Bad Gateway") instead of JSON
+        return True
+    if isinstance(error, RepositoryError):
+        return TRANSIENT_GIT_ERRORS.search(str(error)) is not None
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def retry_delay(attempt, base_delay):
+    """
+    Returns the delay in seconds before the next attempt after `attempt` failed attempts:
+    `base_delay` doubled after each attempt, up to `MAX_RETRY_DELAY`, plus up to 10% so retries don't all start at once.
+    """
+    delay = min(base_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+    return delay * (1 + random.random() / 10)
+
+##########
+# Order of the jobs
+##########
+
+def estimate_size(username, reponame, auth=None):
+    """
+    Estimates the cost of mining a repository from its size (in kB, as reported by the GitHub API)
+    times the number of its direct forks plus one, since each fork is cloned. Returns None if not known.
+    """
+    try:
+        r = requests.get(url="https://api.github.com/repos/{}/{}".format(username, reponame),
+                         headers=None if auth is None else {"Authorization": "token " + auth})
+        count_http_request(r)
+        j = r.json()
+        r.close()
+    except (requests.exceptions.RequestException, ValueError) as request_error:
+        logging.debug(f"Can't estimate the size of {username}/{reponame}: {request_error!r}")
+        return None
+    if "size" not in j:
+        logging.debug(f"Can't estimate the size of {username}/{reponame}: {j.get('message')}")
+        return None
+    return j["size"] * (j.get("forks_count", 0) + 1)
+
+def order_by_size(repositories, auth=None, max_workers=8):
+    """
+    Sorts the repository list by decreasing estimated size (see `estimate_size()`), so the longest jobs start first.
+    Repositories whose size isn't known come last, in their order in the list.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sizes = list(executor.map(lambda repository: estimate_size(repository["owner"], repository["repo"], auth), repositories))
+    order = sorted(range(len(repositories)), key=lambda i: (sizes[i] is None, -(sizes[i] or 0), i))
+    logging.info(f"Repositories ordered by estimated size, {sum(size is None for size in sizes)} of unknown size last")
+    return [repositories[i] for i in order]
+
+##########
+# Scheduler
+##########
+
+def run_inline(function, *args):
+    """
+    Runs `function(*args)` in this process and returns its outcome as a done `concurrent.futures.Future`,
+    like `Executor.submit()`.
+    """
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+class ProcessPoolSubmitter:
+    """
+    Starts the processing of repositories in a pool of worker processes (see `run_batch()`).
+    A pool is broken for good once one of its workers dies (e.g. killed by the OOM killer): the pool is then
+    replaced by a new one, so the rest of the batch is still processed. Use it as a context manager.
+
+    Parameters
+    ==========
+
+    `function` : function, required, processes a repository, called as `function(repository, *args)`
+    `args` : tuple, optional, other arguments of `function`
+    `**executor_options` : arguments of `concurrent.futures.ProcessPoolExecutor`, e.g. `max_workers`
+    """
+
+    def __init__(self, function, args=(), **executor_options):
+        self.function = function
+        self.args = args
+        self.executor_options = executor_options
+        self.executor = ProcessPoolExecutor(**executor_options)
+
+    def __call__(self, repository):
+        try:
+            return self.executor.submit(self.function, repository, *self.args)
+        except BrokenExecutor as pool_error:
+            logging.warning(f"Replacing the pool of worker processes: {pool_error}")
+            self.executor.shutdown(wait=False)
+            self.executor = ProcessPoolExecutor(**self.executor_options)
+            return self.executor.submit(self.function, repository, *self.args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.executor.shutdown(wait=True)
+
+def run_batch(repositories, submit, journal, max_running=1, resume=False, max_retries=2, base_delay=60):
+    """
+    Processes the repositories of a list, up to `max_running` at a time, and retries those whose processing
+    failed with a transient error (see `is_transient_error()`) up to `max_retries` times, after a delay
+    (see `retry_delay()`). Retries resume from the last stage completed (see `Checkpoints`).
+
+    Parameters
+    ==========
+
+    `repositories` : list of dicts, required, repository list (keys "owner" and "repo"), in the order they are started
+    `submit` : function, required, starts the processing of a repository and returns a `concurrent.futures.Future`
+        of its result (see `run_repository()` in start.py), e.g. a `ProcessPoolSubmitter` or `run_inline(...)`
+    `journal` : JobJournal, required
+    `max_running` : int, optional, number of repositories processed at the same time
+    `resume` : bool, optional, skip the repositories done by a previous run, and resume the others from their
+        last completed stage; otherwise their journal entries are reset
+    `max_retries` : int, optional
+    `base_delay` : float, optional, delay before the first retry, in seconds
+
+    Returns
+    =======
+
+    tuple: results of the last attempt of each repository processed, in the order of the list,
+    and the number of repositories skipped because a previous run completed them
+    """
+    queue = list()
+    n_skipped = 0
+    for repository in repositories:
+        repository_name = repository["owner"] + "/" + repository["repo"]
+        if resume and journal.load(repository_name)['status'] == 'done':
+            n_skipped += 1
+        else:
+            if not resume:
+                journal.reset(repository_name)
+            queue.append(repository)
+    queue.reverse() # popped from the end
+    if n_skipped > 0:
+        logging.info(f"{n_skipped} repositories skipped: completed by a previous run (see {journal.journal_dir})")
+
+    results = dict() # "<owner>/<repo>" -> result of the last attempt
+    attempts = dict() # "<owner>/<repo>" -> number of attempts in this run
+    waiting = list() # heap of (time of the retry, order, repository)
+    order = count()
+    running = dict() # future -> repository
+    while len(queue) > 0 or len(waiting) > 0 or len(running) > 0:
+        while len(waiting) > 0 and waiting[0][0] <= time.monotonic():
+            queue.append(heapq.heappop(waiting)[2])
+        while len(queue) > 0 and len(running) < max_running:
+            repository = queue.pop()
+            try:
+                future = submit(repository)
+            except BrokenExecutor as pool_error:
+                # the repository fails like those which were running in the broken pool, and is recorded below
+                future = Future()
+                future.set_exception(pool_error)
+            running[future] = repository
+        if len(running) == 0:
+            # only retries left, none due yet
+            time.sleep(max(0, waiting[0][0] - time.monotonic()))
+            continue
+
+        timeout = None if len(waiting) == 0 else max(0, waiting[0][0] - time.monotonic())
+        done, not_done = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            repository = running.pop(future)
+            repository_name = repository["owner"] + "/" + repository["repo"]
+            attempts[repository_name] = attempts.get(repository_name, 0) + 1
+            try:
+                result = future.result()
+            except Exception as worker_error: # e.g. a worker process killed by the OOM killer
+                logging.error(f"Worker processing {repository_name} died: {worker_error!r}")
+                result = {"repository": repository_name, "status": "failed", "error": repr(worker_error), "transient": False}
+            results[repository_name] = result
+
+            if result["status"] != "ok" and result.get("transient") and attempts[repository_name] <= max_retries:
+                delay = retry_delay(attempts[repository_name], base_delay)
+                logging.warning(f"{repository_name} failed with a transient error, retry {attempts[repository_name]} of {max_retries} "
+                                f"in {delay:.0f} s: {result['error']}")
+                journal.finish_attempt(result, retry_delay=delay)
+                heapq.heappush(waiting, (time.monotonic() + delay, next(order), repository))
+            else:
+                journal.finish_attempt(result)
+
+    return [results[repository["owner"] + "/" + repository["repo"]] for repository in repositories
+            if repository["owner"] + "/" + repository["repo"] in results], n_skipped
@@ -10,8 +10,10 @@
 ##########
 # Import libraries
 ##########
-import networkx as nx
-import seaborn as sns
+from lazy_imports import lazy_import
+from colours import hls_palette
+
+nx = lazy_import("networkx")
 
 def build_commit_history(known_commits, commit_history):
 
@@ -34,14 +36,42 @@ def build_commit_history(known_commits, commit_history):
         parameter.
     """
     
-    # ------------------------------------------------------------
-    # first pass: add all nodes
+    builder = CommitHistoryBuilder(commit_history)
     for commit in known_commits:
+        builder.add(commit)
+    builder.finish()
+
+class CommitHistoryBuilder:
+    """
+    Builds a commit history one commit at a time, so commits can be passed on as they are fetched
+    instead of being collected in a list first (see the streaming mode of `start.py`).
+
+    `add()` performs the first two passes of `build_commit_history()` for one commit: links to parents
+    which are not known yet are kept aside until the parent is added. Once all commits are added,
+    `finish()` identifies the branches and colourizes the history.
+
+    Parameters
+    ==========
+
+    `commit_history` : networkx DiGraph, required, output of this builder, empty container for the commit history
+    """
 
-        # add the current node to the network
-        commit_history.add_node(commit['commit'][:7],
+    def __init__(self, commit_history):
+        self.commit_history = commit_history
+        self._pending_links = dict() # short SHA of a parent not known yet -> short SHAs of its children
+
+    def add(self, commit):
+        """
+        Adds a commit (perceval format) to the history and links it with its known parents.
+        """
+        commit_history = self.commit_history
+        short_sha = commit['commit'][:7]
+
+        # ------------------------------------------------------------
+        # first pass: add the node
+        commit_history.add_node(short_sha,
                    commit=commit['commit'],
-                   shortSha=commit['commit'][:7],
+                   shortSha=short_sha,
                    Author=commit['Author'],
                    AuthorDate=commit['AuthorDate'],
                    Commit=commit['Commit'],
@@ -49,33 +79,73 @@ def build_commit_history(known_commits, commit_history):
                    message=commit['message'],
                    refs=commit['refs'],
                    parents=commit['parents']
-                   )    
-        
-    # ------------------------------------------------------------
-    # second pass: create links
-    for commit in known_commits:
- 
+                   )
+
+        # ------------------------------------------------------------
+        # second pass: create links
         # link the commit with their parents
         for parent_sha in commit['parents']:
-
             # if the parent is a known node (so we prevent to consider parents that are outside the considered time window)
             if parent_sha[:7] in commit_history.nodes:
-                commit_history.add_edge(parent_sha[:7], commit['commit'][:7])
+                commit_history.add_edge(parent_sha[:7], short_sha)
+            else:
+                # the parent may still come later
+                self._pending_links.setdefault(parent_sha[:7], list()).append(short_sha)
+
+        # link the commit with the children added before it
+        for child_sha in self._pending_links.pop(short_sha, list()):
+            commit_history.add_edge(short_sha, child_sha)
+
+    def finish(self):
+        """
+        Identifies which commit belongs to which branch and colourizes the history, once all commits are added.
+        Returns the commit history.
+        """
+        # parents which were never added are outside the considered commits
+        self._pending_links = dict()
+        label_branches(self.commit_history)
+        return self.commit_history
+
+##########
+# identifies which commit belongs to which branch and colourizes the commit history
+##########
+
+# colour of the commits which can't be associated with a branch (e.g. only reachable from a tag)
+UNKNOWN_BRANCH_COLOUR = '#808080'
+
+def label_branches(commit_history):
+    """
+    Sets the attributes 'branch' (name of the branch ref) and 'colour' (one colour per branch) of the commits
+    of a commit history, and the colour of the links from each commit to its children.
+
+    Each branch head (commit with a 'refs/heads/' ref) gets the name of its branch, which is then propagated
+    to its ancestors, until another branch head or an already labelled commit is reached. Branch heads are
+    processed in the order of the nodes, so a commit reachable from several branches gets the first one.
+    Each commit is labelled, and the parents of each labelled commit are checked, at most once:
+    the labelling takes linear time in the number of commits and links.
+
+    Parameters
+    ==========
+
+    `commit_history` : networkx DiGraph, required, built by `build_commit_history()`, modified in place
+    """
+    # attributes of each node, looked up directly rather than through the (slower) networkx node view
+    nodes = dict(commit_history.nodes(data=True))
 
     # ------------------------------------------------------------
     # third pass: identify which commit belongs to which branch
  
-    # each git branch reference commit (those where the variable 'refs' is not empty)
-    branch_heads = [x for x in commit_history.nodes() if len(commit_history.nodes[x]['refs'])!=0]
-
     # container to store all found branch names (needed for colourizing later)
     branch_names = list()
+    # index of the first occurrence of each branch name in `branch_names`, i.e. of its colour
+    branch_colour_index = dict()
 
-    for branch_head in branch_heads:
+    # each git branch reference commit (those where the variable 'refs' is not empty)
+    for branch_head in [x for x in nodes if len(nodes[x]['refs'])!=0]:
 
         # fetch the contents of the 'refs' variable containing the branch name(s)
-        refs = commit_history.nodes[branch_head]['refs']
-        parents = commit_history.nodes[branch_head]['parents']
+        refs = nodes[branch_head]['refs']
+        parents = nodes[branch_head]['parents']
 
         # there must be the same number of parents and branch refs so we can tell which branch name to associate with which parent commit 
         if len(refs)!=len(parents):
@@ -91,54 +161,75 @@ def build_commit_history(known_commits, commit_history):
             if 'refs/heads/' in refs[i]:
                 
                 # we add the branch to our list of known branch names (needed for colourizing later)
+                branch_colour_index.setdefault(refs[i], len(branch_names))
                 branch_names.append(refs[i])
 
-                commit_history.nodes[branch_head]['branch'] = refs[i]
+                nodes[branch_head]['branch'] = refs[i]
+
+                # there can be more branch refs than parents (e.g. several branches pointing to the same commit),
+                # then the extra branches have no parent to propagate to
+                if i >= len(parents):
+                    continue
                 
                 # we only check known parents (those outside the considered time window)
-                if parents[i][:7] in commit_history.nodes:
+                if parents[i][:7] in nodes:
                     # if the parent is a branch head, we stop here
-                    if len(commit_history.nodes[parents[i][:7]]['refs']) == 0:
+                    if len(nodes[parents[i][:7]]['refs']) == 0:
                         # if branch info has already been added to the parent, we stop here as well
-                        if not 'branch' in commit_history.nodes[parents[i][:7]]:
-                            propagate_branch_name(commit_history, parents[i][:7], refs[i])
+                        if not 'branch' in nodes[parents[i][:7]]:
+                            propagate_branch_name(nodes, parents[i][:7], refs[i])
 
     # ------------------------------------------------------------
     # fourth pass: colorize
 
     # define as many colours as branches
-    palette = sns.color_palette("hls", len(branch_names)) # returns a rgb tuple normalzed in [0,1]
-    palette_html = list()
-    for colour_tuple in palette: # convert the palette to HTML format
-        html_colour_code = '#'
-        for colour_code in colour_tuple:
-            html_colour_code = html_colour_code + '%02x' % int(round(colour_code*256))
-        palette_html.append(html_colour_code) 
+    palette_html = hls_palette(len(branch_names)) # in HTML format
 
-    for commit in commit_history.nodes():
+    for commit, children in commit_history.adjacency(): # each commit, with the attributes of the links to its children
 
         # fetch a colour
-        colour = palette_html[branch_names.index(commit_history.nodes[commit]['branch'])]
+        if 'branch' in nodes[commit]:
+            colour = palette_html[branch_colour_index[nodes[commit]['branch']]]
+        else:
+            colour = UNKNOWN_BRANCH_COLOUR
 
         # set node colour based commit's branch index
-        commit_history.nodes[commit]['colour'] = colour
+        nodes[commit]['colour'] = colour
 
         # set outward edges colour based commit's branch index
-        for neighbour in commit_history[commit]: # 'commit_history[commit]' returns a subgraph of 'commit_history' with neighbours of 'commit'
-            commit_history.edges[commit, neighbour]['colour'] = colour
+        for edge_attributes in children.values():
+            edge_attributes['colour'] = colour
 
 ##########
 # finds out which commit belongs to which branch
 ##########
 
-def propagate_branch_name(commit_history, commit, branch):
-    commit_history.nodes[commit]['branch'] = branch
-    for parent_sha in commit_history.nodes[commit]['parents']:
-        # we only check known parents (those outside the considered time window)
-        if parent_sha[:7] in commit_history.nodes:
-            # if the parent is a branch head, we stop here
-            if not 'refs/heads/' in ''.join(commit_history.nodes[parent_sha[:7]]['refs']):
-                # if branch info has already been added to the parent, we stop here as well
-                if not 'branch' in commit_history.nodes[parent_sha[:7]]:
-                    propagate_branch_name(commit_history, parent_sha[:7], branch)
+def propagate_branch_name(nodes, commit, branch):
+    """
+    Labels `commit` with `branch`, as well as all its ancestors reachable without going through a branch head
+    or an already labelled commit.
+
+    The ancestors are walked with an explicit stack rather than recursively, so long linear histories
+    don't exceed the recursion limit of Python. All commits reached get the same label, so the order
+    in which they are visited does not change the result.
 
+    Parameters
+    ==========
+
+    `nodes` : dict, required, attributes of each node of the commit history (short SHA -> dict)
+    `commit` : str, required, short SHA of the first commit to label
+    `branch` : str, required, name of the branch ref
+    """
+    nodes[commit]['branch'] = branch
+    stack = [commit]
+    while len(stack) > 0:
+        for parent_sha in nodes[stack.pop()]['parents']:
+            parent = parent_sha[:7]
+            # we only check known parents (those outside the considered time window)
+            if parent in nodes:
+                # if the parent is a branch head, we stop here
+                if not 'refs/heads/' in ''.join(nodes[parent]['refs']):
+                    # if branch info has already been added to the parent, we stop here as well
+                    if not 'branch' in nodes[parent]:
+                        nodes[parent]['branch'] = branch
+                        stack.append(parent)
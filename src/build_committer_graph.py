@@ -11,11 +11,16 @@
 # Import libraries
 ##########
 import json
-import networkx as nx
-import seaborn as sns
+from itertools import chain
 from collections import Counter
 
-def build_committer_graph(file_change_history, committer_graph):
+from lazy_imports import lazy_import
+from export_writers import ExportFile, iter_node_link_JSON
+
+np = lazy_import("numpy")
+nx = lazy_import("networkx")
+
+def build_committer_graph(file_change_history, committer_graph, symmetric=False):
 
     
     """
@@ -27,6 +32,8 @@ def build_committer_graph(file_change_history, committer_graph):
 
     `file_change_history` : networkx DiGraph, required, input of this function, generated in "build_file_change_history.py"
     `committer_graph` : networkx DGraph, required, output of this function, empty container for the committer graph
+    `symmetric` : bool, optional, count the interactions between two authors regardless of their order
+        (`committer_graph` should then be an undirected networkx Graph)
  
     Raises
     ======
@@ -36,64 +43,223 @@ def build_committer_graph(file_change_history, committer_graph):
         parameter.
     """
 
-    # step 1: generate nodes in the graph. Nodes are authors
-    ######################################################################################
-    # TODO: for now we rely on "Author" for identifying the authorship of the file changes
-    # We need to check what would be the impact of using "Committer" instead.
+    # the interactions are aggregated at once, then all nodes and edges are added in bulk
+    CommitterMatrix.from_file_change_history(file_change_history, symmetric=symmetric).to_networkx(committer_graph)
 
-    # get list with all authors
-    # casting the list of authors as a set removes all duplicates
-    authors = list(set([file_change_history.nodes[nodeID]['Author'] for nodeID in file_change_history.nodes()]))
-    
-    # get the number of times each author made a file change event
-    filechanges = Counter(list(([file_change_history.nodes[nodeID]['Author'] for nodeID in file_change_history.nodes()])))
-
-    for author in authors:
-        committer_graph.add_node(
-            author,
-            weight = filechanges[author])
-
-
-    # step 2: generate edges. Edges are common interactions between authors
-    ######################################################################################
-    # Parse all edges in the file change graph. 
-    # Edges link together to subsequent file change events on a same file. 
-    # If the committers of the file change events are different, we record an interaction between the committers
-    for edge in file_change_history.edges:
-        
-        # networkx edges are two-element lists storing the ids of both linked nodes
-        # edge[0] is the "from"/parent
-        # edge[0] is the "to"/child
-        # to retrieve the data associated with the node "from", we need to use graph.nodes[edge[0]]
-        parent_node = file_change_history.nodes[edge[0]]
-        child_node = file_change_history.nodes[edge[1]]
-
-        # if the file changes represented by the parent and the child nodes have ben authored by different authors
+##########
+# aggregated committer graph
+##########
+
+COMMITTER_MATRIX_VERSION = 1
+
+class CommitterMatrix:
+    """
+    Committer graph as a sparse matrix in coordinate (COO) format: authors are integer ids,
+    and the interactions between authors are three parallel arrays (parent author, child author, weight).
+
+    `from_file_change_history()` aggregates the interactions of a file change history with array operations
+    (one pass over the history, then one sort of the pairs of author ids), instead of one counter update per file change.
+
+    Parameters
+    ==========
+
+    `authors` : list of str, authors in order of first appearance (author id -> author)
+    `file_changes` : numpy array of int64, number of file changes of each author
+    `sources` : numpy array of int64, parent author of each interaction
+    `targets` : numpy array of int64, child author of each interaction
+    `weights` : numpy array of int64, number of each interaction
+    `symmetric` : bool, True if the interactions between two authors are counted regardless of their order,
+        in which case each pair of authors appears once, with `sources` < `targets`
+    """
+
+    def __init__(self, authors, file_changes, sources, targets, weights, symmetric=False):
+        self.authors = authors
+        self.file_changes = file_changes
+        self.sources = sources
+        self.targets = targets
+        self.weights = weights
+        self.symmetric = symmetric
+
+    @classmethod
+    def from_pairs(cls, authors, file_changes, parents, children, symmetric=False):
+        """
+        Aggregates the interactions between authors given as arrays of author ids, one (parent, child) pair per
+        file change edge. Interactions of an author with themself are left out.
+        The interactions are listed in order of first appearance, as with `CommitterGraphBuilder`.
+        """
+        different = parents != children
+        parents, children = parents[different], children[different]
+        if symmetric:
+            parents, children = np.minimum(parents, children), np.maximum(parents, children)
+        n_authors = max(len(authors), 1)
+        pairs, first_positions, weights = np.unique(parents * n_authors + children, return_index=True, return_counts=True)
+        order = np.argsort(first_positions, kind='stable')
+        pairs, weights = pairs[order], weights[order].astype(np.int64)
+        return cls(authors, file_changes, pairs // n_authors, pairs % n_authors, weights, symmetric)
+
+    @classmethod
+    def from_file_change_history(cls, file_change_history, symmetric=False):
+        """
+        Aggregates the committer graph of a file change history (see `build_file_change_history.py`).
+        """
+        # TODO: for now we rely on "Author" for identifying the authorship of the file changes
+        # We need to check what would be the impact of using "Committer" instead.
+        author_ids = dict() # author -> id, in order of first appearance
+        node_authors = dict() # node -> author id
+        for node, author in file_change_history.nodes(data='Author'):
+            node_authors[node] = author_ids.setdefault(author, len(author_ids))
+        file_changes = np.bincount(np.fromiter(node_authors.values(), dtype=np.int64, count=len(node_authors)),
+                                   minlength=len(author_ids)).astype(np.int64)
+
+        # edges link together two subsequent changes of a same file: (parent author, child author) for each edge
+        n_edges = file_change_history.number_of_edges()
+        pairs = np.fromiter(chain.from_iterable((node_authors[parent], node_authors[child]) for parent, child in file_change_history.edges()),
+                            dtype=np.int64, count=2 * n_edges).reshape(n_edges, 2)
+        return cls.from_pairs(list(author_ids), file_changes, pairs[:, 0], pairs[:, 1], symmetric)
+
+    def __len__(self):
+        return len(self.authors)
+
+    def number_of_interactions(self):
+        return len(self.weights)
+
+    def to_networkx(self, committer_graph=None):
+        """
+        Adds the authors (nodes, weighted by their number of file changes) and their interactions (edges,
+        weighted by their number) to a networkx graph, in bulk.
+
+        Parameters
+        ==========
+
+        `committer_graph` : networkx graph, optional, empty container for the committer graph (by default
+            a MultiDiGraph, or a Graph if the weights are symmetric)
+
+        Returns
+        =======
+
+        networkx graph: `committer_graph`
+        """
+        if committer_graph is None:
+            committer_graph = nx.Graph() if self.symmetric else nx.MultiDiGraph()
+        authors = self.authors
+        committer_graph.add_nodes_from((author, {'weight': weight}) for author, weight in zip(authors, self.file_changes.tolist()))
+        committer_graph.add_edges_from(
+            (authors[source], authors[target], {'weight': weight})
+            for source, target, weight in zip(self.sources.tolist(), self.targets.tolist(), self.weights.tolist()))
+        return committer_graph
+
+    def save(self, file_path):
+        """
+        Saves the matrix to a NumPy archive (.npz).
+
+        Returns
+        =======
+
+        int: number of bytes written
+        """
+        meta = {
+            'format': 'committer_matrix',
+            'version': COMMITTER_MATRIX_VERSION,
+            'authors': self.authors,
+            'symmetric': self.symmetric
+        }
+        with open(file_path, 'wb') as f:
+            np.savez_compressed(f,
+                meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+                file_changes=self.file_changes, sources=self.sources, targets=self.targets, weights=self.weights)
+            return f.tell()
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Loads a matrix saved by `save()`.
+        """
+        with np.load(file_path) as archive:
+            meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+            if meta.get('format') != 'committer_matrix' or meta.get('version') != COMMITTER_MATRIX_VERSION:
+                raise ValueError(f"{file_path} is not a committer matrix (version {COMMITTER_MATRIX_VERSION})")
+            return cls(meta['authors'], archive['file_changes'], archive['sources'], archive['targets'], archive['weights'],
+                       symmetric=meta['symmetric'])
+
+class CommitterGraphBuilder:
+    """
+    Builds a committer graph from file changes and interactions passed on one at a time,
+    e.g. by `FileChangeHistoryBuilder.finish()` (see `build_file_change_history.py`).
+
+    Only counters are kept until `finish()` adds the nodes and edges to the graph.
+
+    Parameters
+    ==========
+
+    `committer_graph` : networkx MultiDiGraph, required, output of this builder, empty container for the committer graph
+    `symmetric` : bool, optional, count the interactions between two authors regardless of their order
+        (`committer_graph` should then be an undirected networkx Graph)
+    """
+
+    def __init__(self, committer_graph, symmetric=False):
+        self.committer_graph = committer_graph
+        self.symmetric = symmetric
+        self._filechanges = Counter() # author -> number of file change events
+        self._interactions = Counter() # (parent author, child author) -> number of interactions
+
+    def add_file_change(self, author):
+        """
+        Records a file change event made by `author`.
+        """
+        self._filechanges[author] += 1
+
+    def add_interaction(self, parent_author, child_author):
+        """
+        Records two subsequent changes of a same file by `parent_author`, then by `child_author`.
+        """
+        # if the file changes have ben authored by different authors
         # then we add this interaction in the committer graph
-        if parent_node["Author"] != child_node["Author"]:
-            if committer_graph.get_edge_data(parent_node["Author"], child_node["Author"]) == None:
-                # if there isn't any recorded interaction yet (get_edge_data returns None), we add an edge and initialise the weight to 1
-                committer_graph.add_edge(parent_node["Author"], child_node["Author"], weight = 1)
+        if parent_author != child_author:
+            if self.symmetric and (child_author, parent_author) in self._interactions:
+                self._interactions[(child_author, parent_author)] += 1
             else:
-                # if is already a recorded interaction, we increment the recorded weight
-                # there is a recorded interaction if get_edge_data returns {0 {'weight': <weight>}}
-                # the {0 ...} is because we use a MulitDiGraph, so get_edge_data returns a dict of links instead of one link
-                committer_graph[parent_node["Author"]][child_node["Author"]][0]['weight'] = \
-                    committer_graph[parent_node["Author"]][child_node["Author"]][0]['weight'] + 1
+                self._interactions[(parent_author, child_author)] += 1
+
+    def finish(self):
+        """
+        Adds the authors (nodes) and their interactions (edges) to the committer graph.
+        """
+        # step 1: generate nodes in the graph. Nodes are authors, weighted by their number of file change events
+        for author, weight in self._filechanges.items():
+            self.committer_graph.add_node(
+                author,
+                weight = weight)
+
+        # step 2: generate edges. Edges are common interactions between authors, weighted by their number
+        # the graph is a MultiDiGraph, but there is only one edge (key 0) between two authors
+        for (parent_author, child_author), weight in self._interactions.items():
+            self.committer_graph.add_edge(parent_author, child_author, weight = weight)
 
 def export_committer_graph(committer_graph, file_path):
+    """
+    Writes the committer graph into the vis.js template, one node or link at a time (see `export_writers.py`).
+
+    Parameters
+    ==========
+
+    `committer_graph` : networkx MultiDiGraph, required, generated by `build_committer_graph()`
+    `file_path` : str, required, path of the HTML file
+
+    Returns
+    =======
+
+    int: number of bytes written
+    """
     
     # load the visjs template into a string
     with open('visjs_template.html', 'r') as f:
         html_string = f.read()
     
-    # generate a string with js code including networkx data to concatenate with the visjs template
-    js_string = []
-    js_string.append("<script type='text/javascript'>\r\n")
-    js_string.append("imported_data = ")
-    js_string.append(json.dumps(nx.node_link_data(committer_graph), sort_keys=True, indent=4))
-    js_string.append("\r\n</script>\r\n")
-
-    with open(file_path, 'w') as f:
-       f.write(''.join(js_string) + html_string)
-    del f
\ No newline at end of file
+    # write js code including networkx data, followed by the visjs template
+    with ExportFile(file_path) as f:
+        f.write("<script type='text/javascript'>\r\n")
+        f.write("imported_data = ")
+        f.writelines(iter_node_link_JSON(committer_graph))
+        f.write("\r\n</script>\r\n")
+        f.write(html_string)
+    return f.bytes_written
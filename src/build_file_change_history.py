@@ -12,12 +12,35 @@
 # Import libraries
 ##########
 import logging
-import networkx as nx
-import seaborn as sns
-from collections import defaultdict
-import time
+from array import array
+from collections import Counter, defaultdict
 
-def build_file_change_history(known_commits, file_change_history):
+from lazy_imports import lazy_import
+from colours import hls_palette
+from timestamps import CommitDates, parse_git_date
+
+np = lazy_import("numpy")
+nx = lazy_import("networkx")
+
+# information on each file change, reported as missing if perceval does not give it
+FILE_CHANGE_DETAILS = ['added', 'removed', 'action']
+# line counts of each file change, left out on purpose by partial clones with `--line_stats none` or `--line_stats_exclude`
+LINE_STATS_DETAILS = ['added', 'removed']
+
+def report_missing(missing, line_stats_left_out=False):
+    """
+    Logs one warning per kind of missing information counted in `missing` (see `bulk_build_file_change_history()`).
+    If `line_stats_left_out`, the missing line counts are expected and only logged at debug level.
+    """
+    for key, count in missing.items():
+        if key == 'files':
+            logging.warning(f"{count} commits have no attribute 'files'.")
+        elif line_stats_left_out and key in LINE_STATS_DETAILS:
+            logging.debug(f"{count} file changes have no line counts (key '{key}'), left out on purpose")
+        else:
+            logging.warning(f"{count} file changes have no file edition information (key '{key}')")
+
+def build_file_change_history(known_commits, file_change_history, line_stats_left_out=False, dates=None):
 
     
     """
@@ -29,7 +52,14 @@ def build_file_change_history(known_commits, file_change_history):
 
     `known_commits` : list of dicts, required, input of this function, commit data generated by perceval in the function get_commit.py
     `file_change_history` : networkx DiGraph, required, output of this function, empty container for the file change history 
+    `line_stats_left_out` : bool, optional, see `report_missing()`
+    `dates` : CommitDates, optional, dates of the commits if already parsed (see `timestamps.CommitDates`)
  
+    Returns
+    =======
+
+    collections.Counter: missing information, as returned by `bulk_build_file_change_history()`
+
     Raises
     ======
 
@@ -38,11 +68,64 @@ def build_file_change_history(known_commits, file_change_history):
         parameter.
     """
 
-    # store each filechange in each commit as a node in the graph
-    for commit in known_commits:
+    # the dates of all commits are parsed at once
+    if dates is None:
+        dates = CommitDates.from_commits(known_commits)
+
+    builder = FileChangeHistoryBuilder(file_change_history, line_stats_left_out=line_stats_left_out)
+    for commit, author_date in zip(known_commits, dates.author_dates.tolist()):
+        builder.add(commit, author_date)
+    return builder.finish()
+
+class FileChangeHistoryBuilder:
+    """
+    Builds a history of file changes one commit at a time, so commits can be passed on as they are fetched
+    instead of being collected in a list first (see the streaming mode of `start.py`).
+
+    `add()` stores the file changes of a commit as nodes, together with the sequence of changes of each file.
+    Once all commits are added, `finish()` connects and colourizes the changes of each file, and can pass
+    them on to a `CommitterGraphBuilder` (see `build_committer_graph.py`) at the same time.
+    Missing information is counted by `add()` and reported by `finish()` in one warning per kind,
+    as by `bulk_build_file_change_history()`.
+
+    Parameters
+    ==========
+
+    `file_change_history` : networkx DiGraph, required, output of this builder, empty container for the file change history
+    `line_stats_left_out` : bool, optional, see `report_missing()`
+    """
+
+    def __init__(self, file_change_history, line_stats_left_out=False):
+        self.file_change_history = file_change_history
+        self.line_stats_left_out = line_stats_left_out
+        # Partition the unstuctured list of file changes.
+        # The result is a dictionary of lists where keys are commited filenames and values (timestamp, node id) pairs
+        self._partitionned_filechanges = defaultdict(list)
+        self.missing = Counter()
+
+    def add(self, commit, author_date=None):
+        """
+        Adds the file changes of a commit (perceval format) as nodes of the history.
+
+        Parameters
+        ==========
+
+        `commit` : dict, required, commit data (perceval format)
+        `author_date` : int, optional, `AuthorDate` of the commit in seconds since epoch, if already parsed
+            (see `timestamps.CommitDates`)
+        """
+        file_change_history = self.file_change_history
+
+        # store each filechange in each commit as a node in the graph
         if 'files' in commit:
+            # the file changes are sorted per timestamp
+            # TODO: for now we rely on AuthorDate for sorting the file change events. We need to check what would be the impact of using CommitDate instead.
+            if author_date is None:
+                author_date = parse_git_date(commit['AuthorDate'])[0] # example: Mon Mar 26 16:04:21 2018 +0100
             for filechange in commit['files']:
                 node_id = filechange["file"] + "_" + commit["commit"] # unique node identifier
+                if node_id not in file_change_history.nodes:
+                    self._partitionned_filechanges[filechange["file"]].append((author_date, node_id))
                 file_change_history.add_node(
                     node_id, # unique node identifier
                     unique_id = node_id, 
@@ -57,58 +140,152 @@ def build_file_change_history(known_commits, file_change_history):
                 #       As a consequence, I need to store the unique id as an attribute. That is a bit ugly and redundant...
                 # TODO: Find a way to retrieve the ID of a networkx node.
 
-                if "added" in filechange:
-                    file_change_history.nodes[node_id]["added"] = filechange["added"]
-                else:
-                    print(f"Warning: missing file edition information (key 'added') for file {filechange['file']} in commit {commit['commit']}")
-                if "removed" in filechange:
-                    file_change_history.nodes[node_id]["removed"] = filechange["removed"]
-                else:
-                    print(f"Warning: missing file edition information (key 'removed') for file {filechange['file']} in commit {commit['commit']}")
-                if "action" in filechange:
-                     file_change_history.nodes[node_id]["action"] = filechange["action"]
-                else:
-                    print(f"Warning: missing file edition information (key 'action') for file {filechange['file']} in commit {commit['commit']}")
+                for key in FILE_CHANGE_DETAILS:
+                    if key in filechange:
+                        file_change_history.nodes[node_id][key] = filechange[key]
+                    else:
+                        self.missing[key] += 1
         else:
-            logging.warning("warning: commit " + commit['commit'] + " has no attribute 'files'.")
+            self.missing['files'] += 1
             # TODO: investigate why some commits have no attribute 'file'      
- 
-    
-    # Partition the unstuctured list of file changes.
-    # Phe result is a dictionary of lists where keys are commited filenames
-    # We use collections.defaultdict so we can use dict[key].append() even if key does not exist (a normal dict would throw a KeyError)
-    partitionned_filechanges = defaultdict(list)
-    for filechange_id in file_change_history.nodes:
-        partitionned_filechanges[file_change_history.nodes[filechange_id]['file']].append(file_change_history.nodes[filechange_id])
 
+    def finish(self, committer_graph_builder=None):
+        """
+        Connects the changes of each file in sequences and colourizes them, once all commits are added.
+
+        Parameters
+        ==========
+
+        `committer_graph_builder` : CommitterGraphBuilder, optional, receives the file changes and the
+            interactions between their authors, so the committer graph is built without another pass over the history
+
+        Returns
+        =======
+
+        collections.Counter: missing information, as returned by `bulk_build_file_change_history()`
+        """
+        report_missing(self.missing, self.line_stats_left_out)
+        file_change_history = self.file_change_history
+        partitionned_filechanges = self._partitionned_filechanges
+
+        # colouring: define one colour for each unique filename
+        # TODO: the following snippet is a duplicate from "build_commit_history.py". Consider making a function out of it.
+        palette_html = hls_palette(len(partitionned_filechanges.keys())) # in HTML format
+
+        # connect nodes in sequences of file changes and apply colouring
+        for i, sublist in enumerate(list(partitionned_filechanges.values())):
+            
+            # sort the list per timestamp
+            sublist.sort(key=lambda x:x[0])
+            
+            # connect the nodes two by two in the sorted sequence
+            for j in range(1,len(sublist)):
+                file_change_history.add_edge(
+                    sublist[j-1][1],
+                    sublist[j][1],
+                    colour = palette_html[i]
+                )
+
+            # apply colouring to nodes
+            for timestamp, node_id in sublist:
+                file_change_history.nodes[node_id]['colour'] = palette_html[i]
+
+            if committer_graph_builder is not None:
+                for j in range(len(sublist)):
+                    committer_graph_builder.add_file_change(file_change_history.nodes[sublist[j][1]]['Author'])
+                    if j > 0:
+                        committer_graph_builder.add_interaction(
+                            file_change_history.nodes[sublist[j-1][1]]['Author'],
+                            file_change_history.nodes[sublist[j][1]]['Author'])
+        self._partitionned_filechanges = defaultdict(list)
+        missing, self.missing = self.missing, Counter()
+        return missing
+
+##########
+# bulk construction of the file change history
+##########
+
+def bulk_build_file_change_history(known_commits, file_change_history, line_stats_left_out=False, dates=None):
+    """
+    Builds the same file change history as `build_file_change_history()`, in bulk:
+    the file changes are first extracted into arrays (file, commit date), the sequence of changes of every file
+    is derived from a single sort on (file, date), and nodes and edges are then inserted all at once.
+
+    Missing information (commits without attribute 'files', file changes without 'added', 'removed' or 'action')
+    is counted and reported in one warning per kind instead of one message per file change.
+
+    Parameters
+    ==========
+
+    `known_commits` : list of dicts, required, input of this function, commit data generated by perceval in the function get_commit.py
+    `file_change_history` : networkx DiGraph, required, output of this function, empty container for the file change history 
+    `line_stats_left_out` : bool, optional, see `report_missing()`
+    `dates` : CommitDates, optional, dates of the commits if already parsed (see `timestamps.CommitDates`)
+
+    Returns
+    =======
+
+    collections.Counter: number of commits without 'files' (key "files") and of file changes without 'added', 'removed' or 'action'
+    """
+    missing = Counter()
+
+    # the dates of all commits are parsed at once
+    if dates is None:
+        dates = CommitDates.from_commits(known_commits)
+    author_dates = dates.author_dates
+
+    # attributes of each file change, in order of first appearance
+    filechanges = dict()
+    file_ids = dict() # file name -> id, in order of first appearance
+    node_files = array('q') # file id of each file change
+    node_commits = array('q') # row of the commit of each file change in `known_commits`
+
+    for row, commit in enumerate(known_commits):
+        if 'files' not in commit:
+            missing['files'] += 1
+            continue
+        for filechange in commit['files']:
+            node_id = filechange["file"] + "_" + commit["commit"] # unique node identifier
+            attributes = {
+                'unique_id': node_id,
+                'file': filechange["file"],
+                'Author': commit["Author"],
+                'Committer': commit["Commit"],
+                'AuthorDate': commit["AuthorDate"],
+                'CommitDate': commit["CommitDate"],
+                'commit': commit["commit"]
+            }
+            for key in FILE_CHANGE_DETAILS:
+                if key in filechange:
+                    attributes[key] = filechange[key]
+                else:
+                    missing[key] += 1
+            if node_id in filechanges:
+                # same file listed twice in a commit: the last listing wins, as with networkx.add_node()
+                filechanges[node_id].update(attributes)
+            else:
+                filechanges[node_id] = attributes
+                node_files.append(file_ids.setdefault(filechange["file"], len(file_ids)))
+                node_commits.append(row)
+
+    report_missing(missing, line_stats_left_out)
 
     # colouring: define one colour for each unique filename
-    # TODO: the following snippet is a duplicate from "build_commit_history.py". Consider making a function out of it.
-    palette = sns.color_palette("hls", len(partitionned_filechanges.keys())) # returns a rgb tuple normalzed in [0,1]
-    palette_html = list()
-    for colour_tuple in palette: # convert the palette to HTML format
-        html_colour_code = '#'
-        for colour_code in colour_tuple:
-            html_colour_code = html_colour_code + '%02x' % int(round(colour_code*256))
-        palette_html.append(html_colour_code) 
-
-    # connect nodes in sequences of file changes and apply colouring
-    for i, sublist in enumerate(list(partitionned_filechanges.values())):
-        
-        # sort the list per timestamp
-        sublist.sort(key=lambda x:time.mktime(time.strptime(x['AuthorDate'], '%a %b %d %H:%M:%S %Y %z'))) # example: Mon Mar 26 16:04:21 2018 +0100
-        # TODO: for now we rely on AuthorDate for sorting the file change events. We need to check what would be the impact of using CommitDate instead.
-        
-        # connect the nodes two by two in the sorted sequence
-        for j in range(1,len(sublist)):
-            file_change_history.add_edge(
-                sublist[j-1]['unique_id'],
-                sublist[j]['unique_id'],
-                colour = palette_html[i]
-            )
-
-        # apply colouring to nodes
-        for node in sublist:
-            node['colour'] = palette_html[i]
+    palette_html = hls_palette(len(file_ids)) # in HTML format
+    for attributes, file_id in zip(filechanges.values(), node_files):
+        attributes['colour'] = palette_html[file_id]
 
+    # sort the file changes per file, then per timestamp (the sort is stable: file changes at the same time stay in order)
+    files = np.frombuffer(node_files, dtype=np.int64) if len(node_files) > 0 else np.zeros(0, dtype=np.int64)
+    rows = np.frombuffer(node_commits, dtype=np.int64) if len(node_commits) > 0 else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((author_dates[rows], files))
+    # connect the nodes two by two in the sorted sequence of each file
+    same_file = files[order[1:]] == files[order[:-1]]
+    sources, targets = order[:-1][same_file], order[1:][same_file]
 
+    node_ids = list(filechanges)
+    file_change_history.add_nodes_from(filechanges.items())
+    file_change_history.add_edges_from(
+        (node_ids[source], node_ids[target], {'colour': palette_html[file_id]})
+        for source, target, file_id in zip(sources.tolist(), targets.tolist(), files[sources].tolist()))
+    return missing
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# colour palettes of the graphs (branches of the commit history, files of the file change history)
+##########
+
+##########
+# Import libraries
+##########
+import colorsys
+
+def hls_palette(n_colours, hue=.01, lightness=.6, saturation=.65):
+    """
+    Returns `n_colours` colours evenly spaced in hue, in HTML format ("#rrggbb").
+
+    The colours are the same as those of `seaborn.color_palette("hls", n_colours)` (with the HTML conversion
+    used so far), without importing seaborn and matplotlib.
+
+    Parameters
+    ==========
+
+    `n_colours` : int, required
+    `hue` : float, optional, hue of the first colour, in [0, 1]
+    `lightness` : float, optional, in [0, 1]
+    `saturation` : float, optional, in [0, 1]
+
+    Returns
+    =======
+
+    list of str
+    """
+    palette_html = list()
+    for i in range(n_colours):
+        colour_hue = (i * (1 / n_colours) + hue) % 1
+        colour_tuple = colorsys.hls_to_rgb(colour_hue, lightness, saturation) # rgb tuple normalzed in [0,1]
+        palette_html.append('#' + ''.join('%02x' % int(round(colour_code*256)) for colour_code in colour_tuple))
+    return palette_html
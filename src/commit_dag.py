@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# compact commit history: commits are integer ids, links between commits are stored in
+# compressed sparse row (CSR) arrays and commit attributes in arrays parallel to the ids
+# a few bytes per commit instead of a networkx node with its attribute dict, and much faster traversals
+##########
+
+##########
+# Import libraries
+##########
+import json
+from array import array
+
+from lazy_imports import lazy_import
+from timestamps import CommitDates, parse_commit_dates, format_git_date
+from build_commit_history import CommitHistoryBuilder
+
+np = lazy_import("numpy")
+nx = lazy_import("networkx")
+
+FORMAT_VERSION = 1
+
+##########
+# Build a commit DAG
+##########
+
+class CommitDAGBuilder:
+    """
+    Builds a `CommitDAG` one commit at a time, like `CommitHistoryBuilder` builds a networkx commit history
+    (see `build_commit_history.py`), e.g. from the commits passed on by the streaming mode of `start.py`.
+
+    SHAs are interned to integer ids as they are seen, as commits or as parents of commits.
+    `finish()` renumbers them, so the commits get ids 0 to n-1 in the order they were added,
+    and the parents which are not part of the history (e.g. outside the considered time window) get ids from n on.
+    """
+
+    def __init__(self):
+        self._ids = dict() # SHA -> temporary id, in order of appearance
+        self._commit_ids = array('q') # temporary id of each commit, in order of addition
+        self._parents = array('q')
+        self._parents_offsets = array('q', [0])
+        self._identities = dict()
+        self._authors = array('i')
+        self._committers = array('i')
+        self._author_dates = array('q')
+        self._author_tzs = array('h')
+        self._commit_dates = array('q')
+        self._commit_tzs = array('h')
+        self._messages = list()
+        self._refs = dict() # row -> refs, only for commits with refs
+        self._is_commit = set() # temporary ids of the commits
+
+    def _intern(self, sha):
+        return self._ids.setdefault(sha, len(self._ids))
+
+    def add(self, commit, dates=None):
+        """
+        Adds a commit (perceval format) to the DAG. Commits already added are ignored.
+        `dates` are the dates of the commit, if already parsed (a row of `timestamps.CommitDates.rows()`).
+        """
+        commit_id = self._intern(commit['commit'])
+        if commit_id in self._is_commit:
+            return
+        self._is_commit.add(commit_id)
+        row = len(self._commit_ids)
+        self._commit_ids.append(commit_id)
+        for parent_sha in commit['parents']:
+            self._parents.append(self._intern(parent_sha))
+        self._parents_offsets.append(len(self._parents))
+        self._authors.append(self._identities.setdefault(commit['Author'], len(self._identities)))
+        self._committers.append(self._identities.setdefault(commit['Commit'], len(self._identities)))
+        author_date, author_tz, commit_date, commit_tz = dates if dates is not None else parse_commit_dates(commit)
+        self._author_dates.append(author_date)
+        self._author_tzs.append(author_tz)
+        self._commit_dates.append(commit_date)
+        self._commit_tzs.append(commit_tz)
+        self._messages.append(commit['message'])
+        if len(commit['refs']) > 0:
+            self._refs[row] = list(commit['refs'])
+
+    def finish(self):
+        """
+        Returns the `CommitDAG` of the commits added.
+        """
+        n_commits = len(self._commit_ids)
+        temporary_ids = np.frombuffer(self._commit_ids, dtype=np.int64)
+
+        # commits first, in order of addition, then the parents outside of the history, in order of appearance
+        is_external = np.ones(len(self._ids), dtype=np.bool_)
+        is_external[temporary_ids] = False
+        new_ids = np.empty(len(self._ids), dtype=np.int64)
+        new_ids[temporary_ids] = np.arange(n_commits)
+        new_ids[is_external] = np.arange(n_commits, len(self._ids))
+
+        shas = np.empty(len(self._ids), dtype='S40')
+        shas[new_ids] = np.array(list(self._ids.keys()), dtype='S40')
+
+        return CommitDAG(
+            shas=shas,
+            n_commits=n_commits,
+            parents=new_ids[np.frombuffer(self._parents, dtype=np.int64)] if len(self._parents) > 0 else np.zeros(0, dtype=np.int64),
+            parents_offsets=np.frombuffer(self._parents_offsets, dtype=np.int64).copy(),
+            identities=list(self._identities),
+            authors=np.array(self._authors, dtype=np.int32),
+            committers=np.array(self._committers, dtype=np.int32),
+            author_dates=np.array(self._author_dates, dtype=np.int64),
+            author_tzs=np.array(self._author_tzs, dtype=np.int16),
+            commit_dates=np.array(self._commit_dates, dtype=np.int64),
+            commit_tzs=np.array(self._commit_tzs, dtype=np.int16),
+            messages=self._messages,
+            refs=self._refs)
+
+##########
+# Commit DAG
+##########
+
+def _csr_neighbours(offsets, indices, ids):
+    # returns the concatenated rows `ids` of a CSR adjacency, without a Python loop over the rows
+    starts = offsets[ids]
+    counts = offsets[ids + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=indices.dtype)
+    # position of each neighbour in `indices`: start of its row + rank in its row
+    row_starts = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return indices[row_starts + np.arange(total)]
+
+class CommitDAG:
+    """
+    Commit history as a directed acyclic graph of integer ids.
+
+    Commits have ids 0 to n-1 (`len(dag)`), parents which are not part of the history have ids from n on.
+    For commit i:
+     - `shas[i]` is its SHA (bytes),
+     - `parents[parents_offsets[i]:parents_offsets[i+1]]` are its parents, in the order given by git
+       (including those outside of the history),
+     - `children[children_offsets[i]:children_offsets[i+1]]` are its children,
+     - `authors[i]`, `committers[i]` are ids in the `identities` list, `author_dates[i]`, `commit_dates[i]`
+       are in seconds since epoch (UTC) and `author_tzs[i]`, `commit_tzs[i]` are time zone offsets in minutes,
+     - `messages[i]` is its message and `refs.get(i, [])` its refs.
+
+    `to_networkx()` converts it to the commit history built by `build_commit_history()`, e.g. for a GraphML export.
+    Use `CommitDAGBuilder` or `CommitDAG.from_commits()` to build one, `save()` and `CommitDAG.load()` to store one.
+    """
+
+    def __init__(self, shas, n_commits, parents, parents_offsets, identities, authors, committers,
+                 author_dates, author_tzs, commit_dates, commit_tzs, messages, refs):
+        self.shas = shas
+        self.n_commits = n_commits
+        self.parents = parents
+        self.parents_offsets = parents_offsets
+        self.identities = identities
+        self.authors = authors
+        self.committers = committers
+        self.author_dates = author_dates
+        self.author_tzs = author_tzs
+        self.commit_dates = commit_dates
+        self.commit_tzs = commit_tzs
+        self.messages = messages
+        self.refs = refs
+        self._index = None
+
+        # links within the history only, as CSR arrays in both directions
+        rows = np.repeat(np.arange(n_commits, dtype=np.int64), np.diff(parents_offsets))
+        known = parents < n_commits
+        parent_rows, parent_ids = rows[known], parents[known]
+        self.known_parents = parent_ids
+        self.known_parents_offsets = np.concatenate(([0], np.cumsum(np.bincount(parent_rows, minlength=n_commits)))).astype(np.int64)
+        order = np.argsort(parent_ids, kind='stable')
+        self.children = parent_rows[order]
+        self.children_offsets = np.concatenate(([0], np.cumsum(np.bincount(parent_ids, minlength=n_commits)))).astype(np.int64)
+
+    @classmethod
+    def from_commits(cls, commits, dates=None):
+        """
+        Builds the DAG of a list of commits (perceval format), e.g. `known_commits` in `start.py`,
+        with their dates if already parsed (`timestamps.CommitDates`, e.g. from `CommitStore.dates()`).
+        """
+        if dates is None:
+            commits = list(commits)
+            dates = CommitDates.from_commits(commits)
+        builder = CommitDAGBuilder()
+        for commit, commit_dates in zip(commits, dates.rows()):
+            builder.add(commit, commit_dates)
+        return builder.finish()
+
+    def __len__(self):
+        return self.n_commits
+
+    def number_of_links(self):
+        return len(self.children)
+
+    def index(self, sha):
+        """
+        Returns the id of a commit, given its full SHA.
+        """
+        if self._index is None:
+            self._index = {sha.decode('ascii'): i for i, sha in enumerate(self.shas[:self.n_commits])}
+        return self._index[sha]
+
+    def sha(self, commit_id):
+        return self.shas[commit_id].decode('ascii')
+
+    def parents_of(self, commit_id):
+        """
+        Returns the ids of the parents of a commit which are part of the history.
+        """
+        return self.known_parents[self.known_parents_offsets[commit_id]:self.known_parents_offsets[commit_id + 1]]
+
+    def children_of(self, commit_id):
+        """
+        Returns the ids of the children of a commit.
+        """
+        return self.children[self.children_offsets[commit_id]:self.children_offsets[commit_id + 1]]
+
+    def _reachable(self, offsets, indices, commit_id):
+        # breadth-first search, one whole level of the DAG at a time
+        visited = np.zeros(self.n_commits, dtype=np.bool_)
+        frontier = np.array([commit_id], dtype=np.int64)
+        while len(frontier) > 0:
+            neighbours = _csr_neighbours(offsets, indices, frontier)
+            neighbours = np.unique(neighbours[~visited[neighbours]])
+            visited[neighbours] = True
+            frontier = neighbours
+        visited[commit_id] = False
+        return np.flatnonzero(visited)
+
+    def ancestors(self, commit_id):
+        """
+        Returns the ids of all ancestors of a commit within the history (sorted, without the commit itself).
+        """
+        return self._reachable(self.known_parents_offsets, self.known_parents, commit_id)
+
+    def descendants(self, commit_id):
+        """
+        Returns the ids of all descendants of a commit (sorted, without the commit itself).
+        """
+        return self._reachable(self.children_offsets, self.children, commit_id)
+
+    def is_ancestor(self, ancestor_id, commit_id):
+        """
+        Tells whether a commit is an ancestor of another one.
+        """
+        return ancestor_id != commit_id and bool(np.isin(ancestor_id, self.ancestors(commit_id)))
+
+    def iter_commits(self):
+        """
+        Yields the commits of the DAG in the format generated by perceval (without the file changes).
+        """
+        for i in range(self.n_commits):
+            yield {
+                'commit': self.sha(i),
+                'parents': [parent.decode('ascii') for parent in self.shas[self.parents[self.parents_offsets[i]:self.parents_offsets[i + 1]]]],
+                'refs': list(self.refs.get(i, list())),
+                'Author': self.identities[self.authors[i]],
+                'AuthorDate': format_git_date(self.author_dates[i], self.author_tzs[i]),
+                'Commit': self.identities[self.committers[i]],
+                'CommitDate': format_git_date(self.commit_dates[i], self.commit_tzs[i]),
+                'message': self.messages[i]
+            }
+
+    def to_networkx(self):
+        """
+        Returns the commit history as built by `build_commit_history()`: a networkx DiGraph keyed by short SHAs,
+        with the same attributes, branches and colours.
+        """
+        commit_history = nx.DiGraph()
+        builder = CommitHistoryBuilder(commit_history)
+        for commit in self.iter_commits():
+            builder.add(commit)
+        builder.finish()
+        return commit_history
+
+    def save(self, file_path):
+        """
+        Saves the DAG to a NumPy archive (.npz).
+
+        Returns
+        =======
+
+        int: number of bytes written
+        """
+        encoded_messages = [message.encode('utf-8', errors='surrogateescape') for message in self.messages]
+        messages_offsets = np.zeros(len(encoded_messages) + 1, dtype=np.int64)
+        np.cumsum([len(message) for message in encoded_messages], out=messages_offsets[1:])
+        meta = {
+            'format': 'commit_dag',
+            'version': FORMAT_VERSION,
+            'n_commits': self.n_commits,
+            'identities': self.identities,
+            'refs': {str(row): refs for row, refs in self.refs.items()}
+        }
+        with open(file_path, 'wb') as f:
+            np.savez_compressed(f,
+                meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+                shas=self.shas, parents=self.parents, parents_offsets=self.parents_offsets,
+                authors=self.authors, committers=self.committers,
+                author_dates=self.author_dates, author_tzs=self.author_tzs,
+                commit_dates=self.commit_dates, commit_tzs=self.commit_tzs,
+                messages=np.frombuffer(b''.join(encoded_messages), dtype=np.uint8), messages_offsets=messages_offsets)
+            return f.tell()
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Loads a DAG saved by `save()`.
+        """
+        with np.load(file_path) as archive:
+            meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+            if meta.get('format') != 'commit_dag' or meta.get('version') != FORMAT_VERSION:
+                raise ValueError(f"{file_path} is not a commit DAG (version {FORMAT_VERSION})")
+            messages, offsets = archive['messages'].tobytes(), archive['messages_offsets']
+            return cls(
+                shas=archive['shas'],
+                n_commits=meta['n_commits'],
+                parents=archive['parents'],
+                parents_offsets=archive['parents_offsets'],
+                identities=meta['identities'],
+                authors=archive['authors'],
+                committers=archive['committers'],
+                author_dates=archive['author_dates'],
+                author_tzs=archive['author_tzs'],
+                commit_dates=archive['commit_dates'],
+                commit_tzs=archive['commit_tzs'],
+                messages=[messages[offsets[i]:offsets[i + 1]].decode('utf-8', errors='surrogateescape') for i in range(meta['n_commits'])],
+                refs={int(row): refs for row, refs in meta['refs'].items()})
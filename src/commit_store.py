@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# compilation of the commits of all forks of a repository, without duplicates
+##########
+
+##########
+# Import libraries
+##########
+from lazy_imports import lazy_import
+from timestamps import CommitDates
+
+np = lazy_import("numpy")
+
+class CommitStore:
+    """
+    Commits (perceval format) indexed by their full SHA, with constant time insertion and lookup.
+
+    Each commit is stored once, the first time it is seen, and the store records all the forks
+    which contain it. Iterating over the store yields the commits in insertion order,
+    `iter_by_date()` yields them ordered by commit date. The dates of the commits are only parsed
+    once all commits are added, all at once (see `dates()`).
+
+    With `keep_commits=False`, only the SHAs and forks of the commits are kept (e.g. to deduplicate
+    commits which are passed on one at a time, see the streaming mode of `start.py`): the methods returning
+    commits are then not available.
+    """
+
+    def __init__(self, keep_commits=True):
+        self.keep_commits = keep_commits
+        self._commits = dict() # SHA -> commit (None if commits are not kept), in insertion order
+        self._forks = dict() # SHA -> forks ("<user>/<repo>") containing the commit, as keys of a dict in insertion order
+        self._dates = None # CommitDates of the commits, parsed on demand
+
+    def add(self, commit, fork=None):
+        """
+        Adds a commit to the store, unless it is already known, and records that `fork` contains it.
+
+        Parameters
+        ==========
+
+        `commit` : dict, required, commit data (perceval format)
+        `fork` : str, optional, fork containing the commit ("<user>/<repo>")
+
+        Returns
+        =======
+
+        bool: True if the commit was not known yet
+        """
+        sha = commit['commit']
+        is_new = sha not in self._commits
+        if is_new:
+            self._commits[sha] = commit if self.keep_commits else None
+            self._forks[sha] = dict()
+            self._dates = None
+        # a fork can be recorded again in any order (e.g. the forks of the previous run, then those fetched),
+        # so the forks of each commit are deduplicated with a dict, which keeps the order they were first recorded in
+        if fork is not None:
+            self._forks[sha][fork] = None
+        return is_new
+
+    def __contains__(self, sha):
+        return sha in self._commits
+
+    def _check_kept(self):
+        if not self.keep_commits:
+            raise ValueError("the commits are not kept by this store")
+
+    def __getitem__(self, sha):
+        self._check_kept()
+        return self._commits[sha]
+
+    def __len__(self):
+        return len(self._commits)
+
+    def __iter__(self):
+        self._check_kept()
+        return iter(self._commits.values())
+
+    def shas(self):
+        """
+        Returns the SHAs of the commits, in insertion order.
+        """
+        return list(self._commits.keys())
+
+    def commits(self):
+        """
+        Returns the commits, in insertion order.
+        """
+        self._check_kept()
+        return list(self._commits.values())
+
+    def dates(self):
+        """
+        Returns the dates of the commits (see `timestamps.CommitDates`), in insertion order.
+        They are parsed once and kept until new commits are added.
+        """
+        self._check_kept()
+        if self._dates is None:
+            self._dates = CommitDates.from_commits(self._commits.values())
+        return self._dates
+
+    def timestamps(self):
+        """
+        Returns the commit dates (seconds since epoch) of the commits, in insertion order.
+        """
+        return self.dates().commit_dates.tolist()
+
+    def forks_of(self, sha):
+        """
+        Returns the forks ("<user>/<repo>") containing a commit, in the order they were recorded.
+        """
+        return list(self._forks[sha])
+
+    def forks(self):
+        """
+        Returns a dictionary with the forks containing each commit (SHA -> list of "<user>/<repo>"), e.g. for a JSON export.
+        """
+        return {sha: list(forks) for sha, forks in self._forks.items()}
+
+    def iter_by_date(self):
+        """
+        Yields the commits ordered by commit date (commits with the same date stay in insertion order).
+        """
+        commits = self.commits()
+        for row in np.argsort(self.dates().commit_dates, kind='stable').tolist():
+            yield commits[row]
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# columnar on-disk format for the commits of a repository
+# one directory per repository, one NumPy (.npy) file per column, which can be memory-mapped,
+# so a single column (e.g. commit dates) can be read for many repositories without loading the commits
+##########
+
+##########
+# Import libraries
+##########
+import json
+import os
+import shutil
+from array import array
+
+from lazy_imports import lazy_import
+from timestamps import CommitDates, parse_commit_dates, format_git_date
+
+np = lazy_import("numpy")
+
+FORMAT_VERSION = 1
+
+# commit fields stored in their own column, all other fields are stored in the "extra" column
+COMMIT_COLUMNS = ['commit', 'parents', 'refs', 'Author', 'AuthorDate', 'Commit', 'CommitDate', 'message', 'files']
+# file change fields stored in their own column, all other fields (e.g. "modes") are stored in the "file_extra" column
+FILE_COLUMNS = ['file', 'added', 'removed', 'action']
+
+# values of the "added"/"removed" columns which are not line counts
+BINARY_FILE = -1 # git reports "-" for binary files
+MISSING_VALUE = -2
+
+##########
+# Write a commit table
+##########
+
+def _encode_count(value):
+    if value is None:
+        return MISSING_VALUE
+    if value == '-':
+        return BINARY_FILE
+    return int(value)
+
+# fixed-width columns: name -> type code of the `array` they are accumulated in, and NumPy type they are saved as
+# (NumPy types are given by name, so numpy isn't needed before a table is written)
+NUMBER_COLUMNS = {
+    'author': ('i', 'int32'),
+    'committer': ('i', 'int32'),
+    'author_date': ('q', 'int64'),
+    'author_tz': ('h', 'int16'),
+    'commit_date': ('q', 'int64'),
+    'commit_tz': ('h', 'int16'),
+    'parents_offsets': ('q', 'int64'),
+    'has_files': ('b', 'bool'),
+    'file_commit': ('i', 'int32'),
+    'file_path': ('i', 'int32'),
+    'file_added': ('i', 'int32'),
+    'file_removed': ('i', 'int32'),
+    'file_action': ('h', 'int16')
+}
+TEXT_COLUMNS = ['message', 'refs', 'extra', 'file_extra']
+
+class CommitTableWriter:
+    """
+    Writes commits (perceval format) to a commit table one commit at a time (see `write_commit_table()`).
+
+    Fixed-width columns are accumulated in compact arrays (a few bytes per value) and text columns
+    are written to disk as the commits are added, so the commits themselves are not kept in memory.
+    The table is written next to its final location and only moved in place by `close()`,
+    so readers never see a partially written table.
+    Used as a context manager, the partially written table is removed if an exception occurs.
+
+    Parameters
+    ==========
+
+    `table_path` : str, required, directory of the table, replaced if it exists
+    """
+
+    def __init__(self, table_path):
+        self.table_path = table_path
+        self.n_commits = 0
+        self.bytes_written = 0 # size of the table on disk, once closed
+        self._temporary_path = table_path.rstrip(os.sep) + '.tmp'
+        if os.path.isdir(self._temporary_path):
+            shutil.rmtree(self._temporary_path)
+        os.makedirs(self._temporary_path)
+
+        self._identities = dict()
+        self._paths = dict()
+        self._actions = dict()
+        self._shas = bytearray()
+        self._parents = bytearray()
+        self._columns = {name: array(type_code) for name, (type_code, dtype) in NUMBER_COLUMNS.items()}
+        self._columns['parents_offsets'].append(0)
+        self._text_files = dict()
+        self._text_offsets = dict()
+        for name in TEXT_COLUMNS:
+            self._text_files[name] = open(os.path.join(self._temporary_path, name + '.bin'), 'wb')
+            self._text_offsets[name] = array('q', [0])
+
+    def _add_text(self, name, text):
+        data = text.encode('utf-8', errors='surrogateescape')
+        self._text_files[name].write(data)
+        offsets = self._text_offsets[name]
+        offsets.append(offsets[-1] + len(data))
+
+    def add(self, commit, dates=None):
+        """
+        Appends a commit (perceval format) to the table.
+        `dates` are the dates of the commit, if already parsed (a row of `timestamps.CommitDates.rows()`).
+        """
+        columns = self._columns
+        row = self.n_commits
+        self._shas += commit['commit'].encode('ascii')
+        columns['author'].append(self._identities.setdefault(commit['Author'], len(self._identities)))
+        columns['committer'].append(self._identities.setdefault(commit['Commit'], len(self._identities)))
+        author_date, author_tz, commit_date, commit_tz = dates if dates is not None else parse_commit_dates(commit)
+        columns['author_date'].append(author_date)
+        columns['author_tz'].append(author_tz)
+        columns['commit_date'].append(commit_date)
+        columns['commit_tz'].append(commit_tz)
+        for parent in commit['parents']:
+            self._parents += parent.encode('ascii')
+        columns['parents_offsets'].append(columns['parents_offsets'][-1] + len(commit['parents']))
+        self._add_text('message', commit.get('message', ''))
+        self._add_text('refs', json.dumps(commit['refs']))
+        self._add_text('extra', json.dumps({key: value for key, value in commit.items() if key not in COMMIT_COLUMNS}))
+        columns['has_files'].append('files' in commit)
+
+        for filechange in commit.get('files', list()):
+            columns['file_commit'].append(row)
+            columns['file_path'].append(self._paths.setdefault(filechange['file'], len(self._paths)))
+            columns['file_added'].append(_encode_count(filechange.get('added')))
+            columns['file_removed'].append(_encode_count(filechange.get('removed')))
+            columns['file_action'].append(self._actions.setdefault(filechange['action'], len(self._actions)) if 'action' in filechange else MISSING_VALUE)
+            self._add_text('file_extra', json.dumps({key: value for key, value in filechange.items() if key not in FILE_COLUMNS}))
+        self.n_commits += 1
+
+    def _save_text_column(self, name):
+        # converts the raw bytes written so far into a .npy file, a chunk at a time
+        self._text_files[name].close()
+        raw_path = os.path.join(self._temporary_path, name + '.bin')
+        size = self._text_offsets[name][-1]
+        column_path = os.path.join(self._temporary_path, name + '.npy')
+        if size == 0:
+            np.save(column_path, np.zeros(0, dtype=np.uint8))
+        else:
+            column = np.lib.format.open_memmap(column_path, mode='w+', dtype=np.uint8, shape=(size,))
+            with open(raw_path, 'rb') as f:
+                position = 0
+                for chunk in iter(lambda: f.read(16*1024*1024), b''):
+                    column[position:position + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+                    position += len(chunk)
+            column.flush()
+            del column
+        os.remove(raw_path)
+        np.save(os.path.join(self._temporary_path, name + '_offsets.npy'),
+                np.frombuffer(self._text_offsets[name], dtype='int64'))
+
+    def close(self):
+        """
+        Saves the columns and moves the table in place.
+        """
+        np.save(os.path.join(self._temporary_path, 'sha.npy'), np.frombuffer(bytes(self._shas), dtype='S40'))
+        np.save(os.path.join(self._temporary_path, 'parents.npy'), np.frombuffer(bytes(self._parents), dtype='S40'))
+        for name, (type_code, dtype) in NUMBER_COLUMNS.items():
+            np.save(os.path.join(self._temporary_path, name + '.npy'), np.array(self._columns[name], dtype=dtype))
+        for name in TEXT_COLUMNS:
+            self._save_text_column(name)
+
+        meta = {
+            'format': 'commit_table',
+            'version': FORMAT_VERSION,
+            'n_commits': self.n_commits,
+            'n_file_changes': len(self._columns['file_commit']),
+            'identities': list(self._identities),
+            'paths': list(self._paths),
+            'actions': list(self._actions)
+        }
+        with open(os.path.join(self._temporary_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if os.path.isdir(self.table_path):
+            shutil.rmtree(self.table_path)
+        os.replace(self._temporary_path, self.table_path)
+        self.bytes_written = sum(os.path.getsize(os.path.join(self.table_path, name)) for name in os.listdir(self.table_path))
+
+    def abort(self):
+        """
+        Removes the partially written table.
+        """
+        for text_file in self._text_files.values():
+            text_file.close()
+        shutil.rmtree(self._temporary_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_commit_table(commits, table_path, dates=None):
+    """
+    Writes commits (perceval format) to a commit table.
+
+    The table is a directory with:
+     - fixed-width columns, one row per commit: "sha" (40 bytes), "author" and "committer" (ids in the
+       "identities" list of `meta.json`), "author_date" and "commit_date" (seconds since epoch, UTC),
+       "author_tz" and "commit_tz" (time zone offsets in minutes), "parents_offsets" (the parents of
+       commit i are rows parents_offsets[i] to parents_offsets[i+1] of column "parents"), "has_files"
+       (False for the few commits perceval gives without "files" attribute)
+     - text columns, one string per commit: "message", "refs" and "extra" (other fields, JSON encoded)
+     - the file change table, one row per file change: "file_commit" (row of the commit),
+       "file_path" (id in the "paths" list of `meta.json`), "file_added" and "file_removed" (-1 for binary files),
+       "file_action" (id in the "actions" list of `meta.json`) and the text column "file_extra"
+    Missing values are stored as -2.
+
+    Parameters
+    ==========
+
+    `commits` : iterable of dicts, required, commit data generated by perceval
+    `table_path` : str, required, directory of the table, replaced if it exists
+    `dates` : CommitDates, optional, dates of the commits if already parsed (see `timestamps.CommitDates`)
+
+    Returns
+    =======
+
+    int: size of the table on disk, in bytes
+    """
+    if dates is None:
+        commits = list(commits)
+        dates = CommitDates.from_commits(commits)
+    with CommitTableWriter(table_path) as writer:
+        for commit, commit_dates in zip(commits, dates.rows()):
+            writer.add(commit, commit_dates)
+    return writer.bytes_written
+
+##########
+# Read a commit table
+##########
+
+class CommitTable:
+    """
+    Read access to a commit table written by `write_commit_table()`.
+
+    Columns are memory-mapped when first accessed, nothing else is loaded:
+    `table.column('commit_date')` reads the commit dates without reading the rest of the table.
+    `iter_commits()` rebuilds the commits in the format generated by perceval, one at a time.
+    """
+
+    def __init__(self, table_path):
+        self.table_path = table_path
+        with open(os.path.join(table_path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != 'commit_table' or self.meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{table_path} is not a commit table (version {FORMAT_VERSION})")
+        self.identities = self.meta['identities']
+        self.paths = self.meta['paths']
+        self.actions = self.meta['actions']
+        self._columns = dict()
+
+    def __len__(self):
+        return self.meta['n_commits']
+
+    def column(self, name):
+        """
+        Returns a column as a (read-only, memory-mapped) NumPy array.
+        """
+        if name not in self._columns:
+            column_path = os.path.join(self.table_path, name + '.npy')
+            try:
+                self._columns[name] = np.load(column_path, mmap_mode='r')
+            except ValueError: # empty columns can't be memory-mapped
+                self._columns[name] = np.load(column_path)
+        return self._columns[name]
+
+    def text(self, name, row):
+        """
+        Returns the string of a text column ("message", "refs", "extra" or "file_extra") at a given row.
+        """
+        offsets = self.column(name + '_offsets')
+        return self.column(name)[offsets[row]:offsets[row + 1]].tobytes().decode('utf-8', errors='surrogateescape')
+
+    def iter_commits(self):
+        """
+        Yields the commits of the table, in the format generated by perceval.
+        """
+        sha = self.column('sha')
+        author, committer = self.column('author'), self.column('committer')
+        author_date, author_tz = self.column('author_date'), self.column('author_tz')
+        commit_date, commit_tz = self.column('commit_date'), self.column('commit_tz')
+        parents, parents_offsets = self.column('parents'), self.column('parents_offsets')
+        has_files = self.column('has_files')
+        file_commit, file_path = self.column('file_commit'), self.column('file_path')
+        file_added, file_removed, file_action = self.column('file_added'), self.column('file_removed'), self.column('file_action')
+
+        file_row = 0
+        for row in range(len(self)):
+            commit = {
+                'commit': sha[row].decode('ascii'),
+                'parents': [parent.decode('ascii') for parent in parents[parents_offsets[row]:parents_offsets[row + 1]]],
+                'refs': json.loads(self.text('refs', row)),
+                'Author': self.identities[author[row]],
+                'AuthorDate': format_git_date(author_date[row], author_tz[row]),
+                'Commit': self.identities[committer[row]],
+                'CommitDate': format_git_date(commit_date[row], commit_tz[row]),
+                'message': self.text('message', row)
+            }
+            commit.update(json.loads(self.text('extra', row)))
+            if has_files[row]:
+                commit['files'] = list()
+
+            while file_row < len(file_commit) and file_commit[file_row] == row:
+                filechange = json.loads(self.text('file_extra', file_row))
+                filechange['file'] = self.paths[file_path[file_row]]
+                for name, column in [('added', file_added), ('removed', file_removed)]:
+                    if column[file_row] == BINARY_FILE:
+                        filechange[name] = '-'
+                    elif column[file_row] != MISSING_VALUE:
+                        filechange[name] = str(column[file_row])
+                if file_action[file_row] != MISSING_VALUE:
+                    filechange['action'] = self.actions[file_action[file_row]]
+                commit['files'].append(filechange)
+                file_row += 1
+            yield commit
+
+def load_column(table_paths, name):
+    """
+    Reads one column of several commit tables (e.g. of hundreds of repositories) into one array.
+
+    Parameters
+    ==========
+
+    `table_paths` : list of str, required, directories of the tables
+    `name` : str, required, name of the column, e.g. "commit_date"
+
+    Returns
+    =======
+
+    numpy array: concatenation of the column of all tables, in the same order as `table_paths`
+    """
+    return np.concatenate([CommitTable(table_path).column(name) for table_path in table_paths])
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# writers and readers of export files which handle one item at a time,
+# so exports never need the whole data in memory
+##########
+
+##########
+# Import libraries
+##########
+import gzip
+import io
+import json
+import numbers
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+##########
+# Export files
+##########
+
+# suffix of compressed export files
+COMPRESSED_SUFFIX = '.gz'
+
+class ExportFile:
+    """
+    Text file (UTF-8) written piece by piece, optionally compressed with gzip.
+
+    The file is written under a temporary name and only moved in place by `close()`,
+    so an interrupted export never replaces a previous file with a truncated one.
+    Used as a context manager, the temporary file is removed if an exception occurs.
+    Once closed, `bytes_written` is the size of the file on disk (i.e. after compression).
+
+    Parameters
+    ==========
+
+    `file_path` : str, required
+    `compress` : bool, optional, compress the file with gzip (`file_path` should then end with `COMPRESSED_SUFFIX`)
+    """
+
+    def __init__(self, file_path, compress=False):
+        self.file_path = file_path
+        self.bytes_written = 0
+        self._temporary_path = file_path + '.tmp'
+        if compress:
+            # no timestamp in the gzip header, so identical exports give identical files
+            binary_file = gzip.GzipFile(self._temporary_path, mode='wb', compresslevel=6, mtime=0)
+        else:
+            binary_file = open(self._temporary_path, 'wb')
+        self._file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+
+    def write(self, text):
+        self._file.write(text)
+
+    def writelines(self, texts):
+        for text in texts:
+            self._file.write(text)
+
+    def close(self):
+        """
+        Moves the file in place.
+        """
+        self._file.close()
+        os.replace(self._temporary_path, self.file_path)
+        self.bytes_written = os.path.getsize(self.file_path)
+
+    def abort(self):
+        """
+        Removes the partially written file.
+        """
+        self._file.close()
+        if os.path.isfile(self._temporary_path):
+            os.remove(self._temporary_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def open_export(file_path):
+    # opens an export file for reading, decompressing it if needed
+    if file_path.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(file_path, 'rt', encoding='utf-8')
+    return open(file_path, 'r', encoding='utf-8')
+
+##########
+# JSON arrays
+##########
+
+def _JSON_item(item, first, level, sort_keys=True, indent=4):
+    # formats an item of a JSON array nested `level` levels deep, as `json.dumps()` would
+    text = json.dumps(item, sort_keys=sort_keys, indent=indent)
+    margin = ' ' * (indent * (level + 1))
+    return ('[\n' if first else ',\n') + margin + text.replace('\n', '\n' + margin)
+
+def _JSON_array_end(n_items, level, indent=4):
+    return '[]' if n_items == 0 else '\n' + ' ' * (indent * level) + ']'
+
+class JSONArrayWriter:
+    """
+    Writes a JSON array to a file one item at a time.
+
+    The file is identical to `json.dumps(items, sort_keys=sort_keys, indent=indent)`, optionally compressed
+    with gzip (see `ExportFile`, which also gives `bytes_written` once closed).
+    Used as a context manager, the temporary file is removed if an exception occurs.
+    """
+
+    def __init__(self, file_path, sort_keys=True, indent=4, compress=False):
+        self.file_path = file_path
+        self.sort_keys = sort_keys
+        self.indent = indent
+        self.n_items = 0
+        self.bytes_written = 0
+        self._file = ExportFile(file_path, compress=compress)
+
+    def add(self, item):
+        """
+        Appends an item (any JSON serialisable object) to the array.
+        """
+        self._file.write(_JSON_item(item, self.n_items == 0, 0, self.sort_keys, self.indent))
+        self.n_items += 1
+
+    def close(self):
+        """
+        Terminates the array and moves the file in place.
+        """
+        self._file.write(_JSON_array_end(self.n_items, 0, self.indent))
+        self._file.close()
+        self.bytes_written = self._file.bytes_written
+
+    def abort(self):
+        """
+        Removes the partially written file.
+        """
+        self._file.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def iter_JSON_array(file_path, chunk_size=1024*1024):
+    """
+    Yields the items of a file containing a JSON array (compressed with gzip if its name ends with `COMPRESSED_SUFFIX`),
+    reading the file `chunk_size` characters at a time instead of loading the whole array.
+
+    Parameters
+    ==========
+
+    `file_path` : str, required
+    `chunk_size` : int, optional, number of characters read at once
+    """
+    decoder = json.JSONDecoder()
+    with open_export(file_path) as f:
+        buffer = f.read(chunk_size)
+        position = len(buffer) - len(buffer.lstrip())
+        if buffer[position:position + 1] != '[':
+            raise ValueError(f"{file_path} does not contain a JSON array")
+        position += 1
+        end_of_file = False
+        while True:
+            # skip the separators between items
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError("Unterminated array", buffer, position)
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the next item is not entirely in the buffer yet
+                if end_of_file:
+                    raise
+                chunk = f.read(chunk_size)
+                end_of_file = len(chunk) == 0
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item
+
+##########
+# Graphs
+##########
+
+def iter_node_link_JSON(graph, indent=4):
+    """
+    Yields the pieces of the node-link JSON document of a networkx graph, one node or link at a time.
+
+    Joined, the pieces are identical to `json.dumps(nx.node_link_data(graph), sort_keys=True, indent=indent)`
+    with networkx 2.x, where the edges are listed under "links" (as expected by the vis.js template).
+    """
+    margin = ' ' * indent
+    yield '{\n' + margin + '"directed": ' + json.dumps(graph.is_directed()) + ',\n'
+    yield margin + '"graph": ' + json.dumps(graph.graph, sort_keys=True, indent=indent).replace('\n', '\n' + margin) + ',\n'
+
+    yield margin + '"links": '
+    n_links = 0
+    if graph.is_multigraph():
+        for source, target, key, data in graph.edges(keys=True, data=True):
+            yield _JSON_item(dict(data, source=source, target=target, key=key), n_links == 0, 1, indent=indent)
+            n_links += 1
+    else:
+        for source, target, data in graph.edges(data=True):
+            yield _JSON_item(dict(data, source=source, target=target), n_links == 0, 1, indent=indent)
+            n_links += 1
+    yield _JSON_array_end(n_links, 1, indent) + ',\n'
+
+    yield margin + '"multigraph": ' + json.dumps(graph.is_multigraph()) + ',\n'
+
+    yield margin + '"nodes": '
+    n_nodes = 0
+    for node, data in graph.nodes(data=True):
+        yield _JSON_item(dict(data, id=node), n_nodes == 0, 1, indent=indent)
+        n_nodes += 1
+    yield _JSON_array_end(n_nodes, 1, indent) + '\n}'
+
+def write_node_link_JSON(graph, file_path, compress=False, indent=4):
+    """
+    Writes the node-link JSON document of a networkx graph (see `iter_node_link_JSON()`) one node or link at a time.
+
+    Returns
+    =======
+
+    int: number of bytes written
+    """
+    with ExportFile(file_path, compress=compress) as f:
+        f.writelines(iter_node_link_JSON(graph, indent=indent))
+    return f.bytes_written
+
+def _GraphML_type(value):
+    # GraphML type of an attribute value, as chosen by networkx
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, numbers.Integral):
+        return 'long'
+    if isinstance(value, numbers.Real):
+        return 'double'
+    if isinstance(value, str):
+        return 'string'
+    raise TypeError(f"GraphML does not support {type(value)} as data values")
+
+def _GraphML_attribute(value):
+    return quoteattr(str(value), {'\n': '&#10;', '\r': '&#13;', '\t': '&#09;'})
+
+def iter_GraphML(graph):
+    """
+    Yields the lines of the GraphML document of a networkx graph, one node or edge at a time.
+
+    The document has the same structure as the one written by `nx.write_graphml()`, which builds
+    the whole XML tree in memory first. The attributes of the graph are read twice:
+    once to declare their types (GraphML keys), once to write them.
+    """
+    # GraphML keys, one per (scope, attribute name, type), in order of appearance
+    keys = dict()
+    def key_of(scope, name, value):
+        return keys.setdefault((scope, name, _GraphML_type(value)), 'd' + str(len(keys)))
+    for name, value in graph.graph.items():
+        key_of('graph', name, value)
+    for node, data in graph.nodes(data=True):
+        for name, value in data.items():
+            key_of('node', name, value)
+    for source, target, data in graph.edges(data=True):
+        for name, value in data.items():
+            key_of('edge', name, value)
+
+    def data_lines(scope, data, margin):
+        for name, value in data.items():
+            yield f'{margin}<data key="{key_of(scope, name, value)}">{escape(str(value))}</data>\n'
+
+    def element(tag, attributes, scope, data, margin):
+        opening = margin + '<' + tag + ''.join(f' {name}={_GraphML_attribute(value)}' for name, value in attributes)
+        if len(data) == 0:
+            yield opening + ' />\n'
+        else:
+            yield opening + '>\n'
+            yield from data_lines(scope, data, margin + '  ')
+            yield margin + '</' + tag + '>\n'
+
+    yield "<?xml version='1.0' encoding='utf-8'?>\n"
+    yield ('<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+           'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n')
+    # networkx lists the keys in reverse order of appearance
+    for (scope, name, attribute_type), key in reversed(list(keys.items())):
+        yield f'  <key id="{key}" for="{scope}" attr.name={_GraphML_attribute(name)} attr.type="{attribute_type}" />\n'
+
+    yield '  <graph edgedefault="' + ('directed' if graph.is_directed() else 'undirected') + '">\n'
+    for node, data in graph.nodes(data=True):
+        yield from element('node', [('id', node)], 'node', data, '    ')
+    if graph.is_multigraph():
+        for source, target, edge_key, data in graph.edges(keys=True, data=True):
+            yield from element('edge', [('source', source), ('target', target), ('id', edge_key)], 'edge', data, '    ')
+    else:
+        for source, target, data in graph.edges(data=True):
+            yield from element('edge', [('source', source), ('target', target)], 'edge', data, '    ')
+    yield from data_lines('graph', graph.graph, '    ')
+    yield '  </graph>\n'
+    yield '</graphml>\n'
+
+def write_GraphML(graph, file_path, compress=False):
+    """
+    Writes the GraphML document of a networkx graph (see `iter_GraphML()`) one node or edge at a time.
+
+    Returns
+    =======
+
+    int: number of bytes written
+    """
+    with ExportFile(file_path, compress=compress) as f:
+        f.writelines(iter_GraphML(graph))
+    return f.bytes_written
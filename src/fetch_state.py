@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Keep track of what has already been mined from each fork of a repository,
+# so that an incremental run only needs to ask for the commits pushed since.
+
+##########
+# Import libraries
+##########
+
+import json
+import os
+import logging
+from datetime import datetime, timezone
+
+from timestamps import parse_git_date
+
+##########
+# Read and write the fetch state of a repository
+##########
+
+def fetch_state_path(data_dir, username, reponame):
+    """
+    Returns the path of the file storing the fetch state of a repository and all its forks.
+
+    Parameters
+    ==========
+
+    `data_dir` : str, required, output directory for downloaded data
+    `username` : str, required
+    `reponame` : str, required
+    """
+    return os.path.join(data_dir, 'fetch_states', username + '-' + reponame + '.json')
+
+def load_fetch_state(data_dir, username, reponame):
+    """
+    Loads the fetch state of a repository, or returns an empty state if the repository was never mined.
+
+    The state is a dictionary with one entry per fork (key "forks"), indexed by "<user>/<repo>".
+    Each entry records the last seen commit (key "last_commit"), its date (key "last_commit_date"),
+    the commit each branch/tag ref pointed to (key "refs") and when the fork was last fetched (key "fetched_at").
+
+    Parameters
+    ==========
+
+    `data_dir` : str, required, output directory for downloaded data
+    `username` : str, required
+    `reponame` : str, required
+    """
+    state_path = fetch_state_path(data_dir, username, reponame)
+    if not os.path.isfile(state_path):
+        return {'forks': dict()}
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as state_error:
+        # a corrupted state only costs us a full re-fetch, so we don't stop here
+        logging.warning(f"Ignoring unreadable fetch state {state_path}: {state_error}")
+        return {'forks': dict()}
+    state.setdefault('forks', dict())
+    return state
+
+def save_fetch_state(data_dir, username, reponame, state):
+    """
+    Saves the fetch state of a repository (see `load_fetch_state()`).
+
+    The file is first written under a temporary name and then moved in place,
+    so an interrupted run never leaves a truncated state behind.
+
+    Parameters
+    ==========
+
+    `data_dir` : str, required, output directory for downloaded data
+    `username` : str, required
+    `reponame` : str, required
+    `state` : dict, required
+    """
+    state_path = fetch_state_path(data_dir, username, reponame)
+    if not os.path.isdir(os.path.dirname(state_path)):
+        os.makedirs(os.path.dirname(state_path))
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f, sort_keys=True, indent=4)
+    os.replace(state_path + '.tmp', state_path)
+
+def fork_state(state, username, reponame):
+    """
+    Returns the (mutable) entry of a fork in the fetch state of its repository, creating it if needed.
+    """
+    return state['forks'].setdefault(username + '/' + reponame, dict())
+
+##########
+# Update the state of a fork with newly fetched commits
+##########
+
+def ref_name(ref):
+    """
+    Strips the decorations git adds to a ref, e.g. "HEAD -> refs/heads/master" -> "refs/heads/master".
+    """
+    return ref.split(' -> ')[-1].replace('tag: ', '')
+
+def stale_refs(state, moved_refs):
+    """
+    Returns the refs to remove from previously stored commits once all forks are fetched.
+
+    The stored commits hold the refs of all forks, so a ref which moved away from a commit in one fork
+    is only stale if no fork records it at that commit anymore (e.g. the master branch of a fork moved,
+    but the master branch of the repository still points to the old commit).
+
+    Parameters
+    ==========
+
+    `state` : dict, required, fetch state of the repository, updated with the fetch of all forks
+    `moved_refs` : dict, required, (fork "<user>/<repo>", ref name) -> commit the ref pointed to before the fetch
+        (see `update_fork_state()`)
+
+    Returns
+    =======
+
+    dict: SHA -> set of the names of the refs to remove from that commit (see `drop_moved_refs()`)
+    """
+    recorded = set()
+    for fork_entry in state['forks'].values():
+        recorded.update(fork_entry.get('refs', dict()).items())
+    stale = dict()
+    for (fork_name, name), moved_sha in moved_refs.items():
+        if (name, moved_sha) not in recorded:
+            stale.setdefault(moved_sha, set()).add(name)
+    return stale
+
+def drop_moved_refs(commit, names):
+    """
+    Removes refs from a previously stored commit.
+
+    Parameters
+    ==========
+
+    `commit` : dict, required, commit data (perceval format), modified in place
+    `names` : set of str, required, names of the refs to remove, as returned by `stale_refs()`
+    """
+    commit['refs'] = [ref for ref in commit['refs'] if ref_name(ref) not in names]
+
+def update_fork_state(fork_entry, new_commits, current_refs=None):
+    """
+    Records the newest commit and the current position of the refs of a fork after a fetch.
+
+    Parameters
+    ==========
+
+    `fork_entry` : dict, required, entry of the fork in the fetch state (see `fork_state()`)
+    `new_commits` : list of dicts, required, commits returned by the fetch (perceval format)
+    `current_refs` : dict, optional, all refs of the fork (ref name -> SHA) if known, e.g. listed from a fork network.
+        Otherwise only the refs of `new_commits` are known, so refs moved to already known commits,
+        or deleted, are not noticed
+
+    Returns
+    =======
+
+    dict: for each ref that moved, the commit it used to point to (so stale refs can be removed from previously stored commits)
+    """
+    moved_refs = dict()
+    known_refs = fork_entry.setdefault('refs', dict())
+
+    last_date = None
+    if 'last_commit_date' in fork_entry:
+        last_date = parse_git_date(fork_entry['last_commit_date'])[0]
+
+    for commit in new_commits:
+        commit_date = parse_git_date(commit['CommitDate'])[0]
+        if last_date is None or commit_date >= last_date:
+            last_date = commit_date
+            fork_entry['last_commit'] = commit['commit']
+            fork_entry['last_commit_date'] = commit['CommitDate']
+
+        if current_refs is None:
+            for ref in commit['refs']:
+                name = ref_name(ref)
+                if name in known_refs and known_refs[name] != commit['commit']:
+                    moved_refs[name] = known_refs[name]
+                known_refs[name] = commit['commit']
+
+    if current_refs is not None:
+        # refs deleted since the last fetch moved away from their commit as well
+        for name, known_sha in known_refs.items():
+            if current_refs.get(name) != known_sha:
+                moved_refs[name] = known_sha
+        fork_entry['refs'] = dict(current_refs)
+
+    fork_entry['fetched_at'] = datetime.now(timezone.utc).isoformat()
+    return moved_refs
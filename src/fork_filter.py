@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Tell, before cloning a fork, whether it has commits we don't know yet.
+# Most forks were never pushed to: their branches and tags point to commits of the
+# repository (or of other forks), and cloning them only yields duplicates.
+
+##########
+# Import libraries
+##########
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from perceval.errors import RepositoryError # To handle errors with repositories
+from git_commands import run_git
+
+##########
+# Heads of the forks
+##########
+
+def remote_heads(username, reponame):
+    """
+    Lists the commits the branches and tags of a GitHub repository point to, without cloning it (`git ls-remote`).
+
+    Returns
+    =======
+
+    set of str: SHAs of the commits (annotated tags are replaced by the commit they point to),
+    or None if the repository can't be reached
+    """
+    try:
+        output = run_git(['ls-remote', '--heads', '--tags', 'https://github.com/' + username + '/' + reponame])
+    except RepositoryError as repo_error:
+        logging.debug(f"Can't list the refs of {username}/{reponame} ({repo_error})")
+        return None
+
+    refs = dict()
+    for line in output.splitlines():
+        sha, ref = line.split('\t', 1)
+        # "<tag>^{}" is the commit an annotated tag points to, and comes after the tag itself
+        refs[ref[:-len('^{}')] if ref.endswith('^{}') else ref] = sha
+    return set(refs.values())
+
+def list_fork_heads(forks, max_workers=8):
+    """
+    Lists the heads (see `remote_heads()`) of the forks of a repository, up to `max_workers` at a time.
+
+    Parameters
+    ==========
+
+    `forks` : list of dicts, required, the repository and its forks (keys "user" and "repo"),
+        as returned by `get_Github_forks()`
+    `max_workers` : int, optional, maximum number of concurrent `git ls-remote`
+
+    Returns
+    =======
+
+    list: heads of each fork, in the same order as `forks`; None for the repository itself (the first item),
+    which is always fetched, and for the forks which can't be reached
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        heads = list(executor.map(lambda fork: remote_heads(fork['user'], fork['repo']), forks[1:]))
+    return [None] + heads
+
+def has_new_commits(heads, known_commits):
+    """
+    Returns False if all heads of a fork (see `remote_heads()`) are known commits: the fork then only has
+    commits already known, since the ancestors of known commits are known too.
+
+    Parameters
+    ==========
+
+    `heads` : set of str, required, None if the heads are not known (the fork must then be fetched)
+    `known_commits` : container of SHAs, required, e.g. a `CommitStore`
+    """
+    if heads is None:
+        return True
+    return any(sha not in known_commits for sha in heads)
@@ -8,12 +8,42 @@
 try:
     import requests
     import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import urlparse, parse_qs
+    from instrumentation import count_http_request
 # If library not present, throw exception
 except ImportError:
     print("Need `requests` library available")
     exit(1)
 
-def get_Github_forks(username, reponame, forks, auth=None):
+# maximum number of forks per page allowed by the GitHub API
+FORKS_PER_PAGE = 100
+
+# status codes of errors of the GitHub API which go away by themselves (rate limits, server errors)
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class GitHubAPIError(Exception):
+    """
+    Error message returned by the GitHub API (other than "Not Found").
+
+    Parameters
+    ==========
+
+    `message` : str, required, message of the error
+    `status_code` : int, optional, HTTP status code of the response, None if not known (e.g. cached requests)
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message if status_code is None else f"{message} (HTTP {status_code})")
+        self.message = message
+        self.status_code = status_code
+
+    @property
+    def transient(self):
+        # rate limits are reported with status 403 or 429 (or 200 and type "RATE_LIMITED" with GraphQL), and a message saying so
+        return self.status_code in TRANSIENT_STATUS_CODES or "rate limit" in self.message.lower().replace("_", " ")
+
+def get_Github_forks(username, reponame, forks, auth=None, cache=None):
     """
     TODO: Add docstring. See: https://realpython.com/documenting-python-code/
     TODO: Implement recursion argument, default to False.
@@ -25,13 +55,13 @@ def get_Github_forks(username, reponame, forks, auth=None):
     `reponame` : str, required
     `forks` : list, required
     `auth` : dict, optional
+    `cache` : GitHubResponseCache, optional, on-disk cache of the responses, revalidated with conditional requests
 
     Raises
     ======
 
-    NotImplementedError
-        If no sound is set for the animal or passed in as a
-        parameter.
+    GitHubAPIError
+        If the GitHub API returns an error, e.g. when the rate limit is exceeded.
     """
 
     page = 1  # Track page number of Github API response
@@ -39,17 +69,23 @@ def get_Github_forks(username, reponame, forks, auth=None):
         r = None
         request_url = "https://api.github.com/repos/{}/{}/forks".format(
             username, reponame)
-        if auth is None:
-            # Use the `params` argument to get specific `page` of results from
-            # API which produces `?page=*` after `request_url`
-            r = requests.get(url=request_url,
-                             params={"page": page})
+        if cache is not None:
+            j, links = cache.get(requests, request_url,
+                                 params={"page": page},
+                                 headers=None if auth is None else {"Authorization": "token " + auth})
         else:
-            r = requests.get(url=request_url,
-                             params={"page": page},
-                             headers={"Authorization": "token " + auth})
-        j = r.json()
-        r.close()
+            if auth is None:
+                # Use the `params` argument to get specific `page` of results from
+                # API which produces `?page=*` after `request_url`
+                r = requests.get(url=request_url,
+                                 params={"page": page})
+            else:
+                r = requests.get(url=request_url,
+                                 params={"page": page},
+                                 headers={"Authorization": "token " + auth})
+            count_http_request(r)
+            j = r.json()
+            r.close()
 
         if "message" in j:
             logging.error("username: {}, repository: {}".format(username, reponame))
@@ -59,7 +95,7 @@ def get_Github_forks(username, reponame, forks, auth=None):
             if str(j['message']) == "Not Found":
                 break
             else:
-                exit(1)
+                raise GitHubAPIError(j['message'], None if r is None else r.status_code)
 
         if len(j) == 0:
             break
@@ -76,9 +112,92 @@ def get_Github_forks(username, reponame, forks, auth=None):
                 if auth is None:
                     get_Github_forks(username=item['owner']['login'],
                                      reponame=item['name'],
-                                     forks=forks)
+                                     forks=forks,
+                                     cache=cache)
                 else:
                     get_Github_forks(username=item['owner']['login'],
                                      reponame=item['name'],
                                      forks=forks,
-                                     auth=auth)
\ No newline at end of file
+                                     auth=auth,
+                                     cache=cache)
+
+def get_Github_forks_concurrent(username, reponame, forks, auth=None, max_workers=8, cache=None):
+    """
+    Finds all forks of a GitHub repository like `get_Github_forks()`, but walks the fork tree
+    level by level (breadth-first) instead of recursively, and keeps up to `max_workers`
+    requests to the GitHub API in flight over a pool of persistent connections.
+
+    The same records are appended to `forks`, level by level instead of depth-first.
+
+    Parameters
+    ==========
+
+    `username` : str, required
+    `reponame` : str, required
+    `forks` : list, required
+    `auth` : str, optional, GitHub authentication token
+    `max_workers` : int, optional, maximum number of concurrent requests
+    `cache` : GitHubResponseCache, optional, on-disk cache of the responses, revalidated with conditional requests
+    """
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    if auth is not None:
+        session.headers.update({"Authorization": "token " + auth})
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        level = [(username, reponame)]
+        while len(level) > 0:
+            # the first page of each repository also tells how many pages there are
+            first_pages = list(executor.map(
+                lambda repository: _get_forks_page(session, repository[0], repository[1], 1, cache), level))
+            other_pages = dict()
+            for repository, (items, last_page) in zip(level, first_pages):
+                for page in range(2, last_page + 1):
+                    other_pages[(repository, page)] = executor.submit(
+                        _get_forks_page, session, repository[0], repository[1], page, cache)
+
+            next_level = list()
+            for repository, (items, last_page) in zip(level, first_pages):
+                pages = [items] + [other_pages[(repository, page)].result()[0] for page in range(2, last_page + 1)]
+                for page_items in pages:
+                    for item in page_items:
+                        forks.append({'user': item['owner']['login'],
+                                      'repo': item['name'],
+                                      'parent_user': repository[0],
+                                      'parent_repo': repository[1]})
+                        if item["forks"] > 0:
+                            next_level.append((item['owner']['login'], item['name']))
+            level = next_level
+
+def _get_forks_page(session, username, reponame, page, cache=None):
+    # fetches one page of forks of a repository
+    # returns the list of forks in that page and the number of the last page
+    request_url = "https://api.github.com/repos/{}/{}/forks".format(
+        username, reponame)
+    params = {"page": page, "per_page": FORKS_PER_PAGE}
+    r = None
+    if cache is not None:
+        j, links = cache.get(session, request_url, params=params)
+    else:
+        r = session.get(url=request_url, params=params)
+        count_http_request(r)
+        j = r.json()
+        links = r.links
+
+    if "message" in j:
+        logging.error("username: {}, repository: {}".format(username, reponame))
+        logging.error(j['message']
+              + " "
+              + j['documentation_url'])
+        if str(j['message']) == "Not Found":
+            return list(), 0
+        else:
+            raise GitHubAPIError(j['message'], None if r is None else r.status_code)
+
+    # the link to the last page is only given if there are several pages
+    last_page = page
+    if "last" in links:
+        last_page = int(parse_qs(urlparse(links["last"]["url"]).query)["page"][0])
+    return j, last_page
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Find all forks of a GitHub repository with the GitHub GraphQL API.
+# One query fetches several levels of the fork tree of several repositories at once,
+# together with the default branch head and the last push date of each fork,
+# which takes far fewer requests than the REST API (one request per page of 30 forks
+# per repository, see `get_Github_forks.py`).
+
+# Import `requests` library for API calls
+try:
+    import requests
+    import json
+    import logging
+    from instrumentation import count_http_request
+    from get_Github_forks import GitHubAPIError
+# If library not present, throw exception
+except ImportError:
+    print("Need `requests` library available")
+    exit(1)
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# number of forks requested per repository at each level of the fork tree in one query
+# GitHub rejects queries which could return more than 500,000 nodes, which is the product of these numbers
+# summed over the levels, times the number of repositories per query:
+# 10 * (100 + 100*10 + 100*10*10) = 111,000
+FORKS_PER_LEVEL = [100, 10, 10]
+REPOSITORIES_PER_QUERY = 10
+
+# fields requested for each fork, besides its own forks
+FORK_FIELDS = "owner { login } name pushedAt defaultBranchRef { name target { oid } }"
+
+##########
+# Build the queries
+##########
+
+def _forks_connection(level, cursor=None):
+    # returns the part of the query fetching the forks of a repository, and
+    # recursively the forks of the forks up to the last level of `FORKS_PER_LEVEL`
+    # below the last level, only the number of forks is requested
+    if level == len(FORKS_PER_LEVEL):
+        return "forks { totalCount }"
+    arguments = f"first: {FORKS_PER_LEVEL[level]}"
+    if cursor is not None:
+        arguments += f", after: {json.dumps(cursor)}"
+    return (f"forks({arguments}, orderBy: {{field: CREATED_AT, direction: ASC}}) "
+            f"{{ totalCount pageInfo {{ hasNextPage endCursor }} nodes {{ {FORK_FIELDS} {_forks_connection(level + 1)} }} }}")
+
+def _build_query(tasks):
+    # one aliased `repository` field per (owner, name, cursor) task
+    fields = list()
+    for i, (owner, name, cursor) in enumerate(tasks):
+        fields.append(f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {_forks_connection(0, cursor)} }}")
+    return "query { " + " ".join(fields) + " }"
+
+##########
+# Get the forks
+##########
+
+def get_Github_forks_graphql(username, reponame, forks, auth):
+    """
+    Finds all forks of a GitHub repository, like `get_Github_forks()`, with batched GraphQL queries.
+
+    Each query fetches up to `len(FORKS_PER_LEVEL)` levels of the fork tree of up to `REPOSITORIES_PER_QUERY`
+    repositories. Repositories with more forks than fetched in a query, or with forks below the last level,
+    are queried again (with the cursor of the next page), until the whole fork tree is known.
+
+    Besides the keys returned by `get_Github_forks()`, each record appended to `forks` has the date of the
+    last push (key "pushed_at"), the name of the default branch (key "default_branch") and the commit
+    at the head of the default branch (key "head"). The latter two are None for empty forks.
+
+    Parameters
+    ==========
+
+    `username` : str, required
+    `reponame` : str, required
+    `forks` : list, required
+    `auth` : str, required, GitHub authentication token (the GraphQL API can't be used anonymously)
+
+    Raises
+    ======
+
+    GitHubAPIError
+        If the GitHub API returns an error, e.g. bad credentials or an exceeded rate limit.
+    """
+
+    session = requests.Session()
+    session.headers.update({"Authorization": "bearer " + auth})
+
+    # repositories (and the cursor of the page) whose forks remain to be fetched
+    tasks = [(username, reponame, None)]
+    n_queries = 0
+    with session:
+        while len(tasks) > 0:
+            batch = tasks[:REPOSITORIES_PER_QUERY]
+            tasks = tasks[REPOSITORIES_PER_QUERY:]
+
+            r = session.post(url=GRAPHQL_URL, json={"query": _build_query(batch)})
+            count_http_request(r)
+            j = r.json()
+            r.close()
+            n_queries += 1
+
+            if "message" in j: # e.g. bad credentials, same format as REST API errors
+                logging.error("username: {}, repository: {}".format(username, reponame))
+                logging.error(j['message']
+                      + " "
+                      + j.get('documentation_url', ''))
+                raise GitHubAPIError(j['message'], r.status_code)
+
+            missing = set()
+            for error in j.get("errors", list()):
+                if error.get("type") == "NOT_FOUND":
+                    missing.add(error["path"][0])
+                    logging.error(error["message"])
+                else:
+                    logging.error("username: {}, repository: {}".format(username, reponame))
+                    logging.error(error["message"])
+                    # e.g. "RATE_LIMITED", returned with status 200
+                    raise GitHubAPIError(error.get("type", "") + ": " + error["message"], r.status_code)
+
+            for i, (owner, name, cursor) in enumerate(batch):
+                alias = "r" + str(i)
+                if alias in missing or j["data"][alias] is None:
+                    continue
+                tasks.extend(_read_forks(j["data"][alias]["forks"], owner, name, forks))
+
+    logging.debug(f"Fork tree of {username}/{reponame} retrieved with {n_queries} GraphQL queries")
+
+def _read_forks(connection, owner, name, forks):
+    # appends the forks of a connection (one level of the fork tree of repository owner/name) to `forks`
+    # and returns the tasks needed to fetch the rest of the tree below it
+    tasks = list()
+    if connection["pageInfo"]["hasNextPage"]:
+        tasks.append((owner, name, connection["pageInfo"]["endCursor"]))
+
+    for node in connection["nodes"]:
+        default_branch = node["defaultBranchRef"]
+        forks.append({'user': node['owner']['login'],
+                      'repo': node['name'],
+                      'parent_user': owner,
+                      'parent_repo': name,
+                      'pushed_at': node['pushedAt'],
+                      'default_branch': None if default_branch is None else default_branch['name'],
+                      'head': None if default_branch is None else default_branch['target']['oid']})
+
+        if "nodes" in node["forks"]:
+            tasks.extend(_read_forks(node["forks"], node['owner']['login'], node['name'], forks))
+        elif node["forks"]["totalCount"] > 0:
+            # last level of the query reached, the forks of this fork need their own query
+            tasks.append((node['owner']['login'], node['name'], None))
+    return tasks
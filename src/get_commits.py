@@ -14,14 +14,20 @@ import os
 import logging
 import shutil
 from sys import stderr
-from perceval.backends.core.git import Git
 from perceval.errors import RepositoryError # To handle errors with repositories
+from lazy_imports import lazy_import
+from fetch_state import update_fork_state
+from git_commands import run_git, GIT_LOG_OPTIONS
+from git_log_parser import iter_git_log
+from partial_clones import iter_partial_clone_commits
+
+perceval_git = lazy_import("perceval.backends.core.git") # Git backend, only loaded when commits are fetched
 
 ##########
 # Pull commits from a git repository
 ##########
 
-def get_commits(username, reponame, commits, config):
+def get_commits(username, reponame, commits, config, fork_entry=None):
     """
     TODO: Add docstring. See: https://realpython.com/documenting-python-code/
     TODO: Implement recursion argument, default to False.
@@ -32,6 +38,15 @@ def get_commits(username, reponame, commits, config):
     `username` : str, required
     `reponame` : str, required
     `commits` : list, required
+    `config` : dict, required, configuration returned by `initialise_options()`
+    `fork_entry` : dict, optional, entry of this fork in the fetch state (see `fetch_state.py`).
+        When the option "incremental" is set and the fork was fetched before, only the commits
+        pushed since the last fetch are added to `commits`. The entry is updated in place.
+
+    Returns
+    =======
+
+    dict: refs that moved since the last fetch (see `fetch_state.update_fork_state()`), empty if `fork_entry` is None
  
     Raises
     ======
@@ -41,6 +56,31 @@ def get_commits(username, reponame, commits, config):
         parameter.
     """
     
+    moved_refs = dict()
+    # the commits of the fork are only added once they are all fetched
+    new_commits = list(iter_commits(username, reponame, config, fork_entry=fork_entry, moved_refs=moved_refs))
+    commits.extend(new_commits)
+    return moved_refs
+
+def iter_commits(username, reponame, config, fork_entry=None, moved_refs=None):
+    """
+    Yields the commits of a fork one at a time, as they are parsed, instead of returning them all at once.
+    Same as `get_commits()` otherwise.
+
+    With `config["git_backend"]` "native", the log of the clone is parsed by `fetch_git_log()`
+    instead of perceval's `Git` backend, with the same commits as result.
+
+    Parameters
+    ==========
+
+    `username` : str, required
+    `reponame` : str, required
+    `config` : dict, required, configuration returned by `initialise_options()`
+    `fork_entry` : dict, optional, entry of this fork in the fetch state (see `get_commits()`)
+    `moved_refs` : dict, optional, filled with the refs that moved since the last fetch
+        (see `fetch_state.update_fork_state()`) while the commits are yielded
+    """
+    
     repo_URL = 'https://github.com/' + username + '/' + reponame
 
      # checks whether the export dir exists and if not creates it # TODO: this is a code snippet we use three times, we should make a function out of it
@@ -49,24 +89,125 @@ def get_commits(username, reponame, commits, config):
         os.makedirs(local_dir)
     data_dump_path = os.path.join(local_dir, username + '-' + reponame)
 
-    git = Git(repo_URL, data_dump_path)
+    incremental = config.get("incremental", False) and fork_entry is not None
+
+    # perceval only fetches the newest commits if it can rely on the objects of the previous clone,
+    # which is only guaranteed if we recorded a successful fetch of this fork (see issue 33 band aid below)
+    latest_items = incremental and 'last_commit' in fork_entry and os.path.isdir(data_dump_path)
+    if incremental and not latest_items and os.path.isdir(data_dump_path):
+        # clone left behind by a non incremental run, its pack files are gone
+        shutil.rmtree(data_dump_path, ignore_errors=True)
+    if latest_items:
+        last_commit_date = fork_entry['last_commit_date']
+
+    if config.get("git_backend", "perceval") == "native":
+        # `git log` of the clone, parsed by our own parser (see git_log_parser.py)
+        def fetch(latest_items=False):
+            known_tips = fork_entry.get('refs', dict()).values() if latest_items else None
+            return fetch_git_log(repo_URL, data_dump_path, known_tips=known_tips, workers=config.get("parse_workers", 1),
+                                 clone_filter=config.get("clone_filter"), line_stats=config.get("line_stats", "all") == "all",
+                                 line_stats_exclude=config.get("line_stats_exclude") or list())
+    else:
+        if config.get("clone_filter"):
+            logging.warning(f"Partial clones need the native git backend: {username}/{reponame} is cloned in full")
+        git = perceval_git.Git(repo_URL, data_dump_path)
+
+        # `fetch()` gets commits from all branches by default.
+        # It returns a list of dictionaries, where the `data` key in each
+        # dictionary contains the actual metadata for each commit.
+        # Other stuff are metadata about the perceval `fetch()` operation.
+        def fetch(latest_items=False):
+            return (commit_data["data"] for commit_data in git.fetch(latest_items=latest_items))
+
+    def keep_data(commit):
+        # record the commit in the fetch state
+        if fork_entry is not None:
+            refs = update_fork_state(fork_entry, [commit])
+            if moved_refs is not None:
+                moved_refs.update(refs)
+        return commit
     
-    # `fetch()` gets commits from all branches by default.
-    # It returns a list of dictionaries, where the `data` key in each
-    # dictionary contains the actual metadata for each commit.
-    # Other stuff are metadata about the perceval `fetch()` operation.
+    n_commits = 0
     try:
-        repo_fetched = [commit for commit in git.fetch()]
+        try:
+            for commit in fetch(latest_items=latest_items):
+                n_commits += 1
+                yield keep_data(commit)
+        except RepositoryError as sync_error:
+            if not latest_items:
+                raise
+            # e.g. history rewritten by a force push: start again from a fresh clone
+            logging.warning(f"Incremental fetch of {username}/{reponame} failed ({sync_error}), fetching it again from scratch")
+            shutil.rmtree(data_dump_path, ignore_errors=True)
+            fork_entry.clear()
+            latest_items = False
+            for commit in fetch():
+                n_commits += 1
+                yield keep_data(commit)
 
-        # issue 33 (very ugly) band aid: delete *.pack files once downloaded by perceval
-        shutil.rmtree(os.path.join(data_dump_path, 'objects','pack'), ignore_errors=True)
-        
-        # Keep just commit `data`
-        for commit_data in repo_fetched:
-            commits.append(commit_data["data"])
+        if not incremental:
+            # issue 33 (very ugly) band aid: delete *.pack files once downloaded by perceval
+            # (not in incremental mode, the next fetch needs them)
+            shutil.rmtree(os.path.join(data_dump_path, 'objects','pack'), ignore_errors=True)
     except RepositoryError as repo_error:
-        logging.warning("Error with this repository: " + username + "/" + reponame, file=stderr)
-        pass
+        logging.warning("Error with this repository: " + username + "/" + reponame + f" ({repo_error})")
+        return
+
+    if fork_entry is not None:
+        update_fork_state(fork_entry, list()) # records the time of the fetch even without new commits
+    if latest_items:
+        logging.info(f"{n_commits} new commits in {username}/{reponame} since {last_commit_date}")
+
+def fetch_git_log(repo_URL, clone_path, known_tips=None, workers=1, clone_filter=None, line_stats=True, line_stats_exclude=()):
+    """
+    Clones a repository (bare, like perceval), or updates its clone, and yields the commits of all its
+    branches and tags, oldest first, parsed from `git log` by `workers` processes (see `iter_git_log()`).
+    The commits are the same as the `data` of the items fetched by perceval's `Git` backend.
+
+    Parameters
+    ==========
+
+    `repo_URL` : str, required
+    `clone_path` : str, required, path of the clone
+    `known_tips` : iterable of str, optional, SHAs of commits already mined: the clone is updated, and these
+        commits and their ancestors are skipped. If None, the repository is cloned again from scratch
+        (the objects of a previous clone may be gone, see issue 33 in `iter_commits()`).
+    `workers` : int, optional, number of processes parsing the log
+    `clone_filter` : str, optional, object filter of a partial clone (e.g. "blob:none"), see partial_clones.py
+    `line_stats` : bool, optional, compute the line counts of the file changes in a partial clone
+    `line_stats_exclude` : list of str, optional, glob patterns of the files whose line counts are not computed in a partial clone
+
+    Raises
+    ======
+
+    RepositoryError
+        If the repository can't be cloned or updated.
+    """
+    if known_tips is None:
+        shutil.rmtree(clone_path, ignore_errors=True)
+        known_tips = list()
+    if os.path.isdir(clone_path):
+        run_git(['fetch', '--quiet', '--prune', 'origin', '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*'], cwd=clone_path)
+    elif clone_filter:
+        run_git(['clone', '--quiet', '--bare', '--filter=' + clone_filter, repo_URL, clone_path])
+    else:
+        run_git(['clone', '--quiet', '--bare', repo_URL, clone_path])
+
+    exclusions = list()
+    known_tips = sorted(set(known_tips))
+    if len(known_tips) > 0:
+        # tips no longer in the clone (e.g. garbage collected after a force push) can't be excluded
+        objects = run_git(['cat-file', '--batch-check'], cwd=clone_path, input_lines=known_tips).splitlines()
+        exclusions = ['^' + line.split()[0] for line in objects if not line.endswith(' missing')]
+
+    if clone_filter:
+        # the clone has the commits and trees, not (all) the contents of the files
+        yield from iter_partial_clone_commits(['--branches', '--tags', '--stdin'],
+                                              clone_path, input_lines=exclusions, workers=workers,
+                                              line_stats=line_stats, line_stats_exclude=line_stats_exclude)
+    else:
+        yield from iter_git_log(['log', '--reverse', '--topo-order'] + GIT_LOG_OPTIONS + ['--branches', '--tags', '--stdin'],
+                                cwd=clone_path, input_lines=exclusions, workers=workers)
 
  
         
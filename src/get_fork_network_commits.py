@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Get the commits of all forks of a repository through one shared git object store.
+# Each fork is added as a remote of a single bare repository, so objects shared by
+# several forks are downloaded and stored only once, and the commits of each fork
+# are then listed from the refs of its remote.
+
+##########
+# Import libraries
+##########
+
+import os
+import logging
+from perceval.errors import RepositoryError, ParseError # To handle errors with repositories
+from lazy_imports import lazy_import
+from git_commands import run_git, iter_git_lines, GIT_LOG_OPTIONS
+from git_log_parser import iter_git_log
+from fetch_state import fork_state, update_fork_state, ref_name
+
+perceval_git = lazy_import("perceval.backends.core.git") # git log parser, only loaded when commits are parsed
+
+# namespaces of the refs fetched from each fork, e.g. "refs/remotes/<user>/<repo>/master"
+# tags get their own namespace, otherwise tags with the same name in several forks would overwrite each other
+HEADS_NAMESPACE = 'refs/remotes/'
+TAGS_NAMESPACE = 'refs/fork-tags/'
+
+##########
+# Shared object store
+##########
+
+def remote_name(fork):
+    """
+    Name of the remote of a fork in the shared object store: "<user>/<repo>".
+    """
+    return fork['user'] + '/' + fork['repo']
+
+def init_network_store(store_path, forks):
+    """
+    Creates the shared (bare) repository if needed and declares each fork as a remote.
+
+    Parameters
+    ==========
+
+    `store_path` : str, required, path of the shared repository
+    `forks` : list of dicts, required, forks as returned by `get_Github_forks()`
+    """
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path)
+        run_git(['init', '--quiet', '--bare'], cwd=store_path)
+
+    known_remotes = run_git(['remote'], cwd=store_path).split()
+    for fork in forks:
+        remote = remote_name(fork)
+        if remote in known_remotes:
+            continue
+        run_git(['remote', 'add', '--no-tags', remote, 'https://github.com/' + remote], cwd=store_path)
+        run_git(['config', '--replace-all', 'remote.' + remote + '.fetch',
+                 '+refs/heads/*:' + HEADS_NAMESPACE + remote + '/*'], cwd=store_path)
+        run_git(['config', '--add', 'remote.' + remote + '.fetch',
+                 '+refs/tags/*:' + TAGS_NAMESPACE + remote + '/*'], cwd=store_path)
+
+def fetch_fork(store_path, fork):
+    """
+    Fetches the refs of a fork into the shared repository, only the objects not yet stored are transferred.
+
+    Returns
+    =======
+
+    bool: True if the fork could be fetched
+    """
+    remote = remote_name(fork)
+    try:
+        run_git(['fetch', '--quiet', '--prune', '--no-tags', remote], cwd=store_path)
+    except RepositoryError as repo_error:
+        logging.warning("Error with this repository: " + remote + f" ({repo_error})")
+        return False
+    try:
+        # record the default branch of the fork, needed to rebuild the "HEAD -> ..." decoration
+        run_git(['remote', 'set-head', remote, '--auto'], cwd=store_path)
+    except RepositoryError:
+        logging.debug(f"Can't determine the default branch of {remote}")
+    return True
+
+def list_fork_refs(store_path, fork):
+    """
+    Lists the refs of a fork, decorated the way `git log --decorate=full` decorates them in a clone of that fork.
+
+    Returns
+    =======
+
+    dict: commit SHA -> list of refs (e.g. ["HEAD -> refs/heads/master", "tag: refs/tags/v1"])
+    """
+    remote = remote_name(fork)
+    heads_prefix = HEADS_NAMESPACE + remote + '/'
+    tags_prefix = TAGS_NAMESPACE + remote + '/'
+
+    try:
+        default_branch = run_git(['symbolic-ref', '--quiet', heads_prefix + 'HEAD'], cwd=store_path).strip()[len(heads_prefix):]
+    except RepositoryError:
+        default_branch = None
+
+    # `%(*objectname)` is the commit an annotated tag points to
+    output = run_git(['for-each-ref', '--format=%(objectname) %(*objectname) %(refname)', heads_prefix, tags_prefix], cwd=store_path)
+
+    # rename the refs as they are named in a clone of the fork
+    renamed_refs = list()
+    for line in output.splitlines():
+        object_sha, peeled_sha, ref = line.split(' ', 2)
+        commit_sha = peeled_sha if peeled_sha != '' else object_sha
+        if ref.startswith(tags_prefix):
+            renamed_refs.append(('refs/tags/' + ref[len(tags_prefix):], commit_sha))
+        elif ref[len(heads_prefix):] != 'HEAD':
+            renamed_refs.append(('refs/heads/' + ref[len(heads_prefix):], commit_sha))
+
+    # git decorates a commit with its refs in the reverse order of their names, the current branch (HEAD) first
+    refs_by_commit = dict()
+    for ref, commit_sha in sorted(renamed_refs, reverse=True):
+        if ref == 'refs/heads/' + str(default_branch):
+            refs_by_commit.setdefault(commit_sha, list()).insert(0, 'HEAD -> ' + ref)
+        elif ref.startswith('refs/tags/'):
+            refs_by_commit.setdefault(commit_sha, list()).append('tag: ' + ref)
+        else:
+            refs_by_commit.setdefault(commit_sha, list()).append(ref)
+    return refs_by_commit
+
+##########
+# Pull commits from all forks of a repository
+##########
+
+def get_fork_network_commits(username, reponame, forks, config, fetch_state=None):
+    """
+    Fetches all forks of a repository into one shared object store and lists the commits of each fork.
+
+    The result is the same as calling `get_commits()` on each fork: each fork gets the list of
+    all commits reachable from its branches and tags, in the same format, and with the refs of
+    that fork. Commits shared by several forks are parsed only once (the dicts are shared
+    between the lists, except for commits with refs, which get one copy per fork).
+
+    Parameters
+    ==========
+
+    `username` : str, required, owner of the repository at the root of the fork network
+    `reponame` : str, required, name of the repository at the root of the fork network
+    `forks` : list of dicts, required, forks as returned by `get_Github_forks()`
+    `config` : dict, required, configuration returned by `initialise_options()`
+    `fetch_state` : dict, optional, fetch state of the repository (see `fetch_state.py`).
+        In incremental mode, only commits not reachable from the refs recorded in the
+        state are listed, and the state is updated in place.
+
+    Returns
+    =======
+
+    list of tuples: (commits, moved_refs) for each fork, in the same order as `forks`, where `moved_refs` is
+    the value `get_commits()` would return for this fork
+    """
+    local_dir = os.path.join(config["data_dir"], 'grimoire_dumps')
+    if not os.path.isdir(local_dir):
+        os.makedirs(local_dir)
+    store_path = os.path.join(local_dir, username + '-' + reponame + '.network')
+
+    incremental = config.get("incremental", False) and fetch_state is not None
+    if config.get("clone_filter"):
+        logging.warning(f"Partial clones are not used in fork network mode: the forks of {username}/{reponame} are fetched in full")
+
+    try:
+        init_network_store(store_path, forks)
+    except RepositoryError as repo_error:
+        logging.warning("Error with the fork network of this repository: " + username + "/" + reponame + f" ({repo_error})")
+        return [(list(), dict()) for fork in forks]
+
+    # fetch the forks one by one: from the second one on, only the objects
+    # unique to the fork are transferred
+    fetched = [fetch_fork(store_path, fork) for fork in forks]
+    fork_refs = [list_fork_refs(store_path, fork) if ok else dict() for fork, ok in zip(forks, fetched)]
+
+    # commits already mined by a previous run, reachable from the refs recorded in the state
+    known_tips = set()
+    if incremental:
+        for fork_entry in fetch_state['forks'].values():
+            if 'last_commit' in fork_entry:
+                known_tips.update(fork_entry.get('refs', dict()).values())
+        # tips deleted from the store since (e.g. garbage collected) can't be excluded
+        if len(known_tips) > 0:
+            try:
+                objects = run_git(['cat-file', '--batch-check'], cwd=store_path, input_lines=sorted(known_tips)).splitlines()
+            except RepositoryError as repo_error:
+                logging.warning("Error with the fork network of this repository: " + username + "/" + reponame + f" ({repo_error})")
+                return [(list(), dict()) for fork in forks]
+            known_tips = set(line.split()[0] for line in objects if not line.endswith(' missing'))
+    exclusions = ['^' + sha for sha in sorted(known_tips)]
+
+    # parse the log of all (new) commits of the network once
+    all_tips = sorted(set(sha for refs in fork_refs for sha in refs))
+    network_commits = dict()
+    if len(all_tips) > 0:
+        # the refs of each fork are added below, the commits are listed without them
+        log_args = ['log', '--reverse', '--topo-order'] + [option for option in GIT_LOG_OPTIONS if option != '--decorate=full'] + ['--stdin']
+        try:
+            if config.get("git_backend", "perceval") == "native":
+                parsed_commits = iter_git_log(log_args, cwd=store_path, input_lines=all_tips + exclusions,
+                                              workers=config.get("parse_workers", 1))
+            else:
+                parsed_commits = perceval_git.GitParser(iter_git_lines(log_args, cwd=store_path, input_lines=all_tips + exclusions)).parse()
+            for commit in parsed_commits:
+                network_commits[commit['commit']] = commit
+        except (RepositoryError, ParseError) as log_error:
+            logging.warning("Error with the fork network of this repository: " + username + "/" + reponame + f" ({log_error})")
+            return [(list(), dict()) for fork in forks]
+    logging.info(f"{len(network_commits)} unique commits in the fork network of {username}/{reponame}")
+
+    # split the commits of the network per fork
+    results = list()
+    for fork, ok, refs_by_commit in zip(forks, fetched, fork_refs):
+        commits = list()
+        if len(refs_by_commit) > 0:
+            try:
+                shas = run_git(['rev-list', '--reverse', '--topo-order', '--stdin'], cwd=store_path,
+                               input_lines=sorted(refs_by_commit) + exclusions).split()
+            except RepositoryError as repo_error:
+                logging.warning("Error with this repository: " + remote_name(fork) + f" ({repo_error})")
+                results.append((list(), dict()))
+                continue
+            for sha in shas:
+                commit = network_commits[sha]
+                if sha in refs_by_commit:
+                    commit = dict(commit, refs=refs_by_commit[sha])
+                commits.append(commit)
+        moved_refs = dict()
+        if incremental and ok:
+            # all refs of the fork are known, including those moved to commits mined by a previous run
+            current_refs = {ref_name(ref): sha for sha, refs in refs_by_commit.items() for ref in refs}
+            moved_refs = update_fork_state(fork_state(fetch_state, fork['user'], fork['repo']), commits, current_refs=current_refs)
+        results.append((commits, moved_refs))
+    return results
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Run git commands on the local clones under `grimoire_dumps/`.
+# Errors are reported with perceval's `RepositoryError`, so callers can handle
+# them the same way as errors raised by perceval's `Git` backend.
+
+##########
+# Import libraries
+##########
+
+import os
+import logging
+import subprocess
+from perceval.errors import RepositoryError # To handle errors with repositories
+
+# same environment as perceval, so the output of git is never localised
+GIT_ENV = {
+    'LANG': 'C',
+    'HOME': os.getenv('HOME', ''),
+    'PATH': os.getenv('PATH', ''),
+    'GIT_TERMINAL_PROMPT': '0' # fail instead of asking for credentials (e.g. for deleted forks)
+}
+
+# options of `git log` expected by perceval's `GitParser` (see `GitParser` docstring)
+GIT_LOG_OPTIONS = ['--raw', '--numstat', '--pretty=fuller', '--decorate=full', '--parents', '-M', '-C', '-c']
+
+##########
+# Run git
+##########
+
+def run_git(args, cwd=None, input_lines=None):
+    """
+    Runs a git command and returns its output.
+
+    Parameters
+    ==========
+
+    `args` : list of str, required, arguments passed to git (without the leading 'git')
+    `cwd` : str, optional, directory in which git is run
+    `input_lines` : list of str, optional, lines passed to git on its standard input (e.g. for `--stdin`)
+
+    Returns
+    =======
+
+    str: standard output of the command
+
+    Raises
+    ======
+
+    RepositoryError
+        If git can't be run or exits with a non zero status.
+    """
+    logging.debug(f"Running git {' '.join(args)} in {cwd}")
+    try:
+        proc = subprocess.run(
+            ['git'] + args, cwd=cwd, env=GIT_ENV,
+            input=None if input_lines is None else ''.join(line + '\n' for line in input_lines).encode('utf-8'),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as os_error:
+        raise RepositoryError(cause=str(os_error))
+    if proc.returncode != 0:
+        raise RepositoryError(cause="git command - " + proc.stderr.decode('utf-8', errors='surrogateescape'))
+    return proc.stdout.decode('utf-8', errors='surrogateescape')
+
+def iter_git_lines(args, cwd=None, input_lines=None):
+    """
+    Runs a git command and yields its output line by line while it is running,
+    so long outputs (e.g. `git log`) never have to fit in memory.
+
+    Parameters and exceptions are the same as for `run_git()`.
+    """
+    logging.debug(f"Running git {' '.join(args)} in {cwd}")
+    try:
+        proc = subprocess.Popen(
+            ['git'] + args, cwd=cwd, env=GIT_ENV,
+            stdin=None if input_lines is None else subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as os_error:
+        raise RepositoryError(cause=str(os_error))
+    if input_lines is not None:
+        proc.stdin.write(''.join(line + '\n' for line in input_lines).encode('utf-8'))
+        proc.stdin.close()
+    try:
+        for line in proc.stdout:
+            yield line.decode('utf-8', errors='surrogateescape')
+    finally:
+        proc.stdout.close()
+        errors = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RepositoryError(cause="git command - " + errors.decode('utf-8', errors='surrogateescape'))
+
+def iter_git_output(args, cwd=None, input_lines=None, block_size=1024 * 1024):
+    """
+    Runs a git command and yields its raw output (bytes) in blocks of up to `block_size` bytes while it is running,
+    for outputs parsed in bulk rather than line by line (see git_log_parser.py).
+
+    Parameters and exceptions are the same as for `run_git()`.
+    """
+    logging.debug(f"Running git {' '.join(args)} in {cwd}")
+    try:
+        proc = subprocess.Popen(
+            ['git'] + args, cwd=cwd, env=GIT_ENV,
+            stdin=None if input_lines is None else subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as os_error:
+        raise RepositoryError(cause=str(os_error))
+    if input_lines is not None:
+        proc.stdin.write(''.join(line + '\n' for line in input_lines).encode('utf-8'))
+        proc.stdin.close()
+    try:
+        while True:
+            block = proc.stdout.read1(block_size)
+            if len(block) == 0:
+                break
+            yield block
+    finally:
+        proc.stdout.close()
+        errors = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RepositoryError(cause="git command - " + errors.decode('utf-8', errors='surrogateescape'))
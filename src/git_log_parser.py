@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Parse the output of `git log` (with `GIT_LOG_OPTIONS`) into commits, without perceval's `Git` backend.
+# The output is cut into chunks of whole commits, which are parsed by several worker processes,
+# and the commits are the same dicts as the `data` of the items fetched by perceval.
+
+##########
+# Import libraries
+##########
+
+import re
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from perceval.errors import ParseError
+from git_commands import iter_git_output
+
+# size of the chunks of `git log` output parsed by each worker process
+CHUNK_SIZE = 4 * 1024 * 1024
+
+##########
+# Parser
+##########
+
+# same patterns as perceval's `GitParser`, so both parsers give the same commits
+COMMIT_PATTERN = r"""^commit[ \t](?P<commit>[a-f0-9]{40})
+                 (?:[ \t](?P<parents>[a-f0-9][a-f0-9 \t]+))?
+                 (?:[ \t]\((?P<refs>.+)\))?$
+                 """
+HEADER_TRAILER_PATTERN = r"^(?P<name>[a-zA-z0-9\-]+)\:[ \t]+(?P<value>.+)$"
+ACTION_PATTERN = r"""^(?P<sc>\:+)
+                  (?P<modes>(?:\d{6}[ \t])+)
+                  (?P<indexes>(?:[a-f0-9]+\.{,3}[ \t])+)
+                  (?P<action>[^\t]+)\t+
+                  (?P<file>[^\t]+)
+                  (?:\t+(?P<newfile>.+))?$"""
+STATS_PATTERN = r"^(?P<added>\d+|-)\t+(?P<removed>\d+|-)\t+(?P<file>.+)$"
+
+COMMIT_REGEXP = re.compile(COMMIT_PATTERN, re.VERBOSE)
+HEADER_TRAILER_REGEXP = re.compile(HEADER_TRAILER_PATTERN, re.VERBOSE)
+ACTION_REGEXP = re.compile(ACTION_PATTERN, re.VERBOSE)
+STATS_REGEXP = re.compile(STATS_PATTERN, re.VERBOSE)
+
+# trailers of commit messages kept in the commits (e.g. "Signed-off-by": [...])
+TRAILERS = {
+    "Acked-by",
+    "Co-authored-by",
+    "Helped-by",
+    "Mentored-by",
+    "Reported-by",
+    "Reviewed-by",
+    "Signed-off-by",
+    "Suggested-by",
+    "Tested-by",
+}
+
+# states of the parser: before the first commit, then the parts of each commit
+INIT, COMMIT, HEADER, MESSAGE, FILE = range(5)
+
+def _split_list(data, separator=' '):
+    if not data:
+        return list()
+    return [item.strip() for item in data.strip().split(separator)]
+
+def _new_file_path(file_path):
+    # path after a move or rename in the stats: 'old => new', '{old => new}/name' or 'name/{old => new}'
+    i = file_path.find('{')
+    j = file_path.find('}')
+    if i > -1 and j > -1:
+        new_file_path = file_path[0:i] + file_path[file_path.find(' => ', i) + 4:j] + file_path[j + 1:]
+        # e.g. 'dir/{ => subdir}/name'
+        return new_file_path.replace('//', '/')
+    elif ' => ' in file_path:
+        return file_path.split(' => ')[1]
+    return file_path
+
+def _guess_new_file_path(file_path, commit_files):
+    # path after a move or rename when the file name itself contains '{', '}' or ' => ' (see perceval's GitParser)
+    parts = file_path.split(' => ')
+    for i in range(1, len(parts)):
+        before = ' => '.join(parts[:i]).replace('{', '')
+        after = ' => '.join(parts[i:]).replace('}', '')
+        for changed_file in commit_files.values():
+            if not changed_file.get('newfile') or not changed_file.get('file'):
+                continue
+            if changed_file['file'].replace('{', '').startswith(before) and changed_file['newfile'].replace('}', '').endswith(after):
+                return changed_file['newfile']
+    if file_path in commit_files:
+        return file_path
+    return None
+
+def _build_commit(commit, commit_files, pending_files):
+    # the stats of moved or renamed files are listed under a combined path, matched here with their action
+    for stats in pending_files.values():
+        file_path = stats['file']
+        if file_path in commit_files:
+            commit_files[file_path]['added'] = stats['added']
+            commit_files[file_path]['removed'] = stats['removed']
+            continue
+        if ' => ' not in file_path:
+            commit_files[file_path] = stats
+            continue
+        new_file_path = _new_file_path(file_path)
+        if new_file_path not in commit_files:
+            new_file_path = _guess_new_file_path(file_path, commit_files) or new_file_path
+        if new_file_path in commit_files:
+            commit_files[new_file_path]['added'] = stats['added']
+            commit_files[new_file_path]['removed'] = stats['removed']
+        else:
+            commit_files[new_file_path] = stats
+
+    commit['files'] = [commit_files[file_path] for file_path in sorted(commit_files)]
+    return commit
+
+def parse_git_log(lines):
+    """
+    Parses the lines of the output of `git log` with `GIT_LOG_OPTIONS` (see git_commands.py).
+
+    The commits are the same as those parsed by perceval's `GitParser`: keys "commit", "parents", "refs",
+    the headers ("Author", "AuthorDate", "Commit", "CommitDate", "Merge"...), "message", the trailers of
+    the message ("Signed-off-by"...) and "files" (keys "file", "added", "removed", "action", "modes", "indexes"
+    and "newfile" for moved or renamed files).
+
+    Parameters
+    ==========
+
+    `lines` : iterable of str, required, lines of the log, without their trailing newline
+
+    Returns
+    =======
+
+    list of dicts: commits, in the order of the log
+
+    Raises
+    ======
+
+    ParseError
+        If a commit line or a header is malformed.
+    """
+    commits = list()
+    state = INIT
+    commit = None
+    commit_files, pending_files = dict(), dict()
+
+    for nline, line in enumerate(lines, 1):
+        parsed = False
+        while not parsed:
+            # a line which doesn't belong to the current part is parsed again in the next state
+            if state == FILE:
+                if line == '':
+                    state, parsed = COMMIT, True
+                else:
+                    match = ACTION_REGEXP.match(line)
+                    if match:
+                        colons, modes, indexes, action, file_path, new_file_path = match.groups()
+                        changed_file = commit_files.setdefault(new_file_path if new_file_path else file_path, dict())
+                        # git separates modes and indexes with single spaces, so split() is enough
+                        changed_file['modes'] = modes.split() if '\t' not in modes else _split_list(modes)
+                        changed_file['indexes'] = indexes.split() if '\t' not in indexes else _split_list(indexes)
+                        changed_file['action'] = action
+                        changed_file['file'] = file_path
+                        if new_file_path is not None:
+                            changed_file['newfile'] = new_file_path
+                        else:
+                            changed_file.pop('newfile', None)
+                        parsed = True
+                    else:
+                        match = STATS_REGEXP.match(line)
+                        if match:
+                            added, removed, file_path = match.groups()
+                            if file_path in commit_files:
+                                commit_files[file_path]['added'] = added
+                                commit_files[file_path]['removed'] = removed
+                            else:
+                                pending_files[file_path] = {'file': file_path, 'added': added, 'removed': removed}
+                            parsed = True
+                        else:
+                            logging.debug(f"Invalid action format on line {nline}. Skipping.")
+                            state = COMMIT
+            elif state == MESSAGE:
+                if line == '':
+                    state, parsed = FILE, True
+                elif len(line) >= 4 and line[:4].isspace():
+                    message_line = line[4:]
+                    if 'message' in commit:
+                        commit['message'] += '\n' + message_line
+                    else:
+                        commit['message'] = message_line
+                    if ':' in message_line:
+                        match = HEADER_TRAILER_REGEXP.match(message_line)
+                        if match and match.group('name').capitalize() in TRAILERS:
+                            commit.setdefault(match.group('name').capitalize(), list()).append(match.group('value'))
+                    parsed = True
+                else:
+                    logging.debug(f"Invalid message format on line {nline}. Skipping.")
+                    state = FILE
+            elif state == HEADER:
+                if line == '':
+                    state = MESSAGE
+                else:
+                    match = HEADER_TRAILER_REGEXP.match(line)
+                    if not match:
+                        raise ParseError(cause=f"invalid header format on line {nline}")
+                    commit[match.group('name')] = match.group('value')
+                parsed = True
+            elif state == COMMIT:
+                match = COMMIT_REGEXP.match(line)
+                if not match:
+                    raise ParseError(cause=f"commit expected on line {nline}")
+                commit = {
+                    'commit': match.group('commit'),
+                    'parents': _split_list(match.group('parents')),
+                    'refs': _split_list(match.group('refs'), separator=',')
+                }
+                state, parsed = HEADER, True
+            else:
+                # one empty line is allowed before the first commit
+                state, parsed = COMMIT, line == ''
+
+            if state == COMMIT and commit is not None:
+                commits.append(_build_commit(commit, commit_files, pending_files))
+                commit = None
+                commit_files, pending_files = dict(), dict()
+
+    if commit is not None:
+        commits.append(_build_commit(commit, commit_files, pending_files))
+    return commits
+
+def parse_git_log_chunk(chunk):
+    """
+    Parses a chunk of `git log` output made of whole commits (bytes, see `iter_log_chunks()`).
+    """
+    lines = chunk.decode('utf-8', errors='surrogateescape').split('\n')
+    if lines[-1] == '':
+        # the newline ending the chunk doesn't start another line
+        del lines[-1]
+    return parse_git_log(lines)
+
+##########
+# Parallel parsing
+##########
+
+def iter_log_chunks(blocks, chunk_size=CHUNK_SIZE):
+    """
+    Regroups the blocks of bytes of a `git log` output into chunks of whole commits of about `chunk_size` bytes.
+    A chunk ends before a line starting with "commit " (lines of commit messages are indented, so they never do).
+    """
+    buffered, buffered_size = list(), 0
+    for block in blocks:
+        buffered.append(block)
+        buffered_size += len(block)
+        if buffered_size < chunk_size:
+            continue
+        buffer = b''.join(buffered)
+        cut = buffer.rfind(b'\ncommit ')
+        if cut > 0:
+            yield buffer[:cut + 1]
+            buffer = buffer[cut + 1:]
+        buffered, buffered_size = [buffer], len(buffer)
+    buffer = b''.join(buffered)
+    if len(buffer) > 0:
+        yield buffer
+
+def iter_git_log(args, cwd=None, input_lines=None, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Runs `git log` and yields its commits in order, parsed (see `parse_git_log()`) by up to `workers` processes
+    while git is still writing the log.
+
+    Parameters
+    ==========
+
+    `args` : list of str, required, arguments of git (starting with "log", and including `GIT_LOG_OPTIONS`)
+    `cwd` : str, optional, directory in which git is run
+    `input_lines` : list of str, optional, lines passed to git on its standard input (e.g. for `--stdin`)
+    `workers` : int, optional, number of processes parsing the log, 1 to parse it in this process
+    `chunk_size` : int, optional, size in bytes of the chunks of log parsed at once
+
+    Raises
+    ======
+
+    RepositoryError
+        If git fails (see `run_git()`).
+    """
+    chunks = iter_log_chunks(iter_git_output(args, cwd=cwd, input_lines=input_lines), chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from parse_git_log_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # a few chunks ahead per worker, so the workers never wait and the memory stays bounded
+        parsing = deque()
+        for chunk in chunks:
+            parsing.append(executor.submit(parse_git_log_chunk, chunk))
+            if len(parsing) >= 2 * workers:
+                yield from parsing.popleft().result()
+        while len(parsing) > 0:
+            yield from parsing.popleft().result()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# On-disk cache of GitHub API responses.
+# Cached responses are revalidated with conditional requests (`If-None-Match` / `If-Modified-Since`):
+# GitHub answers "304 Not Modified" when nothing changed, and such answers don't count against the rate limit.
+
+##########
+# Import libraries
+##########
+
+import hashlib
+import json
+import os
+import logging
+import threading
+import time
+
+from instrumentation import count_http_request
+
+##########
+# Cache of GitHub API responses
+##########
+
+class GitHubResponseCache:
+    """
+    Stores the body, `ETag` and `Last-Modified` headers of GitHub API responses in `cache_dir`,
+    one file per URL and query parameters (e.g. one per page of forks of a repository).
+
+    Entries not used for `max_age` seconds are evicted, as well as the least recently used
+    entries when the cache grows bigger than `max_size` bytes (see `evict()`).
+
+    The counters `hits` (304 answers), `misses` (full answers), `bytes_saved` and the time spent
+    on both kinds of requests tell how much API budget and time the cache saves (see `statistics()`).
+    A cache can be shared by several threads.
+    """
+
+    def __init__(self, cache_dir, max_age=7*24*3600, max_size=100*1024*1024):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size = max_size
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, url, params):
+        key = url + "?" + "&".join(f"{name}={params[name]}" for name in sorted(params))
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _load_entry(self, entry_path):
+        try:
+            with open(entry_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def get(self, http, url, params, headers=None):
+        """
+        Requests `url` with a conditional request if a response is cached, and returns the body of the response.
+
+        Parameters
+        ==========
+
+        `http` : object with a `get(url, params, headers)` method, required, e.g. the `requests` module or a `requests.Session`
+        `url` : str, required
+        `params` : dict, required, query parameters (part of the cache key)
+        `headers` : dict, optional, additional request headers
+
+        Returns
+        =======
+
+        tuple: decoded JSON body and parsed `Link` header (see `requests.Response.links`)
+        """
+        entry_path = self._entry_path(url, params)
+        entry = self._load_entry(entry_path)
+
+        request_headers = dict(headers or dict())
+        if entry is not None:
+            if entry["etag"] is not None:
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        start_time = time.monotonic()
+        r = http.get(url=url, params=params, headers=request_headers)
+        elapsed = time.monotonic() - start_time
+        count_http_request(r)
+
+        if r.status_code == 304 and entry is not None:
+            r.close()
+            with self._lock:
+                self.hits += 1
+                self.hit_seconds += elapsed
+                self.bytes_saved += entry["size"]
+            # mark the entry as recently used, for eviction
+            try:
+                os.utime(entry_path)
+            except OSError as cache_error:
+                # e.g. evicted by another process meanwhile: the response is still valid
+                logging.debug(f"Can't mark the cache entry {entry_path} as used: {cache_error}")
+            return entry["body"], entry["links"]
+
+        body = r.json()
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+        if r.status_code == 200 and ("ETag" in r.headers or "Last-Modified" in r.headers):
+            entry = {
+                "url": url,
+                "params": params,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "links": r.links,
+                "size": len(r.content),
+                "body": body
+            }
+            # written under a temporary name first, so other processes never read a partial entry
+            temporary_path = entry_path + "." + str(os.getpid()) + "." + str(threading.get_ident())
+            with open(temporary_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(temporary_path, entry_path)
+        links = r.links
+        r.close()
+        return body, links
+
+    def evict(self):
+        """
+        Removes the entries not used for `max_age` seconds, then the least recently used entries
+        until the cache is smaller than `max_size` bytes.
+
+        Returns
+        =======
+
+        int: number of evicted entries
+        """
+        now = time.time()
+        entries = list()
+        evicted = 0
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                entry_stat = os.stat(entry_path)
+                if now - entry_stat.st_mtime > self.max_age:
+                    os.remove(entry_path)
+                    evicted += 1
+                else:
+                    entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+            except FileNotFoundError: # removed by another process in the meantime
+                continue
+
+        total_size = sum(size for mtime, size, entry_path in entries)
+        for mtime, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return evicted
+
+    def statistics(self):
+        """
+        Returns the counters of the cache, with the estimated time saved by the 304 answers
+        (difference between the average duration of full and 304 answers).
+        """
+        with self._lock:
+            saved_seconds = 0.0
+            if self.hits > 0 and self.misses > 0:
+                saved_seconds = self.hits * max(0.0, self.miss_seconds / self.misses - self.hit_seconds / self.hits)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "saved_seconds": saved_seconds
+            }
+
+    def log_statistics(self):
+        statistics = self.statistics()
+        logging.info(f"GitHub API cache: {statistics['hits']} requests answered by 304 (not counted against the rate limit), "
+                     f"{statistics['misses']} full answers, {statistics['bytes_saved']} bytes and "
+                     f"~{statistics['saved_seconds']:.1f} s saved")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# export formats of the graphs (commit history, file change history, committer graph),
+# each with a writer and a reader, so exported graphs can be loaded back
+##########
+
+##########
+# Import libraries
+##########
+import json
+import numbers
+import os
+
+from lazy_imports import lazy_import
+from export_writers import COMPRESSED_SUFFIX, open_export, write_GraphML, write_node_link_JSON
+
+np = lazy_import("numpy")
+nx = lazy_import("networkx")
+
+EDGE_LIST_VERSION = 1
+
+##########
+# Binary edge list
+##########
+
+# marks the attributes a node or an edge doesn't have
+_MISSING = object()
+
+def _column_kind(values):
+    # simplest type able to hold all (present) values of an attribute
+    present = [value for value in values if value is not _MISSING]
+    if all(isinstance(value, bool) for value in present):
+        return 'bool'
+    if all(isinstance(value, numbers.Integral) and not isinstance(value, bool) and -2**63 <= value < 2**63 for value in present):
+        return 'int'
+    if all(isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral) for value in present):
+        return 'float'
+    if all(isinstance(value, str) for value in present):
+        return 'str'
+    return 'json' # anything else JSON serialisable, e.g. the lists of refs and parents of a commit
+
+def _encode_texts(texts):
+    # UTF-8 bytes of all texts, one after the other, and the offsets of each text
+    encoded = [text.encode('utf-8', errors='surrogateescape') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def _decode_texts(data, offsets):
+    data = data.tobytes()
+    offsets = offsets.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8', errors='surrogateescape') for i in range(len(offsets) - 1)]
+
+def _encode_column(name, values, arrays):
+    # stores the values of an attribute in `arrays` and returns the description of the column
+    kind = _column_kind(values)
+    present = np.fromiter((value is not _MISSING for value in values), dtype=bool, count=len(values))
+    column = {'name': name, 'kind': kind, 'complete': bool(present.all())}
+    prefix = 'column' + str(len(arrays))
+    if not column['complete']:
+        arrays[prefix + '_present'] = present
+    if kind in ('bool', 'int', 'float'):
+        default = {'bool': False, 'int': 0, 'float': 0.0}[kind]
+        arrays[prefix + '_data'] = np.array([default if value is _MISSING else value for value in values],
+                                            dtype={'bool': bool, 'int': np.int64, 'float': np.float64}[kind])
+    else:
+        if kind == 'str':
+            texts = ['' if value is _MISSING else value for value in values]
+        else:
+            texts = ['null' if value is _MISSING else json.dumps(value, sort_keys=True) for value in values]
+        arrays[prefix + '_data'], arrays[prefix + '_offsets'] = _encode_texts(texts)
+    column['prefix'] = prefix
+    return column
+
+def _decode_column(column, archive):
+    prefix = column['prefix']
+    if column['kind'] in ('bool', 'int', 'float'):
+        values = archive[prefix + '_data'].tolist()
+    else:
+        values = _decode_texts(archive[prefix + '_data'], archive[prefix + '_offsets'])
+        if column['kind'] == 'json':
+            values = [json.loads(value) for value in values]
+    if not column['complete']:
+        values = [value if present else _MISSING for value, present in zip(values, archive[prefix + '_present'].tolist())]
+    return values
+
+def _attribute_columns(items, arrays):
+    # one column per attribute name (in order of appearance) of a list of attribute dicts
+    names = dict()
+    for attributes in items:
+        for name in attributes:
+            names.setdefault(name, None)
+    return [_encode_column(name, [attributes.get(name, _MISSING) for attributes in items], arrays) for name in names]
+
+def _attribute_dicts(columns, archive, n_items):
+    dicts = [dict() for i in range(n_items)]
+    for column in columns:
+        for attributes, value in zip(dicts, _decode_column(column, archive)):
+            if value is not _MISSING:
+                attributes[column['name']] = value
+    return dicts
+
+def write_edge_list(graph, file_path):
+    """
+    Writes a networkx graph to a compressed NumPy archive (.npz): the edges are two arrays of node indices,
+    and the attributes of the nodes and edges are stored column by column (numbers as numeric arrays,
+    texts as UTF-8 bytes with offsets), which is much faster to write and to read than GraphML.
+
+    Returns
+    =======
+
+    int: number of bytes written
+    """
+    arrays = dict()
+    nodes = list(graph.nodes(data=True))
+    node_index = {node: i for i, (node, attributes) in enumerate(nodes)}
+    node_ids = _encode_column('id', [node for node, attributes in nodes], arrays)
+    node_columns = _attribute_columns([attributes for node, attributes in nodes], arrays)
+
+    if graph.is_multigraph():
+        edges = list(graph.edges(keys=True, data=True))
+        edge_keys = _encode_column('key', [key for source, target, key, attributes in edges], arrays)
+    else:
+        edges = [(source, target, None, attributes) for source, target, attributes in graph.edges(data=True)]
+        edge_keys = None
+    sources = np.fromiter((node_index[edge[0]] for edge in edges), dtype=np.int64, count=len(edges))
+    targets = np.fromiter((node_index[edge[1]] for edge in edges), dtype=np.int64, count=len(edges))
+    edge_columns = _attribute_columns([edge[3] for edge in edges], arrays)
+
+    meta = {
+        'format': 'edge_list',
+        'version': EDGE_LIST_VERSION,
+        'directed': graph.is_directed(),
+        'multigraph': graph.is_multigraph(),
+        'graph': graph.graph,
+        'node_ids': node_ids,
+        'node_columns': node_columns,
+        'edge_keys': edge_keys,
+        'edge_columns': edge_columns
+    }
+    # written under a temporary name and moved in place, like `ExportFile`, so an interrupted export
+    # never replaces a previous file with a truncated one
+    temporary_path = file_path + '.tmp'
+    try:
+        with open(temporary_path, 'wb') as f:
+            np.savez_compressed(f,
+                meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+                sources=sources, targets=targets, **arrays)
+            bytes_written = f.tell()
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        if os.path.isfile(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return bytes_written
+
+def read_edge_list(file_path):
+    """
+    Reads a networkx graph written by `write_edge_list()`, with the same nodes, edges and attributes, in the same order.
+    """
+    with np.load(file_path) as archive:
+        meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+        if meta.get('format') != 'edge_list' or meta.get('version') != EDGE_LIST_VERSION:
+            raise ValueError(f"{file_path} is not a graph edge list (version {EDGE_LIST_VERSION})")
+        node_ids = _decode_column(meta['node_ids'], archive)
+        node_attributes = _attribute_dicts(meta['node_columns'], archive, len(node_ids))
+        sources, targets = archive['sources'].tolist(), archive['targets'].tolist()
+        edge_attributes = _attribute_dicts(meta['edge_columns'], archive, len(sources))
+        edge_keys = None if meta['edge_keys'] is None else _decode_column(meta['edge_keys'], archive)
+
+    if meta['multigraph']:
+        graph = nx.MultiDiGraph() if meta['directed'] else nx.MultiGraph()
+    else:
+        graph = nx.DiGraph() if meta['directed'] else nx.Graph()
+    graph.graph.update(meta['graph'])
+    graph.add_nodes_from(zip(node_ids, node_attributes))
+    if edge_keys is None:
+        graph.add_edges_from((node_ids[source], node_ids[target], attributes)
+                             for source, target, attributes in zip(sources, targets, edge_attributes))
+    else:
+        graph.add_edges_from((node_ids[source], node_ids[target], key, attributes)
+                             for source, target, key, attributes in zip(sources, targets, edge_keys, edge_attributes))
+    return graph
+
+##########
+# GraphML and node-link JSON readers
+##########
+
+def read_GraphML(file_path):
+    """
+    Reads a networkx graph from a GraphML file, compressed with gzip if its name ends with `COMPRESSED_SUFFIX`.
+    """
+    # networkx decompresses files ending with .gz itself
+    return nx.read_graphml(file_path)
+
+def read_node_link_JSON(file_path):
+    """
+    Reads a networkx graph from a node-link JSON document (edges listed under "links", see `iter_node_link_JSON()`),
+    compressed with gzip if its name ends with `COMPRESSED_SUFFIX`.
+    """
+    with open_export(file_path) as f:
+        data = json.load(f)
+    try:
+        return nx.node_link_graph(data, edges='links')
+    except TypeError: # networkx 2.x, where the edges are always listed under "links"
+        return nx.node_link_graph(data)
+
+##########
+# Formats
+##########
+
+class GraphFormat:
+    """
+    Export format of a graph: the extension of its files, and functions to write and read them.
+
+    Parameters
+    ==========
+
+    `name` : str, name of the format in the options of `start.py`
+    `extension` : str, appended to the name of the exported files
+    `write` : function (graph, file path, compress) -> number of bytes written
+    `read` : function (file path) -> networkx graph
+    `compressible` : bool, True if the files are compressed with gzip when exports are compressed
+        (the suffix `COMPRESSED_SUFFIX` is then added to their name)
+    """
+
+    def __init__(self, name, extension, write, read, compressible):
+        self.name = name
+        self.extension = extension
+        self.write = write
+        self.read = read
+        self.compressible = compressible
+
+    def file_name(self, base_name, compress=False):
+        return base_name + self.extension + (COMPRESSED_SUFFIX if compress and self.compressible else '')
+
+GRAPH_FORMATS = {graph_format.name: graph_format for graph_format in [
+    GraphFormat('graphml', '.GraphML', write_GraphML, read_GraphML, True),
+    GraphFormat('json', '.json', write_node_link_JSON, read_node_link_JSON, True),
+    # the archive is always compressed
+    GraphFormat('edgelist', '.edgelist.npz', lambda graph, file_path, compress=False: write_edge_list(graph, file_path), read_edge_list, False)
+]}
+
+def write_graph(graph, base_path, graph_format, compress=False):
+    """
+    Writes a networkx graph in one of the `GRAPH_FORMATS`.
+
+    Parameters
+    ==========
+
+    `graph` : networkx graph, required
+    `base_path` : str, required, path of the file without extension
+    `graph_format` : str, required, name of the format ("graphml", "json" or "edgelist")
+    `compress` : bool, optional, compress the file with gzip (if the format isn't compressed already)
+
+    Returns
+    =======
+
+    tuple: path of the file (with extension) and number of bytes written
+    """
+    graph_format = GRAPH_FORMATS[graph_format]
+    file_path = graph_format.file_name(base_path, compress)
+    return file_path, graph_format.write(graph, file_path, compress=compress and graph_format.compressible)
+
+def format_of(file_path):
+    """
+    Returns the `GraphFormat` of a file written by `write_graph()`, told by its extension.
+    """
+    if file_path.endswith(COMPRESSED_SUFFIX):
+        file_path = file_path[:-len(COMPRESSED_SUFFIX)]
+    for graph_format in GRAPH_FORMATS.values():
+        if file_path.endswith(graph_format.extension):
+            return graph_format
+    raise ValueError(f"unknown graph format: {file_path}")
+
+def read_graph(file_path):
+    """
+    Reads a networkx graph written by `write_graph()`, in any of the `GRAPH_FORMATS`.
+    """
+    return format_of(file_path).read(file_path)
@@ -16,6 +16,8 @@ from logging.config import dictConfig
 
 from json.decoder import JSONDecodeError
 
+from repo_lists import read_OSH_reference, deduplicate_repositories, select_shard
+
 def initialise_options() -> dict:
     """Initialise starting options for git-mining script
 
@@ -25,7 +27,33 @@ def initialise_options() -> dict:
         output directory for downloaded data (key "data_dir"), 
         list of repositories to mine (key "repo_list"), 
         log config (key "log_config"), 
-        and if output directory should be created (key "create_data_dir").
+        if output directory should be created (key "create_data_dir"),
+        if only commits pushed since the previous run should be fetched (key "incremental"),
+        if all forks should be fetched into one shared object store (key "fork_network"),
+        the number of repositories processed in parallel (key "workers"),
+        how forks are discovered (key "fork_discovery"),
+        the maximum number of concurrent requests to the GitHub API (key "http_workers"),
+        if, for how long (in hours) and up to which size (in MB) responses of the GitHub API are cached
+        (keys "http_cache", "http_cache_max_age" and "http_cache_max_size"),
+        the format(s) in which commits are saved (key "commit_format"),
+        if commits are passed on one at a time from the fetch to the exports and graph builders (key "streaming"),
+        if JSON and GraphML exports are compressed with gzip (key "compress_exports"),
+        how the commit history is built (key "commit_history_backend"),
+        how interactions are weighted in the committer graph (key "committer_graph_weights"),
+        the length and step of time windows sliding over the commits, with or without
+        snapshots of their graphs (keys "window_length", "window_step" and "window_snapshots"),
+        the formats in which each graph is exported
+        (keys "commit_history_formats", "file_change_history_formats" and "committer_graph_formats"),
+        if statistics which are expensive to compute are added to the run report (key "debug_statistics"),
+        how the git log of each fork is read, by how many processes (keys "git_backend" and "parse_workers"),
+        the object filter of partial clones, with or without the line counts of the file changes,
+        except for some files (keys "clone_filter", "line_stats" and "line_stats_exclude"),
+        if forks whose branches and tags all point to known commits are skipped (key "skip_known_forks"),
+        if a previous run is resumed, how many times and after how long (in seconds) repositories failing with
+        transient errors are retried, and if the longest repositories are started first
+        (keys "resume", "max_retries", "retry_delay" and "order_by_size"),
+        the format of the list of repositories and the part of it processed by this run
+        (keys "repo_list_format", "shard" and "n_shards").
     """
     #
     # Retrive configuration options
@@ -44,6 +72,82 @@ def initialise_options() -> dict:
                         help="Path to CSV file containing list of repositories to mine.")
     parser.add_argument("--create_data_dir", type=bool, default=True, required=False,
                         help = "If data output directory doesn't exist, create it.")
+    parser.add_argument("--incremental", action="store_true", required=False,
+                        help="Keep local clones between runs and only fetch commits pushed since the previous run.")
+    parser.add_argument("--fork_network", action="store_true", required=False,
+                        help="Fetch all forks of a repository as remotes of one shared git object store.")
+    parser.add_argument("-w", "--workers", type=int, default=1, required=False,
+                        help="Number of repositories processed in parallel, each in its own process.")
+    parser.add_argument("--fork_discovery", type=str, default="recursive", required=False,
+                        choices=["recursive", "concurrent", "graphql"],
+                        help="How forks are discovered: with the REST API, one request at a time, depth-first (recursive) or level by level with concurrent requests (concurrent), or with batched queries to the GraphQL API (graphql).")
+    parser.add_argument("--http_workers", type=int, default=8, required=False,
+                        help="Maximum number of concurrent requests to the GitHub API when discovering forks concurrently.")
+    parser.add_argument("--http_cache", action="store_true", required=False,
+                        help="Cache responses of the GitHub API on disk and revalidate them with conditional requests.")
+    parser.add_argument("--http_cache_max_age", type=float, default=168, required=False,
+                        help="Cached responses not used for this number of hours are evicted.")
+    parser.add_argument("--http_cache_max_size", type=float, default=100, required=False,
+                        help="Maximum size of the cache of GitHub API responses, in MB.")
+    parser.add_argument("--commit_format", type=str, default="json", required=False,
+                        choices=["json", "columnar", "both"],
+                        help="Format in which commits are saved: JSON file (json), columnar commit table (columnar) or both.")
+    parser.add_argument("--streaming", action="store_true", required=False,
+                        help="Pass commits on one at a time from the fetch to the exports and graph builders, instead of collecting them in memory first.")
+    parser.add_argument("--compress_exports", action="store_true", required=False,
+                        help="Compress JSON and GraphML exports with gzip (.gz suffix).")
+    parser.add_argument("--commit_history_backend", type=str, default="networkx", required=False,
+                        choices=["networkx", "csr"],
+                        help="Build the commit history as a networkx graph (networkx) or as a compact commit DAG with integer ids (csr).")
+    parser.add_argument("--committer_graph_weights", type=str, default="directed", required=False,
+                        choices=["directed", "symmetric"],
+                        help="Count the interactions between two committers per direction (directed) or regardless of their order (symmetric).")
+    parser.add_argument("--window_length", type=str, default=None, required=False,
+                        help="Also build the graphs of time windows of this length sliding over the commits, as a pandas frequency (e.g. 30D or 1MS for one month).")
+    parser.add_argument("--window_step", type=str, default=None, required=False,
+                        help="Time between the starts of two time windows, as a pandas frequency (by default the window length).")
+    parser.add_argument("--window_snapshots", action="store_true", required=False,
+                        help="Export the graphs of each time window, not only their size.")
+    parser.add_argument("--commit_history_formats", type=str, nargs="+", default=["graphml"], required=False,
+                        choices=["graphml", "json", "edgelist"],
+                        help="Format(s) in which the commit history is exported: GraphML (graphml), node-link JSON (json) or compressed binary edge list (edgelist).")
+    parser.add_argument("--file_change_history_formats", type=str, nargs="+", default=["graphml"], required=False,
+                        choices=["graphml", "json", "edgelist"],
+                        help="Format(s) in which the file change history is exported: GraphML (graphml), node-link JSON (json) or compressed binary edge list (edgelist).")
+    parser.add_argument("--committer_graph_formats", type=str, nargs="+", default=["graphml", "json"], required=False,
+                        choices=["graphml", "json", "edgelist"],
+                        help="Format(s) in which the committer graph is exported: GraphML (graphml), node-link JSON (json) or compressed binary edge list (edgelist).")
+    parser.add_argument("--debug_statistics", action="store_true", required=False,
+                        help="Add statistics which are expensive to compute (e.g. the number of files of the file change history) to the run report.")
+    parser.add_argument("--git_backend", type=str, default="perceval", required=False,
+                        choices=["perceval", "native"],
+                        help="How commits are read from the clones: with perceval (perceval) or by parsing git log in parallel (native).")
+    parser.add_argument("--parse_workers", type=int, default=4, required=False,
+                        help="Number of processes parsing the git log of a repository with --git_backend native.")
+    parser.add_argument("--clone_filter", type=str, default=None, required=False,
+                        help="Object filter of partial clones, e.g. blob:none to clone without the contents of the files (needs --git_backend native).")
+    parser.add_argument("--line_stats", type=str, default="all", required=False,
+                        choices=["all", "none"],
+                        help="With --clone_filter, compute the lines added and removed by each file change (all), fetching the blobs needed, or not (none).")
+    parser.add_argument("--line_stats_exclude", type=str, nargs="*", default=[], required=False,
+                        help="With --clone_filter, glob patterns of files (e.g. '*.stl') whose line counts aren't computed, so their blobs are never downloaded.")
+    parser.add_argument("--skip_known_forks", action="store_true", required=False,
+                        help="List the branches and tags of each fork first (git ls-remote), and don't fetch the forks which only point to known commits.")
+    parser.add_argument("--resume", action="store_true", required=False,
+                        help="Skip the repositories completed by a previous run, and resume the others from their last completed stage (see <data_dir>/journal).")
+    parser.add_argument("--max_retries", type=int, default=2, required=False,
+                        help="Number of times a repository whose processing failed with a transient error (rate limit, network error) is retried.")
+    parser.add_argument("--retry_delay", type=float, default=60, required=False,
+                        help="Seconds before the first retry of a repository, doubled after each retry.")
+    parser.add_argument("--order_by_size", action="store_true", required=False,
+                        help="Start the repositories with the largest estimated size (size times forks, from the GitHub API) first.")
+    parser.add_argument("--repo_list_format", type=str, default="owner_repo", required=False,
+                        choices=["owner_repo", "osh_reference"],
+                        help="Format of the repository list: CSV file with columns owner and repo (owner_repo), or reference list of open source hardware products with the repositories of each product in column 'AFFILIATED GITHUB REPOSITORIES', separated by ';' (osh_reference).")
+    parser.add_argument("--n_shards", type=int, default=1, required=False,
+                        help="Split the repository list into this number of disjoint shards, the same on every machine.")
+    parser.add_argument("--shard", type=int, default=0, required=False,
+                        help="Shard of the repository list processed by this run, from 0 to n_shards - 1.")
     parsed_config = parser.parse_args()
 
     # Create dictionary to hold mandatory options
@@ -54,6 +158,39 @@ def initialise_options() -> dict:
     configuration["data_dir"] = parsed_config.data_dir
     configuration["repo_list"] = parsed_config.repo_list
     configuration["create_data_dir"] = parsed_config.create_data_dir
+    configuration["incremental"] = parsed_config.incremental
+    configuration["fork_network"] = parsed_config.fork_network
+    configuration["workers"] = parsed_config.workers
+    configuration["fork_discovery"] = parsed_config.fork_discovery
+    configuration["http_workers"] = parsed_config.http_workers
+    configuration["http_cache"] = parsed_config.http_cache
+    configuration["http_cache_max_age"] = parsed_config.http_cache_max_age
+    configuration["http_cache_max_size"] = parsed_config.http_cache_max_size
+    configuration["commit_format"] = parsed_config.commit_format
+    configuration["streaming"] = parsed_config.streaming
+    configuration["compress_exports"] = parsed_config.compress_exports
+    configuration["commit_history_backend"] = parsed_config.commit_history_backend
+    configuration["committer_graph_weights"] = parsed_config.committer_graph_weights
+    configuration["window_length"] = parsed_config.window_length
+    configuration["window_step"] = parsed_config.window_step
+    configuration["window_snapshots"] = parsed_config.window_snapshots
+    configuration["commit_history_formats"] = parsed_config.commit_history_formats
+    configuration["file_change_history_formats"] = parsed_config.file_change_history_formats
+    configuration["committer_graph_formats"] = parsed_config.committer_graph_formats
+    configuration["debug_statistics"] = parsed_config.debug_statistics
+    configuration["git_backend"] = parsed_config.git_backend
+    configuration["parse_workers"] = parsed_config.parse_workers
+    configuration["clone_filter"] = parsed_config.clone_filter
+    configuration["line_stats"] = parsed_config.line_stats
+    configuration["line_stats_exclude"] = parsed_config.line_stats_exclude
+    configuration["skip_known_forks"] = parsed_config.skip_known_forks
+    configuration["resume"] = parsed_config.resume
+    configuration["max_retries"] = parsed_config.max_retries
+    configuration["retry_delay"] = parsed_config.retry_delay
+    configuration["order_by_size"] = parsed_config.order_by_size
+    configuration["repo_list_format"] = parsed_config.repo_list_format
+    configuration["n_shards"] = parsed_config.n_shards
+    configuration["shard"] = parsed_config.shard
     configuration["log_config"] = None
 
     #
@@ -92,7 +229,9 @@ def initialise_options() -> dict:
     #
 
     # Use a list comprehension that will include items still empty or `None`
-    empty_options: list = [key for key, value in configuration.items() if key != "config_file" and (value == "" or value == None)]
+    # options which may stay empty
+    optional_options: list = ["config_file", "window_length", "window_step", "clone_filter"]
+    empty_options: list = [key for key, value in configuration.items() if key not in optional_options and (value == "" or value == None)]
     if len(empty_options) > 0:
         logging.critical("There are still required options missing:")
         for missing_item in empty_options: # List missing items
@@ -171,12 +310,16 @@ def initialise_options() -> dict:
         sys.exit(1)
     else:
         try:
-            with open(configuration["repo_list"], newline="") as repo_file:
-                repo_csv = csv.DictReader(repo_file)
-                repo_list: list = list()
-                for row in repo_csv:
-                    repo_list.append(row)
-            del repo_file, repo_csv
+            if configuration["repo_list_format"] == "osh_reference":
+                # one row per product, with any number of repositories (see repo_lists.py)
+                repo_list: list = read_OSH_reference(configuration["repo_list"])
+            else:
+                with open(configuration["repo_list"], newline="") as repo_file:
+                    repo_csv = csv.DictReader(repo_file)
+                    repo_list: list = list()
+                    for row in repo_csv:
+                        repo_list.append(row)
+                del repo_file, repo_csv
         except Exception as read_csv_error: # TODO: Make Exception more specific
             logging.critical(f"Error parsing repository list: {read_csv_error}")
             sys.exit(1)
@@ -201,7 +344,18 @@ def initialise_options() -> dict:
             logging.critical(bad_row.values()) # TODO: Make this more human-readable
         sys.exit(1)
             
-    # TODO: Remove duplicate entries in `repo_list`
+    repo_list = deduplicate_repositories(repo_list)
+
+    # Keep the shard of `repo_list` processed by this run
+    try:
+        assert 0 <= configuration["shard"] < configuration["n_shards"], "Shard {} doesn't exist, shards are numbered from 0 to {}".format(
+            configuration["shard"], configuration["n_shards"] - 1)
+    except AssertionError as shard_error:
+        logging.critical(shard_error)
+        sys.exit(1)
+    if configuration["n_shards"] > 1:
+        repo_list = select_shard(repo_list, configuration["shard"], configuration["n_shards"])
+
     # Put `repo_list` into `configuration`
     configuration["repo_list"] = repo_list
 
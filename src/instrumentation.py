@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# measures of each stage of the mining of a repository (fork discovery, fetch, deduplication, builders, exports):
+# wall time, CPU time, memory, HTTP requests and number of items processed,
+# written as a JSON report and as a Prometheus textfile (see `write_run_report()`)
+##########
+
+##########
+# Import libraries
+##########
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from lazy_imports import lazy_import
+
+##########
+# HTTP requests
+##########
+
+# requests made to the GitHub API by this process, per kind of response
+_http_requests = Counter()
+_http_requests_lock = threading.Lock()
+
+def count_http_request(response):
+    """
+    Records a request made to the GitHub API (thread safe), from its `requests.Response`.
+    Responses are counted by class of status code ("2xx", "3xx"...), e.g. "3xx" for conditional requests answered by 304.
+    """
+    with _http_requests_lock:
+        _http_requests['total'] += 1
+        _http_requests[str(response.status_code)[0] + 'xx'] += 1
+
+def http_requests():
+    """
+    Returns the number of requests made to the GitHub API by this process so far, in total and per class of status code.
+    """
+    with _http_requests_lock:
+        return dict(_http_requests)
+
+##########
+# Memory
+##########
+
+def _peak_rss():
+    # peak resident set size of this process since it started, in bytes (kB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+def _current_rss():
+    # current resident set size of this process in bytes, if the system tells it
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+##########
+# Stages
+##########
+
+class Stage:
+    """
+    Measures of a stage. A stage entered several times (e.g. the fetch of each fork) adds up its measures.
+    Code running in the stage sets the number of items it processed with `add_items()`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.children_cpu_time = 0.0 # e.g. git processes run by perceval
+        self.peak_rss = None
+        self.rss = None
+        self.http_requests = Counter()
+        self.items = 0
+
+    def add_items(self, n_items):
+        self.items += n_items
+
+    def report(self):
+        return {
+            'stage': self.name,
+            'calls': self.calls,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'children_cpu_time': self.children_cpu_time,
+            'peak_rss': self.peak_rss,
+            'rss': self.rss,
+            'http_requests': dict(self.http_requests),
+            'items': self.items
+        }
+
+class Instrumentation:
+    """
+    Measures of the stages of the mining of a repository, in the order they were first entered.
+
+    Usage:
+
+        instrumentation = Instrumentation("owner/repo")
+        with instrumentation.stage("fetch") as stage:
+            ...
+            stage.add_items(len(commits))
+
+    Parameters
+    ==========
+
+    `repository` : str, required, "<owner>/<repo>"
+    `debug_statistics` : bool, optional, also compute statistics which are expensive to compute,
+        e.g. the number of files of the file change history (see `debug_statistics`)
+    """
+
+    def __init__(self, repository, debug_statistics=False):
+        self.repository = repository
+        self.debug_statistics = debug_statistics
+        self.started = time.time()
+        self.stages = dict() # name -> Stage
+        self.statistics = dict() # name -> value, see `add_statistic()`
+        self.counts = Counter() # name -> count, see `add_count()`
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager measuring the code run in it as stage `name`. Yields the `Stage`.
+        """
+        stage = self.stages.setdefault(name, Stage(name))
+        http_before = http_requests()
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            stage.calls += 1
+            stage.wall_time += time.perf_counter() - wall_start
+            stage.cpu_time += time.process_time() - cpu_start
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            stage.children_cpu_time += (children_after.ru_utime + children_after.ru_stime
+                                        - children_before.ru_utime - children_before.ru_stime)
+            stage.peak_rss = _peak_rss()
+            stage.rss = _current_rss()
+            for kind, count in http_requests().items():
+                stage.http_requests[kind] += count - http_before.get(kind, 0)
+
+    def add_statistic(self, name, compute):
+        """
+        Records a statistic computed by `compute()` (a function without argument), only if debug statistics are enabled.
+        Returns the value, or None.
+        """
+        if not self.debug_statistics:
+            return None
+        value = compute()
+        self.statistics[name] = value
+        return value
+
+    def add_count(self, name, count):
+        """
+        Adds `count` to a count of the repository (e.g. the number of forks skipped), always recorded.
+        """
+        self.counts[name] += count
+
+    def report(self):
+        """
+        Returns all measures as a dict (JSON serialisable).
+        """
+        return {
+            'repository': self.repository,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'wall_time': time.time() - self.started,
+            'peak_rss': _peak_rss(),
+            'stages': [stage.report() for stage in self.stages.values()],
+            'counts': dict(self.counts),
+            'statistics': self.statistics
+        }
+
+    def log_summary(self):
+        for stage in self.stages.values():
+            logging.info(f"Stage {stage.name}: {stage.wall_time:.2f} s wall, {stage.cpu_time:.2f} s CPU, "
+                         f"{stage.items} items, {stage.http_requests.get('total', 0)} HTTP requests, "
+                         f"peak RSS {(stage.peak_rss or 0) / 2**20:.0f} MB")
+
+##########
+# Reports
+##########
+
+# name of the metrics in the Prometheus textfile: prefix + measure, e.g. "git_mining_stage_wall_seconds"
+PROMETHEUS_PREFIX = 'git_mining_'
+
+def write_prometheus_textfile(reports, file_path):
+    """
+    Writes the measures of the stages of each repository to a textfile for the textfile collector of the
+    Prometheus node exporter (labels "repository" and "stage").
+
+    Parameters
+    ==========
+
+    `reports` : list of dicts, required, returned by `Instrumentation.report()`
+    `file_path` : str, required, should end with ".prom"
+    """
+    prometheus_client = lazy_import("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    labels = ['repository', 'stage']
+    gauges = {
+        'wall_time': prometheus_client.Gauge(PROMETHEUS_PREFIX + 'stage_wall_seconds', 'Wall time of the stage', labels, registry=registry),
+        'cpu_time': prometheus_client.Gauge(PROMETHEUS_PREFIX + 'stage_cpu_seconds', 'CPU time of the stage', labels, registry=registry),
+        'children_cpu_time': prometheus_client.Gauge(PROMETHEUS_PREFIX + 'stage_children_cpu_seconds',
+                                                     'CPU time of the processes run by the stage (e.g. git)', labels, registry=registry),
+        'peak_rss': prometheus_client.Gauge(PROMETHEUS_PREFIX + 'stage_peak_rss_bytes',
+                                            'Peak resident set size of the process at the end of the stage', labels, registry=registry),
+        'items': prometheus_client.Gauge(PROMETHEUS_PREFIX + 'stage_items', 'Number of items processed by the stage', labels, registry=registry),
+    }
+    http_gauge = prometheus_client.Gauge(PROMETHEUS_PREFIX + 'stage_http_requests', 'Requests made to the GitHub API by the stage',
+                                         labels + ['status'], registry=registry)
+    repository_gauge = prometheus_client.Gauge(PROMETHEUS_PREFIX + 'repository_wall_seconds', 'Wall time of the processing of the repository',
+                                               ['repository'], registry=registry)
+    count_gauge = prometheus_client.Gauge(PROMETHEUS_PREFIX + 'repository_count', 'Counts of the repository, e.g. of the forks skipped',
+                                          ['repository', 'name'], registry=registry)
+    for report in reports:
+        repository_gauge.labels(report['repository']).set(report['wall_time'])
+        for name, count in report.get('counts', dict()).items():
+            count_gauge.labels(report['repository'], name).set(count)
+        for stage in report['stages']:
+            for measure, gauge in gauges.items():
+                if stage[measure] is not None:
+                    gauge.labels(report['repository'], stage['stage']).set(stage[measure])
+            for status, count in stage['http_requests'].items():
+                if status != 'total':
+                    http_gauge.labels(report['repository'], stage['stage'], status).set(count)
+    # the file is written under a temporary name and then moved in place, so it is never read half written
+    prometheus_client.write_to_textfile(file_path, registry)
+
+def write_run_report(reports, reports_dir):
+    """
+    Writes the measures of a run (all repositories processed) as a JSON report, `run-<date and time>.json`,
+    and as a Prometheus textfile, `git_mining.prom` (replaced by each run).
+
+    Returns
+    =======
+
+    tuple: paths of the JSON report and of the Prometheus textfile (None if prometheus_client is not installed)
+    """
+    if not os.path.isdir(reports_dir):
+        os.makedirs(reports_dir)
+    report_path = os.path.join(reports_dir, 'run-' + time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()) + '.json')
+    with open(report_path, 'w') as f:
+        json.dump({'repositories': reports}, f, indent=4)
+
+    textfile_path = os.path.join(reports_dir, 'git_mining.prom')
+    try:
+        write_prometheus_textfile(reports, textfile_path)
+    except ImportError as import_error:
+        logging.warning(f"No Prometheus textfile written: {import_error}")
+        textfile_path = None
+    return report_path, textfile_path
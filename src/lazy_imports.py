@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# modules imported on first use, so heavy libraries (numpy, pandas, networkx, perceval) are only loaded
+# by the stages which need them, and not each time a script starts
+##########
+
+##########
+# Import libraries
+##########
+import importlib.util
+import sys
+
+def lazy_import(name):
+    """
+    Returns a module which is only executed when one of its attributes is used for the first time.
+    The module is found right away, so a missing dependency is still reported at start-up.
+
+    Example: `np = lazy_import("numpy")` instead of `import numpy as np`
+
+    Parameters
+    ==========
+
+    `name` : str, required, full name of the module, e.g. "perceval.backends.core.git"
+
+    Returns
+    =======
+
+    module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Mine commits from partial clones, made with a filter (e.g. "blob:none") so that the contents of the files
+# are not downloaded with the history. Commits are read from the commits and trees only, and the line counts
+# of their file changes ("added" and "removed") are computed afterwards, batch by batch, from the blobs
+# they need, which git then fetches on demand.
+
+##########
+# Import libraries
+##########
+
+import logging
+from git_commands import run_git
+from git_log_parser import iter_git_log, _new_file_path
+
+# `GIT_LOG_OPTIONS` (see git_commands.py) without the line counts, and with exact renames and copies only:
+# finding renames of edited files needs the contents of the files, which partial clones don't have
+METADATA_LOG_OPTIONS = ['--raw', '--pretty=fuller', '--decorate=full', '--parents', '-M100%', '-C100%', '-c']
+
+# `METADATA_LOG_OPTIONS` with the line counts, so the file changes are the same
+LINE_STATS_LOG_OPTIONS = ['--numstat'] + METADATA_LOG_OPTIONS
+
+# number of commits of which the line counts are computed (and the blobs fetched) at once
+LINE_STATS_BATCH = 1000
+
+##########
+# Blobs of a partial clone
+##########
+
+def missing_objects(clone_path, revision_args=('--all',), input_lines=None):
+    """
+    Returns the SHAs of the objects (blobs, with a blob filter) of a partial clone which are not downloaded,
+    among those reachable from the revisions of `revision_args` (e.g. `['--branches', '--stdin']`,
+    with `^<SHA>` exclusions as `input_lines`), but not from the excluded commits: with the exclusions
+    of an incremental fetch, only the objects of the new commits are walked, not the whole history.
+    """
+    output = run_git(['rev-list', '--objects', '--missing=print'] + list(revision_args), cwd=clone_path, input_lines=input_lines)
+    return set(line[1:] for line in output.splitlines() if line.startswith('?'))
+
+def prefetch_objects(clone_path, object_shas):
+    """
+    Fetches missing objects of a partial clone from its remote, all at once
+    (the same request git makes when it finds an object missing, but for many objects).
+    """
+    if len(object_shas) == 0:
+        return
+    run_git(['-c', 'fetch.negotiationAlgorithm=noop', 'fetch', 'origin', '--quiet', '--no-tags', '--no-write-fetch-head',
+             '--recurse-submodules=no', '--stdin'], cwd=clone_path, input_lines=sorted(object_shas))
+
+def changed_blobs(clone_path, commit_shas, pathspec):
+    """
+    Returns the SHAs of the blobs compared by the diffs of commits (with their parents) on the paths of `pathspec`,
+    read from the trees only.
+    """
+    output = run_git(['diff-tree', '--stdin', '-r', '-c', '--root', '--full-index', '--no-commit-id', '-M100%', '-C100%', '--'] + pathspec,
+                     cwd=clone_path, input_lines=commit_shas)
+    blob_shas = set()
+    for line in output.splitlines():
+        if line.startswith(':'):
+            # ":<modes> <SHAs> <action>\t<paths>" (one mode and one SHA per parent, then those of the commit)
+            for field in line.split('\t', 1)[0].split(' '):
+                if len(field) == 40 and field.strip('0') != '':
+                    blob_shas.add(field)
+    return blob_shas
+
+##########
+# Line counts
+##########
+
+def line_stats_pathspec(exclude=()):
+    """
+    Returns the git pathspec of the files whose line counts are computed: all files, except those
+    matching the patterns of `exclude` (e.g. "*.stl"), whose blobs are never downloaded.
+    """
+    return ['.'] + [':(exclude,glob)' + pattern if '/' in pattern else ':(exclude,glob)**/' + pattern for pattern in exclude]
+
+def _file_key(changed_file):
+    # path under which the parser sorts a file change: the new path of moved files, also
+    # for the combined paths of the file changes only listed in the line counts (e.g. "dir/{old => new}")
+    if 'newfile' in changed_file:
+        return changed_file['newfile']
+    if 'action' not in changed_file and ' => ' in changed_file['file']:
+        return _new_file_path(changed_file['file'])
+    return changed_file['file']
+
+def add_line_stats(clone_path, commits, exclude=(), missing=None):
+    """
+    Adds the line counts ("added" and "removed") to the file changes of commits read from a partial clone
+    with `METADATA_LOG_OPTIONS`. The blobs needed are fetched first, in one request.
+
+    Parameters
+    ==========
+
+    `clone_path` : str, required, path of the partial clone
+    `commits` : list of dicts, required, commits (perceval format), modified in place
+    `exclude` : list of str, optional, glob patterns of the files whose line counts are not computed
+    `missing` : set of str, optional, SHAs of the missing objects of the clone (see `missing_objects()`),
+        updated as blobs are fetched; by default, the missing objects of the whole history are listed again.
+        Blobs needed but not in `missing` (e.g. of commits mined by a previous run without line counts)
+        are fetched by git one at a time when it needs them
+
+    Raises
+    ======
+
+    RepositoryError
+        If git fails, e.g. if the remote can't be reached to fetch the blobs.
+    """
+    if len(commits) == 0:
+        return
+    pathspec = line_stats_pathspec(exclude)
+    commit_shas = [commit['commit'] for commit in commits]
+    if missing is None:
+        missing = missing_objects(clone_path)
+    needed = changed_blobs(clone_path, commit_shas, pathspec) & missing
+    prefetch_objects(clone_path, needed)
+    missing -= needed
+
+    # the same log as the commits, restricted to the paths of `pathspec`, with the line counts
+    stats = dict()
+    for stats_commit in iter_git_log(['log', '--no-walk=unsorted', '--stdin'] + LINE_STATS_LOG_OPTIONS + ['--'] + pathspec,
+                                     cwd=clone_path, input_lines=commit_shas):
+        stats[stats_commit['commit']] = {_file_key(changed_file): changed_file for changed_file in stats_commit['files']}
+    for commit in commits:
+        changed_files = {_file_key(changed_file): changed_file for changed_file in commit.get('files', list())}
+        for file_path, file_stats in stats.get(commit['commit'], dict()).items():
+            if file_path not in changed_files:
+                # only listed in the line counts, e.g. by some merges
+                changed_files[file_path] = file_stats
+            elif 'added' in file_stats:
+                changed_files[file_path]['added'] = file_stats['added']
+                changed_files[file_path]['removed'] = file_stats['removed']
+        # sorted by path, as by the parser
+        commit['files'] = [changed_files[file_path] for file_path in sorted(changed_files)]
+
+def iter_partial_clone_commits(revision_args, clone_path, input_lines=None, workers=1, line_stats=True, line_stats_exclude=()):
+    """
+    Yields the commits of `git log --reverse --topo-order` in a partial clone (see `iter_git_log()`), with their line counts
+    computed batch by batch if `line_stats` is True (see `add_line_stats()`).
+
+    Parameters
+    ==========
+
+    `revision_args` : list of str, required, revisions to list, e.g. `['--branches', '--tags', '--stdin']`
+    `clone_path` : str, required, path of the partial clone
+    `input_lines` : list of str, optional, lines passed to git on its standard input (e.g. `^<SHA>` exclusions for `--stdin`)
+    `workers` : int, optional, number of processes parsing the log
+    `line_stats` : bool, optional, compute the line counts of the file changes
+    `line_stats_exclude` : list of str, optional, glob patterns of the files whose line counts are not computed
+    """
+    commits = iter_git_log(['log', '--reverse', '--topo-order'] + METADATA_LOG_OPTIONS + list(revision_args),
+                           cwd=clone_path, input_lines=input_lines, workers=workers)
+    if not line_stats:
+        yield from commits
+        return
+
+    # the blobs of the commits listed only, so an incremental fetch doesn't walk the whole history
+    missing = missing_objects(clone_path, revision_args, input_lines)
+    n_missing = len(missing)
+    batch = list()
+    for commit in commits:
+        batch.append(commit)
+        if len(batch) >= LINE_STATS_BATCH:
+            add_line_stats(clone_path, batch, exclude=line_stats_exclude, missing=missing)
+            yield from batch
+            batch = list()
+    add_line_stats(clone_path, batch, exclude=line_stats_exclude, missing=missing)
+    yield from batch
+    logging.info(f"{n_missing - len(missing)} of {n_missing} missing blobs fetched for the line counts of {clone_path}")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Read the list of repositories to mine from the reference list of open source hardware products
+# (data/OSH-repos-reference-for-mining.csv), remove the repositories listed more than once,
+# and split the list into shards, so several machines (or cron slots) can each mine their own part of it.
+
+##########
+# Import libraries
+##########
+
+import csv
+import hashlib
+import logging
+import re
+
+# column of the reference list with the GitHub repositories of each product, "<owner>/<repo>" separated by ";"
+OSH_REFERENCE_COLUMN = "AFFILIATED GITHUB REPOSITORIES"
+
+# "<owner>/<repo>", optionally as a GitHub URL
+REPOSITORY_PATTERN = re.compile(r"^(?:https?://github\.com/)?(?P<owner>[A-Za-z0-9_.-]+)/(?P<repo>[A-Za-z0-9_.-]+?)(?:\.git)?/?$")
+
+##########
+# Read the lists
+##########
+
+def parse_repository(text):
+    """
+    Returns the repository of "<owner>/<repo>" (or "https://github.com/<owner>/<repo>") as a dict
+    with keys "owner" and "repo", like the rows of the repository list, or None if it isn't one.
+    """
+    match = REPOSITORY_PATTERN.match(text.strip())
+    if not match:
+        return None
+    return {"owner": match.group("owner"), "repo": match.group("repo")}
+
+def read_OSH_reference(file_path, column=OSH_REFERENCE_COLUMN):
+    """
+    Reads the repositories of the reference list of open source hardware products: one product per row,
+    with any number of GitHub repositories in `column`, separated by ";". Products without repositories are skipped.
+
+    Parameters
+    ==========
+
+    `file_path` : str, required, path of the CSV file
+    `column` : str, optional, heading of the column with the repositories
+
+    Returns
+    =======
+
+    list of dicts: repositories (keys "owner" and "repo"), in the order of the products, possibly with duplicates
+    (see `deduplicate_repositories()`)
+
+    Raises
+    ======
+
+    ValueError
+        If the file has no column `column`.
+    """
+    repo_list = list()
+    n_products, n_empty = 0, 0
+    with open(file_path, newline="") as reference_file:
+        reference_csv = csv.DictReader(reference_file)
+        if column not in (reference_csv.fieldnames or list()):
+            raise ValueError(f"No column '{column}' in {file_path}")
+        for row in reference_csv:
+            n_products += 1
+            cells = [cell for cell in (row[column] or "").split(";") if cell.strip() != ""]
+            if len(cells) == 0:
+                n_empty += 1
+            for cell in cells:
+                repository = parse_repository(cell)
+                if repository is None:
+                    logging.warning(f"Skipping '{cell.strip()}' of product '{row.get('PRODUCT')}': not a GitHub repository")
+                else:
+                    repo_list.append(repository)
+    logging.info(f"{len(repo_list)} repositories read from {n_products} products, {n_empty} products without repository")
+    return repo_list
+
+def deduplicate_repositories(repo_list):
+    """
+    Removes the repositories listed more than once (GitHub names are case insensitive), keeping the first of each.
+    """
+    seen = set()
+    unique_repo_list = list()
+    for repository in repo_list:
+        key = (repository["owner"] + "/" + repository["repo"]).lower()
+        if key not in seen:
+            seen.add(key)
+            unique_repo_list.append(repository)
+    if len(unique_repo_list) < len(repo_list):
+        logging.info(f"{len(repo_list) - len(unique_repo_list)} duplicate repositories removed from the repository list")
+    return unique_repo_list
+
+##########
+# Shards
+##########
+
+def shard_of(repository, n_shards):
+    """
+    Returns the shard (from 0 to `n_shards` - 1) of a repository, from a hash of its name: the same on every
+    machine and in every run, and independent of the other repositories of the list, so a repository stays
+    in the same shard when repositories are added to the list.
+    """
+    key = (repository["owner"] + "/" + repository["repo"]).lower().encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big") % n_shards
+
+def select_shard(repo_list, shard, n_shards):
+    """
+    Returns the repositories of the list in shard `shard` of `n_shards` (see `shard_of()`), in the order of the list.
+    """
+    selected = [repository for repository in repo_list if shard_of(repository, n_shards) == shard]
+    logging.info(f"Shard {shard} of {n_shards}: {len(selected)} of {len(repo_list)} repositories")
+    return selected
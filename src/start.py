@@ -13,12 +13,8 @@ import json
 import os
 import sys
 import logging
-import json
-from dateutil import parser
-
-import networkx as nx
-import pandas as pd
-import numpy as np
+from contextlib import ExitStack
+from logging.config import dictConfig
 
 
 # default logging configuration
@@ -29,20 +25,71 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
 # import the necessary custom functions
 try:
+    from lazy_imports import lazy_import
     from initialise import initialise_options
-    from get_Github_forks import get_Github_forks
-    from get_commits import get_commits
-    from build_commit_history import build_commit_history
-    from build_file_change_history import build_file_change_history
-    from build_committer_graph import build_committer_graph
+    from get_Github_forks import get_Github_forks, get_Github_forks_concurrent
+    from get_Github_forks_graphql import get_Github_forks_graphql
+    from github_cache import GitHubResponseCache
+    from get_commits import get_commits, iter_commits
+    from get_fork_network_commits import get_fork_network_commits
+    from commit_store import CommitStore
+    from commit_table import CommitTable, CommitTableWriter, write_commit_table
+    from export_writers import COMPRESSED_SUFFIX, JSONArrayWriter, iter_JSON_array
+    from graph_formats import write_graph
+    from fetch_state import load_fetch_state, save_fetch_state, fork_state, stale_refs, drop_moved_refs
+    from build_commit_history import build_commit_history, CommitHistoryBuilder
+    from commit_dag import CommitDAG, CommitDAGBuilder
+    from build_file_change_history import bulk_build_file_change_history, FileChangeHistoryBuilder
+    from build_committer_graph import build_committer_graph, CommitterGraphBuilder
     from build_committer_graph import export_committer_graph
+    from time_windows import iter_time_windows
+    from timestamps import CommitDates, parse_commit_dates
+    from instrumentation import Instrumentation, write_run_report
+    from fork_filter import list_fork_heads, has_new_commits
+    from batch_scheduler import JobJournal, Checkpoints, ProcessPoolSubmitter, is_transient_error, order_by_size, run_batch, run_inline
 except ImportError as import_error:
     logging.error(
         f"Error importing required module(s):\n{import_error}", file=sys.stderr)
     exit(1)
 
+# heavy libraries are only loaded by the stages which use them (see lazy_imports.py)
+nx = lazy_import("networkx")
+pd = lazy_import("pandas")
+
 # functions 
 
+def export_suffix(configuration):
+    # suffix of the names of export files which may be compressed
+    return COMPRESSED_SUFFIX if configuration["compress_exports"] else ''
+
+def log_export(file_path, bytes_written):
+    # reports the size of an export, to keep an eye on the I/O cost of exports
+    logging.info(f"{bytes_written} bytes written to {file_path}")
+
+def new_committer_graph(configuration):
+    # empty committer graph: directed interactions between authors, or undirected with symmetric weights
+    if configuration["committer_graph_weights"] == "symmetric":
+        return nx.Graph()
+    return nx.MultiDiGraph()
+
+def line_stats_left_out(configuration):
+    # partial clones may leave out the line counts of file changes on purpose (see partial_clones.py)
+    return (configuration["git_backend"] == "native" and bool(configuration["clone_filter"]) and not configuration["fork_network"]
+            and (configuration["line_stats"] == "none" or len(configuration["line_stats_exclude"] or []) > 0))
+
+def stringize_commit_attributes(commit_history):
+    # stringize the non string node attributes of a commit history not supported by GrapML
+    for node in commit_history.nodes():
+        commit_history.nodes[node]['refs'] = str(
+            commit_history.nodes[node]['refs'])
+        commit_history.nodes[node]['parents'] = str(
+            commit_history.nodes[node]['parents'])
+
+def export_graph(graph, base_path, graph_formats, configuration):
+    # writes a graph in each of the chosen formats (see graph_formats.py), `base_path` is the path without extension
+    for graph_format in graph_formats:
+        log_export(*write_graph(graph, base_path, graph_format, compress=configuration["compress_exports"]))
+
 def build_export_file_path(dir_path, filename):
     # checks if the dir_path exists and if not create it
     # then returns the (now valid) file path 
@@ -51,168 +98,744 @@ def build_export_file_path(dir_path, filename):
     return os.path.join(
         dir_path, filename)
 
+class RepositoryLogFilter(logging.Filter):
+    """
+    Prefixes every log record with the repository being processed,
+    so the logs of repositories processed in parallel can be told apart.
+    """
+    def __init__(self, repository_name):
+        super().__init__()
+        self.repository_name = repository_name
+
+    def filter(self, record):
+        # the same record goes through the filter of each handler, it must only be prefixed once
+        if getattr(record, 'repository', None) is None:
+            record.repository = self.repository_name
+            record.msg = "[" + self.repository_name + "] " + record.getMessage()
+            record.args = None
+        return True
+
+def initialise_worker(log_config):
+    # applies the user supplied log configuration in worker processes
+    # (needed when processes are spawned instead of forked)
+    if log_config is not None:
+        dictConfig(log_config)
+
+def run_repository(repository, configuration, log_context=False, journal=None):
+    """
+    Processes one repository with `process_repository()` and isolates its failures,
+    so an error (or an `exit()`) while processing a repository does not stop the whole batch.
+
+    Parameters
+    ==========
+
+    `repository` : dict, required, item of the repository list (keys "owner" and "repo")
+    `configuration` : dict, required, configuration returned by `initialise_options()`
+    `log_context` : bool, optional, prefix all log records with the repository name
+    `journal` : JobJournal, optional, records the attempt and the stages completed, and resumes after them (see batch_scheduler.py)
+
+    Returns
+    =======
+
+    dict: repository name (key "repository"), "ok" or "failed" (key "status"), error message, if any (key "error"),
+    if the error is likely to go away by itself (key "transient", see `is_transient_error()`)
+    and measures of the stages processed, even if the processing failed (key "report", see instrumentation.py)
+    """
+    repository_name = repository["owner"] + "/" + repository["repo"]
+    instrumentation = Instrumentation(repository_name, debug_statistics=configuration["debug_statistics"])
+    if journal is not None:
+        journal.start_attempt(repository_name)
+    log_filter = None
+    if log_context:
+        log_filter = RepositoryLogFilter(repository_name)
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(log_filter)
+
+    result = {"repository": repository_name, "status": "ok", "error": None, "transient": False}
+    try:
+        process_repository(repository, configuration, instrumentation, Checkpoints(journal, repository_name))
+    except (Exception, SystemExit) as processing_error:
+        logging.exception(f"Processing of repository {repository_name} failed")
+        result["status"] = "failed"
+        result["error"] = repr(processing_error)
+        result["transient"] = is_transient_error(processing_error)
+    finally:
+        instrumentation.log_summary()
+        result["report"] = instrumentation.report()
+        if log_filter is not None:
+            for handler in logging.getLogger().handlers:
+                handler.removeFilter(log_filter)
+    return result
+
 ################################################################################################################################################
 ################################################################################################################################################
-# Initialisation 
+# Collection of the commits of all forks
 ################################################################################################################################################
 ################################################################################################################################################
 
-def main():
-
-    # Get commandline and configuration file options
-    configuration: dict = initialise_options()
-
-    #
-    # The rest of the script acts on each item in the list of git repositories to mine
-    #
-
-    logging.info(f"Start processing the {len(configuration['repo_list'])} repositories passed on")
-    for repository in configuration["repo_list"]:
-        logging.info(f"--- Start processing repository {repository['owner']}/{repository['repo']} ---")
-        username = repository["owner"]
-        repo = repository["repo"]
-
-        ########################################################################################################################################
-        ########################################################################################################################################
-        # Get (all forks of) all forks 
-        ########################################################################################################################################
-        ########################################################################################################################################
-
-        # Initialise an empty list of forks
-        forks = list()
-        forks.append({'user': username,
-                      'repo': repo,
-                      'parent_user': username,
-                      'parent_repo': repo})
-
-        get_Github_forks(username=username, reponame=repo, forks=forks, auth=configuration["auth_token"])
-
-        logging.info(f"{str(forks.__len__()-1)} forks found")
-
-        ########################################################################################################################################
-        ########################################################################################################################################
-        # get all commits from all previously fetched forks 
-        ########################################################################################################################################
-        ########################################################################################################################################
-
-        known_commits: list = list()  # compilation of all commits of all forks, without duplicates
-        known_commits_shas: list = list() # for easier access later
-        time_stamps: list = list() # so we can index commits per date
-
-        for fork in forks:
-            commits = list()  # all commits of this fork
-            get_commits(
-                username=fork['user'], reponame=fork['repo'], commits=commits, config=configuration)
-            for commit in commits:
-                if not commit['commit'] in known_commits_shas:
-                    known_commits.append(commit)
-                    known_commits_shas.append(commit['commit'])
-                    time_stamps.append(
-                        np.datetime64(
-                            parser.parse(commit['CommitDate'])
-                        )
-                    )
-
-        # create a panda.DataFrame with the known_commits data
-        sorted_commits = pd.DataFrame(
-            list(zip(known_commits_shas, known_commits)), 
-            columns=['sha','commit_data'],
-            index=pd.DatetimeIndex(time_stamps)
-        )
-        logging.info(f"{str(known_commits.__len__())} commits found")
-        del known_commits, known_commits_shas, time_stamps
-
-        # convert commits to a JSON string for export
-        commits_JSON = json.dumps(
-            sorted_commits['commit_data'].values.tolist(), 
-            sort_keys=True, 
-            indent=4
-        )
-    
-        # save the commits to a file
-        output_JSON = build_export_file_path(
-            os.path.join(configuration["data_dir"], 'JSON_commits'), 
-            username + '-' + repo + '.json') 
-        with open(output_JSON, 'w') as f:
-            f.write(commits_JSON)
+def commit_export_paths(username, repo, configuration):
+    # returns the paths of the commit exports of a repository: JSON file, forks containing each commit (JSON file) and commit table
+    output_JSON = build_export_file_path(
+        os.path.join(configuration["data_dir"], 'JSON_commits'), 
+        username + '-' + repo + '.json' + export_suffix(configuration)) 
+    output_forks_JSON = build_export_file_path(
+        os.path.join(configuration["data_dir"], 'JSON_commits'), 
+        username + '-' + repo + '-forks.json') 
+    output_table = os.path.join(configuration["data_dir"], 'commit_tables', username + '-' + repo)
+    return output_JSON, output_forks_JSON, output_table
+
+def load_previous_commits(fetch_state, configuration, output_JSON, output_forks_JSON, output_table):
+    """
+    Opens the commits exported by the previous run of the incremental mode.
+
+    Returns
+    =======
+
+    tuple: iterator over the previous commits, read back one commit at a time, and the forks containing each of them
+    (SHA -> list of "<user>/<repo>"), or (None, None) if there are no previous commits to start from
+    """
+    previous_commits = None
+    if len(fetch_state['forks']) > 0:
+        if configuration["commit_format"] != "json" and os.path.isdir(output_table):
+            previous_commits = CommitTable(output_table).iter_commits()
+        elif os.path.isfile(output_JSON):
+            previous_commits = iter_JSON_array(output_JSON)
+    if previous_commits is None:
+        return None, None
+
+    previous_forks = dict()
+    if os.path.isfile(output_forks_JSON):
+        with open(output_forks_JSON, 'r') as f:
+            previous_forks = json.load(f)
         del f
+    return previous_commits, previous_forks
+
+def load_exported_commits(username, repo, configuration):
+    """
+    Reads back the commits exported by `collect_commits()` (from the commit table if there is one),
+    in the order it returned them, or returns None if they were not exported.
+    """
+    output_JSON, output_forks_JSON, output_table = commit_export_paths(username, repo, configuration)
+    if configuration["commit_format"] != "json" and os.path.isdir(output_table):
+        return list(CommitTable(output_table).iter_commits())
+    elif configuration["commit_format"] != "columnar" and os.path.isfile(output_JSON):
+        return list(iter_JSON_array(output_JSON))
+    return None
+
+def list_heads_to_check(forks, configuration, instrumentation):
+    # with `configuration["skip_known_forks"]`, the heads of each fork (see fork_filter.py), None otherwise
+    if not configuration["skip_known_forks"] or len(forks) < 2:
+        return None
+    with instrumentation.stage("list_fork_heads") as stage:
+        fork_heads = list_fork_heads(forks, max_workers=configuration["http_workers"])
+        stage.add_items(len(forks) - 1)
+    return fork_heads
+
+def log_skipped_forks(n_skipped, forks, instrumentation):
+    # reports the number of forks skipped because all their commits were known
+    if n_skipped > 0:
+        logging.info(f"{n_skipped} of {len(forks) - 1} forks skipped: all their branches and tags point to known commits")
+    instrumentation.add_count("skipped_forks", n_skipped)
+
+def collect_commits(username, repo, forks, configuration, instrumentation=None):
+    """
+    Fetches the commits of all forks of a repository, exports them (without duplicates) and returns them.
+
+    Parameters
+    ==========
+
+    `username` : str, required
+    `repo` : str, required
+    `forks` : list of dicts, required, the repository and its forks (keys "user" and "repo")
+    `configuration` : dict, required, configuration returned by `initialise_options()`
+    `instrumentation` : Instrumentation, optional, measures the stages "fetch", "dedup" and the commit exports
+
+    Returns
+    =======
+
+    tuple: commits of all forks (list of dicts, in perceval format) and their dates (`CommitDates`),
+    parsed once for all consumers of the commits
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation(username + '/' + repo)
+
+    # compilation of all commits of all forks, without duplicates, with the forks containing each commit
+    commit_store = CommitStore()
+
+    output_JSON, output_forks_JSON, output_table = commit_export_paths(username, repo, configuration)
+
+    # in incremental mode we start from the commits exported by the previous run
+    # and only add those pushed since then
+    fetch_state = None
+    if configuration["incremental"]:
+        fetch_state = load_fetch_state(configuration["data_dir"], username, repo)
+        previous_commits, previous_forks = load_previous_commits(fetch_state, configuration, output_JSON, output_forks_JSON, output_table)
+        if previous_commits is not None:
+            with instrumentation.stage("load_previous_commits") as stage:
+                for commit in previous_commits:
+                    commit_store.add(commit)
+                    for fork_name in previous_forks.get(commit['commit'], list()):
+                        commit_store.add(commit, fork_name)
+                stage.add_items(len(commit_store))
+            logging.info(f"{len(commit_store)} commits known from the previous run")
+            del previous_commits, previous_forks
+        else:
+            # without the previous commits the recorded state is useless
+            fetch_state = {'forks': dict()}
+
+    fork_heads = None
+    if configuration["fork_network"]:
+        # all forks are fetched at once into a shared object store
+        with instrumentation.stage("fetch") as stage:
+            fork_network_commits = get_fork_network_commits(
+                username=username, reponame=repo, forks=forks, config=configuration, fetch_state=fetch_state)
+            stage.add_items(sum(len(commits) for commits, moved_refs in fork_network_commits))
+    else:
+        # forks whose heads are all known commits (of the previous run, the repository or the forks before them) are not fetched
+        fork_heads = list_heads_to_check(forks, configuration, instrumentation)
+    n_skipped = 0
+    moved_refs_of_forks = dict() # (fork, ref name) -> commit the ref pointed to before the fetch
+
+    for fork_index, fork in enumerate(forks):
+        if configuration["fork_network"]:
+            commits, moved_refs = fork_network_commits[fork_index]
+        elif fork_heads is not None and not has_new_commits(fork_heads[fork_index], commit_store):
+            n_skipped += 1
+            continue
+        else:
+            with instrumentation.stage("fetch") as stage:
+                commits = list()  # all commits of this fork
+                fork_entry = None if fetch_state is None else fork_state(fetch_state, fork['user'], fork['repo'])
+                moved_refs = get_commits(
+                    username=fork['user'], reponame=fork['repo'], commits=commits, config=configuration, fork_entry=fork_entry)
+                stage.add_items(len(commits))
+        with instrumentation.stage("dedup") as stage:
+            fork_name = fork['user'] + '/' + fork['repo']
+            for name, moved_sha in moved_refs.items():
+                moved_refs_of_forks[(fork_name, name)] = moved_sha
+            for commit in commits:
+                commit_store.add(commit, fork_name)
+            stage.add_items(len(commits))
+    if configuration["fork_network"]:
+        del fork_network_commits
+    if len(moved_refs_of_forks) > 0:
+        # remove the refs which moved to the new commits, in all forks, from the previously stored commits
+        for moved_sha, names in stale_refs(fetch_state, moved_refs_of_forks).items():
+            if moved_sha in commit_store:
+                drop_moved_refs(commit_store[moved_sha], names)
+    log_skipped_forks(n_skipped, forks, instrumentation)
+
+    # the dates of the commits are parsed once, after deduplication
+    commit_dates = commit_store.dates()
+
+    # create a panda.DataFrame with the known_commits data
+    sorted_commits = pd.DataFrame(
+        list(zip(commit_store.shas(), commit_store.commits())), 
+        columns=['sha','commit_data'],
+        index=pd.to_datetime(commit_dates.commit_dates, unit='s')
+    )
+    logging.info(f"{str(len(commit_store))} commits found")
+
+    if configuration["commit_format"] in ("json", "both"):
+        # save the commits to a file, one commit at a time
+        with instrumentation.stage("export_commits_json") as stage:
+            with JSONArrayWriter(output_JSON, compress=configuration["compress_exports"]) as writer:
+                for commit in commit_store:
+                    writer.add(commit)
+            stage.add_items(len(commit_store))
+        log_export(output_JSON, writer.bytes_written)
+        del writer
+
+    if configuration["commit_format"] in ("columnar", "both"):
+        # save the commits to a commit table (see commit_table.py)
+        with instrumentation.stage("export_commit_table") as stage:
+            log_export(output_table, write_commit_table(commit_store, output_table, dates=commit_dates))
+            stage.add_items(len(commit_store))
+
+    # save the forks containing each commit
+    with instrumentation.stage("export_commit_forks") as stage:
+        with open(output_forks_JSON, 'w') as f:
+            json.dump(commit_store.forks(), f, sort_keys=True)
+        stage.add_items(len(commit_store))
+    del f, commit_store
+
+    # the state is only saved once the commits are, so both always match
+    if fetch_state is not None:
+        save_fetch_state(configuration["data_dir"], username, repo, fetch_state)
+
+    # filter by time window 
+    ######################################################################################
+    # Arbitrary filter after April 2020 / for a test
+    #sorted_commits = sorted_commits[sorted_commits.index > '2020-07']
+
+    return sorted_commits['commit_data'].values.tolist(), commit_dates
+
+def stream_commits(username, repo, forks, configuration, instrumentation=None):
+    """
+    Fetches the commits of all forks of a repository and passes them on one at a time, once deduplicated,
+    to the commit exports and to the builders of the commit history, file change history and committer graph.
+
+    Only the SHAs (and forks) of the commits are kept for deduplication, so the memory needed is
+    bounded by the size of the graphs, not by the size of the commits. Two exceptions:
+    in fork network mode, the commits of all forks are parsed at once (see `get_fork_network_commits()`), and
+    in incremental mode, the new commits are fetched first, because the refs which moved away from
+    previously exported commits must be known before those are passed on.
+
+    Parameters
+    ==========
+
+    `username` : str, required
+    `repo` : str, required
+    `forks` : list of dicts, required, the repository and its forks (keys "user" and "repo")
+    `configuration` : dict, required, configuration returned by `initialise_options()`
+    `instrumentation` : Instrumentation, optional, measures the listing of the heads of the forks
+
+    Returns
+    =======
+
+    tuple: commit history (networkx DiGraph, or CommitDAG with `configuration["commit_history_backend"]` "csr"),
+    file change history (networkx DiGraph) and committer graph (see `new_committer_graph()`)
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation(username + '/' + repo)
+    output_JSON, output_forks_JSON, output_table = commit_export_paths(username, repo, configuration)
+
+    # compilation of the SHAs of all commits of all forks, with the forks containing each commit
+    commit_store = CommitStore(keep_commits=False)
+
+    if configuration["commit_history_backend"] == "csr":
+        commit_history_builder = CommitDAGBuilder()
+    else:
+        commit_history_builder = CommitHistoryBuilder(nx.DiGraph())
+    file_change_history = nx.DiGraph()
+    file_change_history_builder = FileChangeHistoryBuilder(file_change_history, line_stats_left_out=line_stats_left_out(configuration))
+    committer_graph = new_committer_graph(configuration)
+    committer_graph_builder = CommitterGraphBuilder(committer_graph, symmetric=configuration["committer_graph_weights"] == "symmetric")
+
+    fetch_state = None
+    previous_commits = None
+    if configuration["incremental"]:
+        fetch_state = load_fetch_state(configuration["data_dir"], username, repo)
+        previous_commits, previous_forks = load_previous_commits(fetch_state, configuration, output_JSON, output_forks_JSON, output_table)
+        if previous_commits is None:
+            # without the previous commits the recorded state is useless
+            fetch_state = {'forks': dict()}
+
+    # forks whose heads are all known commits are not fetched (see `collect_commits()`)
+    fork_heads = None
+    if not configuration["fork_network"]:
+        fork_heads = list_heads_to_check(forks, configuration, instrumentation)
+    n_skipped = 0
+
+    # the commits of the forks which must be fetched before being passed on, see above
+    fork_commits = None
+    if configuration["fork_network"]:
+        fork_commits = get_fork_network_commits(
+            username=username, reponame=repo, forks=forks, config=configuration, fetch_state=fetch_state)
+    elif previous_commits is not None:
+        fork_commits = list()
+        # the commits are only passed on afterwards, so the known commits are tracked here
+        fetched_shas = set(previous_forks) if fork_heads is not None else None
+        for fork_index, fork in enumerate(forks):
+            if fork_heads is not None and not has_new_commits(fork_heads[fork_index], fetched_shas):
+                n_skipped += 1
+                fork_commits.append((list(), dict()))
+                continue
+            commits = list()
+            moved_refs = get_commits(
+                username=fork['user'], reponame=fork['repo'], commits=commits, config=configuration,
+                fork_entry=fork_state(fetch_state, fork['user'], fork['repo']))
+            fork_commits.append((commits, moved_refs))
+            if fetched_shas is not None:
+                fetched_shas.update(commit['commit'] for commit in commits)
+
+    # the exports are only moved in place if all commits are passed on without error
+    with ExitStack() as writers_stack:
+        writers = dict() # export path -> writer
+        if configuration["commit_format"] in ("json", "both"):
+            writers[output_JSON] = writers_stack.enter_context(JSONArrayWriter(output_JSON, compress=configuration["compress_exports"]))
+        if configuration["commit_format"] in ("columnar", "both"):
+            writers[output_table] = writers_stack.enter_context(CommitTableWriter(output_table))
+
+        def pass_on(commits, fork_names):
+            for commit in commits:
+                if commit_store.add(commit):
+                    # the dates of each new commit are parsed once, for all the consumers which need them
+                    commit_dates = parse_commit_dates(commit)
+                    for writer in writers.values():
+                        if isinstance(writer, CommitTableWriter):
+                            writer.add(commit, commit_dates)
+                        else:
+                            writer.add(commit)
+                    if isinstance(commit_history_builder, CommitDAGBuilder):
+                        commit_history_builder.add(commit, commit_dates)
+                    else:
+                        commit_history_builder.add(commit)
+                    file_change_history_builder.add(commit, commit_dates[0])
+                for fork_name in fork_names(commit):
+                    commit_store.add(commit, fork_name)
+
+        if previous_commits is not None:
+            # remove the refs which moved to the new commits, in all forks, from the previously exported commits
+            moved_refs_of_forks = dict() # (fork, ref name) -> commit the ref pointed to before the fetch
+            for fork, (commits, moved_refs) in zip(forks, fork_commits):
+                for name, moved_sha in moved_refs.items():
+                    moved_refs_of_forks[(fork['user'] + '/' + fork['repo'], name)] = moved_sha
+            refs_to_drop = stale_refs(fetch_state, moved_refs_of_forks) # SHA -> names of the refs which moved away from this commit
+
+            def drop_refs(commits):
+                for commit in commits:
+                    if commit['commit'] in refs_to_drop:
+                        drop_moved_refs(commit, refs_to_drop[commit['commit']])
+                    yield commit
+
+            pass_on(drop_refs(previous_commits), lambda commit: previous_forks.get(commit['commit'], list()))
+            logging.info(f"{len(commit_store)} commits known from the previous run")
+            del previous_commits, previous_forks
+
+        for fork_index, fork in enumerate(forks):
+            fork_name = fork['user'] + '/' + fork['repo']
+            if fork_commits is not None:
+                commits = fork_commits[fork_index][0]
+            elif fork_heads is not None and not has_new_commits(fork_heads[fork_index], commit_store):
+                n_skipped += 1
+                continue
+            else:
+                fork_entry = None if fetch_state is None else fork_state(fetch_state, fork['user'], fork['repo'])
+                commits = iter_commits(username=fork['user'], reponame=fork['repo'], config=configuration, fork_entry=fork_entry)
+            pass_on(commits, lambda commit: [fork_name])
+            if fork_commits is not None:
+                fork_commits[fork_index] = None # the commits of this fork are not needed anymore
+    log_skipped_forks(n_skipped, forks, instrumentation)
+    logging.info(f"{str(len(commit_store))} commits found")
+    for export_path, writer in writers.items():
+        log_export(export_path, writer.bytes_written)
+
+    # save the forks containing each commit
+    with open(output_forks_JSON, 'w') as f:
+        json.dump(commit_store.forks(), f, sort_keys=True)
+    del f, commit_store
+
+    # the state is only saved once the commits are, so both always match
+    if fetch_state is not None:
+        save_fetch_state(configuration["data_dir"], username, repo, fetch_state)
+
+    commit_history = commit_history_builder.finish()
+    file_change_history_builder.finish(committer_graph_builder)
+    committer_graph_builder.finish()
+    return commit_history, file_change_history, committer_graph
 
-        # filter by time window 
-        ######################################################################################
-        # Arbitrary filter after April 2020 / for a test
-        #sorted_commits = sorted_commits[sorted_commits.index > '2020-07']
-
-        ########################################################################################################################################
-        ########################################################################################################################################
-        # buid the commit history based on the previously fetched (flat) list of commits
-        ########################################################################################################################################
-        ########################################################################################################################################
+################################################################################################################################################
+################################################################################################################################################
+# Processing of one repository
+################################################################################################################################################
+################################################################################################################################################
 
-        # recreate the 'network' view in GitHub (repo > insights > network)
-        # network is supposed to be a DAG (directed acyclic graph)
-        commit_history = nx.DiGraph()
-        build_commit_history(sorted_commits['commit_data'].values.tolist(), commit_history)
+def discover_forks(username, repo, configuration, instrumentation):
+    """
+    Finds all forks of a repository with the method chosen by `configuration["fork_discovery"]`.
+
+    Returns
+    =======
+
+    list of dicts: the repository itself, then its forks (keys "user", "repo", "parent_user" and "parent_repo")
+    """
+    # Initialise an empty list of forks
+    forks = list()
+    forks.append({'user': username,
+                  'repo': repo,
+                  'parent_user': username,
+                  'parent_repo': repo})
+
+    http_cache = None
+    if configuration["http_cache"]:
+        http_cache = GitHubResponseCache(
+            os.path.join(configuration["data_dir"], 'http_cache'),
+            max_age=configuration["http_cache_max_age"]*3600,
+            max_size=configuration["http_cache_max_size"]*1024*1024)
+
+    with instrumentation.stage("fork_discovery") as stage:
+        if configuration["fork_discovery"] == "graphql":
+            # GraphQL queries are POST requests, which can't be revalidated: the cache isn't used
+            get_Github_forks_graphql(username=username, reponame=repo, forks=forks, auth=configuration["auth_token"])
+        elif configuration["fork_discovery"] == "concurrent":
+            get_Github_forks_concurrent(username=username, reponame=repo, forks=forks, auth=configuration["auth_token"],
+                                        max_workers=configuration["http_workers"], cache=http_cache)
+        else:
+            get_Github_forks(username=username, reponame=repo, forks=forks, auth=configuration["auth_token"], cache=http_cache)
+        stage.add_items(len(forks) - 1)
+
+    if http_cache is not None:
+        http_cache.log_statistics()
+        http_cache.evict()
+
+    logging.info(f"{str(forks.__len__()-1)} forks found")
+    return forks
+
+def process_repository(repository, configuration, instrumentation=None, checkpoints=None):
+    """
+    Mines one repository and all its forks, builds the commit history, the file change history
+    and the committer graph and exports them to `configuration["data_dir"]`.
+
+    Parameters
+    ==========
+
+    `repository` : dict, required, item of the repository list (keys "owner" and "repo")
+    `configuration` : dict, required, configuration returned by `initialise_options()`
+    `instrumentation` : Instrumentation, optional, measures each stage (fork discovery, fetch, deduplication, builders, exports)
+    `checkpoints` : Checkpoints, optional, stages completed by previous attempts, which are not run again,
+        and in which the stages completed are recorded (see batch_scheduler.py)
+    """
+    logging.info(f"--- Start processing repository {repository['owner']}/{repository['repo']} ---")
+    username = repository["owner"]
+    repo = repository["repo"]
+    if instrumentation is None:
+        instrumentation = Instrumentation(username + '/' + repo, debug_statistics=configuration["debug_statistics"])
+    if checkpoints is None:
+        checkpoints = Checkpoints(None, username + '/' + repo)
+
+    ########################################################################################################################################
+    ########################################################################################################################################
+    # Get (all forks of) all forks 
+    ########################################################################################################################################
+    ########################################################################################################################################
+
+    if checkpoints.completed("fork_discovery"):
+        # the fork tree is the longest part to crawl again, and the one most exposed to rate limits
+        forks = checkpoints.data("fork_discovery")["forks"]
+        logging.info(f"{str(forks.__len__()-1)} forks found by a previous attempt")
+    else:
+        forks = discover_forks(username, repo, configuration, instrumentation)
+        checkpoints.complete("fork_discovery", forks=forks)
+
+    ########################################################################################################################################
+    ########################################################################################################################################
+    # get all commits from all previously fetched forks 
+    ########################################################################################################################################
+    ########################################################################################################################################
+
+    known_commits, commit_dates = None, None
+    if checkpoints.completed("commits") and not configuration["streaming"]:
+        # the commits exported by a previous attempt are read back instead of being fetched again
+        with instrumentation.stage("load_exported_commits") as stage:
+            known_commits = load_exported_commits(username, repo, configuration)
+            stage.add_items(0 if known_commits is None else len(known_commits))
+        if known_commits is not None:
+            logging.info(f"{len(known_commits)} commits exported by a previous attempt")
+            commit_dates = CommitDates.from_commits(known_commits)
+
+    if configuration["streaming"]:
+        # commits are passed on one at a time from the fetch to the exports and graph builders,
+        # so fetch, deduplication, builders and commit exports are measured as one stage
+        with instrumentation.stage("stream") as stage:
+            commit_history, file_change_history, committer_graph = stream_commits(username, repo, forks, configuration, instrumentation)
+            stage.add_items(len(commit_history))
+    elif known_commits is None:
+        known_commits, commit_dates = collect_commits(username, repo, forks, configuration, instrumentation)
+    checkpoints.complete("commits")
+
+    if configuration["window_length"] and not checkpoints.completed("time_windows"):
+        if configuration["streaming"]:
+            logging.warning("Time windows need all commits at once: they are not built in streaming mode")
+        else:
+            with instrumentation.stage("time_windows") as stage:
+                export_time_windows(username, repo, known_commits, configuration, dates=commit_dates)
+                stage.add_items(len(known_commits))
+            checkpoints.complete("time_windows")
+
+    ########################################################################################################################################
+    ########################################################################################################################################
+    # buid the commit history based on the previously fetched (flat) list of commits
+    ########################################################################################################################################
+    ########################################################################################################################################
+
+    # a commit history exported by a previous attempt is not needed by the next stages
+    # recreate the 'network' view in GitHub (repo > insights > network)
+    # network is supposed to be a DAG (directed acyclic graph)
+    if not checkpoints.completed("commit_history"):
+        if configuration["streaming"]:
+            pass # already built by `stream_commits()`
+        elif configuration["commit_history_backend"] == "csr":
+            with instrumentation.stage("build_commit_history") as stage:
+                commit_history = CommitDAG.from_commits(known_commits, dates=commit_dates)
+                stage.add_items(len(known_commits))
+        else:
+            with instrumentation.stage("build_commit_history") as stage:
+                commit_history = nx.DiGraph()
+                build_commit_history(known_commits, commit_history)
+                stage.add_items(len(known_commits))
+
+        if configuration["commit_history_backend"] == "csr":
+            logging.info(f"Commit DAG built with {len(commit_history)} commits and {commit_history.number_of_links()} links")
+            output_DAG = build_export_file_path(
+                os.path.join(configuration["data_dir"], 'commit_histories'), 
+                username + '-' + repo + '.npz') 
+            with instrumentation.stage("export_commit_dag") as stage:
+                log_export(output_DAG, commit_history.save(output_DAG))
+                stage.add_items(len(commit_history))
+            # the networkx graph is only created for the graph exports
+            with instrumentation.stage("convert_commit_dag") as stage:
+                commit_history = commit_history.to_networkx()
+                stage.add_items(len(commit_history))
 
         # stringize the non string node attributes not supported by GrapML
-        for node in commit_history.nodes():
-            commit_history.nodes[node]['refs'] = str(
-                commit_history.nodes[node]['refs'])
-            commit_history.nodes[node]['parents'] = str(
-                commit_history.nodes[node]['parents'])
+        stringize_commit_attributes(commit_history)
 
         logging.info(f"Commit history built with {len(commit_history.nodes())} nodes and {len(commit_history.edges())} edges")
 
-        # export the file commit history as GraphML
-        output_GraphML = build_export_file_path(
+        # export the file commit history (GraphML by default)
+        output_graph = build_export_file_path(
             os.path.join(configuration["data_dir"], 'commit_histories'), 
-            username + '-' + repo + '.GraphML') 
-        nx.write_graphml(commit_history, output_GraphML)
-
-        ################################################################################################################################################
-        ################################################################################################################################################
-        # build history of file changes based on the previously previously fetched (flat) list of commits
-        ################################################################################################################################################
-        ################################################################################################################################################
-
-        # network is supposed to be a DAG (directed acyclic graph)
-        file_change_history = nx.DiGraph() 
-        build_file_change_history(sorted_commits['commit_data'].values.tolist(), file_change_history)
-    
-        logging.info(f"File change history built with {len([c for c in nx.connected_components(file_change_history.to_undirected())])} files and {len(file_change_history.edges())} file changes")
-
-        # export the file change history as GraphML
-        output_GraphML = build_export_file_path(
+            username + '-' + repo) 
+        with instrumentation.stage("export_commit_history") as stage:
+            export_graph(commit_history, output_graph, configuration["commit_history_formats"], configuration)
+            stage.add_items(commit_history.number_of_nodes() + commit_history.number_of_edges())
+        checkpoints.complete("commit_history")
+
+    ################################################################################################################################################
+    ################################################################################################################################################
+    # build history of file changes based on the previously previously fetched (flat) list of commits
+    ################################################################################################################################################
+    ################################################################################################################################################
+
+    # network is supposed to be a DAG (directed acyclic graph)
+    if not configuration["streaming"]:
+        with instrumentation.stage("build_file_change_history") as stage:
+            file_change_history = nx.DiGraph() 
+            bulk_build_file_change_history(known_commits, file_change_history, line_stats_left_out=line_stats_left_out(configuration),
+                                           dates=commit_dates)
+            stage.add_items(len(known_commits))
+        del known_commits, commit_dates
+
+    logging.info(f"File change history built with {len(file_change_history.nodes())} file changes and {len(file_change_history.edges())} links")
+    # each file is a weakly connected component: counting them takes a pass over the whole history, so only on demand
+    n_files = instrumentation.add_statistic("files", lambda: nx.number_weakly_connected_components(file_change_history))
+    if n_files is not None:
+        logging.info(f"File change history of {n_files} files")
+
+    # export the file change history (GraphML by default)
+    # if exported by a previous attempt, it is still built for the committer graph
+    if not checkpoints.completed("file_change_history"):
+        output_graph = build_export_file_path(
             os.path.join(configuration["data_dir"], 'file_change_histories'), 
-            username + '-' + repo + '.GraphML') 
-        nx.write_graphml(file_change_history, output_GraphML)
+            username + '-' + repo) 
+        with instrumentation.stage("export_file_change_history") as stage:
+            export_graph(file_change_history, output_graph, configuration["file_change_history_formats"], configuration)
+            stage.add_items(file_change_history.number_of_nodes() + file_change_history.number_of_edges())
+        checkpoints.complete("file_change_history")
+
+    ################################################################################################################################################
+    ################################################################################################################################################
+    # build committer graph based on the previously previously generated file change history
+    ################################################################################################################################################
+    ################################################################################################################################################
+
+    if not configuration["streaming"]:
+        with instrumentation.stage("build_committer_graph") as stage:
+            committer_graph = new_committer_graph(configuration)
+            build_committer_graph(file_change_history, committer_graph, symmetric=configuration["committer_graph_weights"] == "symmetric")
+            stage.add_items(file_change_history.number_of_edges())
+
+    logging.info(f"Commiter graph built with {len(committer_graph.nodes())} unique committers")
+
+    # export the file committer graph (GraphML and node-link JSON by default)
+    output_graph = build_export_file_path(
+        os.path.join(configuration["data_dir"], 'committer_graphs'), 
+        username + '-' + repo) 
+    with instrumentation.stage("export_committer_graph") as stage:
+        export_graph(committer_graph, output_graph, configuration["committer_graph_formats"], configuration)
+
+        # the HTML page is never compressed, so it can be opened in a browser
+        output_VISJS = os.path.join(os.path.join(configuration["data_dir"], 'committer_graphs'), username + '-' + repo + '.html')
+        log_export(output_VISJS, export_committer_graph(committer_graph, output_VISJS))
+        stage.add_items(committer_graph.number_of_nodes() + committer_graph.number_of_edges())
+    checkpoints.complete("committer_graph")
+
+def export_time_windows(username, repo, known_commits, configuration, dates=None):
+    """
+    Slides a time window over the commits (see `time_windows.py`) and exports the size of the graphs of each window,
+    as a JSON array in `<data_dir>/time_windows/<owner>-<repo>.json`, and optionally
+    (`configuration["window_snapshots"]`) the graphs themselves, in the formats chosen for each graph, in `<data_dir>/time_windows/<owner>-<repo>/<start>/`.
+
+    Parameters
+    ==========
+
+    `username` : str, required
+    `repo` : str, required
+    `known_commits` : list of dicts, required, commits returned by `collect_commits()`
+    `configuration` : dict, required, configuration returned by `initialise_options()`
+    `dates` : CommitDates, optional, dates of the commits returned by `collect_commits()`
+    """
+    windows_dir = os.path.join(configuration["data_dir"], 'time_windows')
+    output_JSON = build_export_file_path(windows_dir, username + '-' + repo + '.json' + export_suffix(configuration))
+    n_windows = 0
+    with JSONArrayWriter(output_JSON, compress=configuration["compress_exports"]) as writer:
+        for start, end, window in iter_time_windows(known_commits,
+                                                    configuration["window_length"], configuration["window_step"],
+                                                    symmetric=configuration["committer_graph_weights"] == "symmetric",
+                                                    dates=dates):
+            writer.add(dict(window.metrics(), start=start.isoformat(), end=end.isoformat()))
+            n_windows += 1
+            if configuration["window_snapshots"]:
+                snapshot_dir = os.path.join(windows_dir, username + '-' + repo, start.strftime('%Y-%m-%d'))
+                commit_history = window.commit_history_snapshot()
+                stringize_commit_attributes(commit_history)
+                for name, graph in (('commit_history', commit_history),
+                                    ('file_change_history', window.file_change_history_snapshot()),
+                                    ('committer_graph', window.committer_graph_snapshot())):
+                    output_graph = build_export_file_path(snapshot_dir, name)
+                    for graph_format in configuration[name + "_formats"]:
+                        write_graph(graph, output_graph, graph_format, compress=configuration["compress_exports"])
+    logging.info(f"{n_windows} time windows of {configuration['window_length']} built")
+    log_export(output_JSON, writer.bytes_written)
 
-        ################################################################################################################################################
-        ################################################################################################################################################
-        # build committer graph based on the previously previously generated file change history
-        ################################################################################################################################################
-        ################################################################################################################################################
+################################################################################################################################################
+################################################################################################################################################
+# Initialisation 
+################################################################################################################################################
+################################################################################################################################################
 
-        committer_graph = nx.MultiDiGraph() 
-        build_committer_graph(file_change_history, committer_graph)
-    
-        logging.info(f"Commiter graph built with {len(committer_graph.nodes())} unique committers")
-
-        # export the file committer graph as GraphML
-        output_GraphML = build_export_file_path(
-            os.path.join(configuration["data_dir"], 'committer_graphs'), 
-            username + '-' + repo + '.GraphML') 
-        nx.write_graphml(committer_graph, output_GraphML)
-
-        JSON_string = json.dumps(nx.node_link_data(committer_graph), sort_keys=True, indent=4)
-        output_JSON = build_export_file_path(
-            os.path.join(configuration["data_dir"], 'committer_graphs'), 
-            username + '-' + repo + '.json') 
-        with open(output_JSON, 'w') as f:
-           f.write(JSON_string)
-        del f
+def main():
+
+    # Get commandline and configuration file options
+    configuration: dict = initialise_options()
+
+    #
+    # The rest of the script acts on each item in the list of git repositories to mine
+    #
+
+    logging.info(f"Start processing the {len(configuration['repo_list'])} repositories passed on")
+    repositories = configuration["repo_list"]
+    if configuration["order_by_size"]:
+        repositories = order_by_size(repositories, auth=configuration["auth_token"], max_workers=configuration["http_workers"])
+
+    # the status of each repository and the stages it completed are recorded in <data_dir>/journal (see batch_scheduler.py)
+    journal = JobJournal(configuration["data_dir"])
+    batch_options = dict(resume=configuration["resume"], max_retries=configuration["max_retries"], base_delay=configuration["retry_delay"])
+    if configuration["workers"] > 1 and len(repositories) > 1:
+        # repositories are independent from each other, so they are processed in separate processes
+        # each worker process gets its own copy of the configuration
+        with ProcessPoolSubmitter(run_repository, (configuration, True, journal),
+                                  max_workers=configuration["workers"],
+                                  initializer=initialise_worker,
+                                  initargs=(configuration["log_config"],)) as submit:
+            results, n_skipped = run_batch(repositories, submit, journal, max_running=configuration["workers"], **batch_options)
+    else:
+        results, n_skipped = run_batch(
+            repositories, lambda repository: run_inline(run_repository, repository, configuration, False, journal),
+            journal, **batch_options)
+
+    failed = [result for result in results if result["status"] != "ok"]
+    logging.info(f"{len(results) - len(failed)} of {len(results)} repositories processed successfully"
+                 + (f", {n_skipped} already done" if n_skipped > 0 else ""))
+    for result in failed:
+        logging.error(f"{result['repository']} failed: {result['error']}")
+
+    # measures of the stages of all repositories (see instrumentation.py)
+    report_path, textfile_path = write_run_report([result["report"] for result in results if result.get("report") is not None],
+                                                  os.path.join(configuration["data_dir"], 'reports'))
+    logging.info(f"Run report written to {report_path}" + (f" and {textfile_path}" if textfile_path is not None else ""))
 
-        output_VISJS = os.path.join(os.path.join(configuration["data_dir"], 'committer_graphs'), username + '-' + repo + '.html')
-        export_committer_graph(committer_graph, output_VISJS)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# commit history, file change history and committer graph of a time window sliding over the commits:
+# when the window moves, only the commits entering or leaving it are added or removed
+##########
+
+##########
+# Import libraries
+##########
+from bisect import bisect_left
+from collections import Counter
+
+from lazy_imports import lazy_import
+from colours import hls_palette
+from timestamps import CommitDates
+from build_commit_history import label_branches
+from build_file_change_history import FILE_CHANGE_DETAILS
+
+np = lazy_import("numpy")
+nx = lazy_import("networkx")
+pd = lazy_import("pandas")
+
+##########
+# Histories of a time window
+##########
+
+class WindowHistory:
+    """
+    Commit history, file change history and committer graph of a set of commits which can grow and shrink
+    one commit at a time, as a time window slides over the commits.
+
+    The graphs are the same as those built by `build_commit_history()`, `build_file_change_history()` and
+    `build_committer_graph()` for the commits in the window, except for the branches and colours, which
+    depend on the whole window and are only set on the snapshots (see `commit_history_snapshot()` and
+    `file_change_history_snapshot()`).
+
+    Adding or removing a commit only updates its own nodes and links: the changes of each file are kept
+    sorted by author date, so a file change is linked with (or unlinked from) its neighbours in place,
+    and the interactions between authors are counted up or down accordingly.
+
+    Parameters
+    ==========
+
+    `symmetric` : bool, optional, count the interactions between two authors regardless of their order
+    """
+
+    def __init__(self, symmetric=False):
+        self.symmetric = symmetric
+        self.commit_history = nx.DiGraph()
+        self.file_change_history = nx.DiGraph()
+        self._children = dict() # short SHA -> short SHAs of its children in the window
+        self._file_changes = dict() # file -> (author date, commit row, node id) of its changes in the window, sorted
+        self._filechanges = Counter() # author -> number of file changes in the window
+        self._interactions = Counter() # (parent author, child author) -> number of interactions in the window
+
+    def _interaction(self, parent_node, child_node, count):
+        parent_author = self.file_change_history.nodes[parent_node]['Author']
+        child_author = self.file_change_history.nodes[child_node]['Author']
+        # changes made by the same author are not interactions
+        if parent_author == child_author:
+            return
+        key = (parent_author, child_author)
+        if self.symmetric and child_author < parent_author:
+            key = (child_author, parent_author)
+        self._interactions[key] += count
+        if self._interactions[key] == 0:
+            del self._interactions[key]
+
+    def _link(self, parent_node, child_node):
+        self.file_change_history.add_edge(parent_node, child_node)
+        self._interaction(parent_node, child_node, 1)
+
+    def _unlink(self, parent_node, child_node):
+        self._interaction(parent_node, child_node, -1)
+        self.file_change_history.remove_edge(parent_node, child_node)
+
+    def add(self, commit, row, author_date):
+        """
+        Adds a commit (perceval format) to the window.
+
+        Parameters
+        ==========
+
+        `commit` : dict, required, commit data (perceval format)
+        `row` : int, required, position of the commit in the list of all commits, orders file changes with the same date
+        `author_date` : int, required, `AuthorDate` of the commit in seconds since epoch
+        """
+        # commit history: the commit and its links to the parents and children in the window
+        commit_history = self.commit_history
+        short_sha = commit['commit'][:7]
+        commit_history.add_node(short_sha,
+                   commit=commit['commit'],
+                   shortSha=short_sha,
+                   Author=commit['Author'],
+                   AuthorDate=commit['AuthorDate'],
+                   Commit=commit['Commit'],
+                   CommitDate=commit['CommitDate'],
+                   message=commit['message'],
+                   refs=list(commit['refs']),
+                   parents=commit['parents']
+                   )
+        for parent_sha in commit['parents']:
+            self._children.setdefault(parent_sha[:7], set()).add(short_sha)
+            if parent_sha[:7] in commit_history:
+                commit_history.add_edge(parent_sha[:7], short_sha)
+        for child in self._children.get(short_sha, set()):
+            if child in commit_history:
+                commit_history.add_edge(short_sha, child)
+
+        # file change history: each file change is inserted in the sequence of changes of its file
+        file_change_history = self.file_change_history
+        for filechange in commit.get('files', list()):
+            node_id = filechange["file"] + "_" + commit["commit"]
+            attributes = {
+                'unique_id': node_id,
+                'file': filechange["file"],
+                'Author': commit["Author"],
+                'Committer': commit["Commit"],
+                'AuthorDate': commit["AuthorDate"],
+                'CommitDate': commit["CommitDate"],
+                'commit': commit["commit"]
+            }
+            for key in FILE_CHANGE_DETAILS:
+                if key in filechange:
+                    attributes[key] = filechange[key]
+            if node_id in file_change_history:
+                # same file listed twice in a commit
+                file_change_history.nodes[node_id].update(attributes)
+                continue
+            file_change_history.add_node(node_id, **attributes)
+            self._filechanges[commit["Author"]] += 1
+
+            changes = self._file_changes.setdefault(filechange["file"], list())
+            entry = (author_date, row, node_id)
+            position = bisect_left(changes, entry)
+            previous_node = changes[position - 1][2] if position > 0 else None
+            next_node = changes[position][2] if position < len(changes) else None
+            if previous_node is not None and next_node is not None:
+                self._unlink(previous_node, next_node)
+            if previous_node is not None:
+                self._link(previous_node, node_id)
+            if next_node is not None:
+                self._link(node_id, next_node)
+            changes.insert(position, entry)
+
+    def remove(self, commit, row, author_date):
+        """
+        Removes a commit added by `add()` (with the same parameters) from the window.
+        """
+        short_sha = commit['commit'][:7]
+        self.commit_history.remove_node(short_sha)
+        for parent_sha in commit['parents']:
+            children = self._children.get(parent_sha[:7])
+            if children is not None:
+                children.discard(short_sha)
+                if len(children) == 0:
+                    del self._children[parent_sha[:7]]
+
+        file_change_history = self.file_change_history
+        for filechange in commit.get('files', list()):
+            node_id = filechange["file"] + "_" + commit["commit"]
+            if node_id not in file_change_history:
+                # same file listed twice in a commit, already removed
+                continue
+            changes = self._file_changes[filechange["file"]]
+            position = bisect_left(changes, (author_date, row, node_id))
+            previous_node = changes[position - 1][2] if position > 0 else None
+            next_node = changes[position + 1][2] if position + 1 < len(changes) else None
+            if previous_node is not None:
+                self._unlink(previous_node, node_id)
+            if next_node is not None:
+                self._unlink(node_id, next_node)
+            if previous_node is not None and next_node is not None:
+                self._link(previous_node, next_node)
+            del changes[position]
+            if len(changes) == 0:
+                del self._file_changes[filechange["file"]]
+
+            self._filechanges[commit["Author"]] -= 1
+            if self._filechanges[commit["Author"]] == 0:
+                del self._filechanges[commit["Author"]]
+            file_change_history.remove_node(node_id)
+
+    def metrics(self):
+        """
+        Returns the size of the graphs of the window (dict).
+        """
+        return {
+            'commits': self.commit_history.number_of_nodes(),
+            'commit_links': self.commit_history.number_of_edges(),
+            'files': len(self._file_changes),
+            'file_changes': self.file_change_history.number_of_nodes(),
+            'file_change_links': self.file_change_history.number_of_edges(),
+            'committers': len(self._filechanges),
+            'interactions': len(self._interactions),
+            'interaction_weight': sum(self._interactions.values())
+        }
+
+    def commit_history_snapshot(self):
+        """
+        Returns a copy of the commit history of the window, with its branches and colours (see `label_branches()`).
+        """
+        snapshot = self.commit_history.copy()
+        for node, attributes in snapshot.nodes(data=True):
+            # `label_branches()` may complete the refs
+            attributes['refs'] = list(attributes['refs'])
+        label_branches(snapshot)
+        return snapshot
+
+    def file_change_history_snapshot(self):
+        """
+        Returns a copy of the file change history of the window, with one colour per file.
+        """
+        snapshot = self.file_change_history.copy()
+        file_ids = dict()
+        for node, file_name in snapshot.nodes(data='file'):
+            file_ids.setdefault(file_name, len(file_ids))
+        palette_html = hls_palette(len(file_ids))
+        for node, attributes in snapshot.nodes(data=True):
+            attributes['colour'] = palette_html[file_ids[attributes['file']]]
+        for parent, child, attributes in snapshot.edges(data=True):
+            attributes['colour'] = snapshot.nodes[parent]['colour']
+        return snapshot
+
+    def committer_graph_snapshot(self):
+        """
+        Returns the committer graph of the window (a MultiDiGraph, or a Graph if the weights are symmetric).
+        """
+        committer_graph = nx.Graph() if self.symmetric else nx.MultiDiGraph()
+        committer_graph.add_nodes_from((author, {'weight': weight}) for author, weight in self._filechanges.items())
+        committer_graph.add_edges_from((parent_author, child_author, {'weight': weight})
+                                       for (parent_author, child_author), weight in self._interactions.items())
+        return committer_graph
+
+##########
+# Sliding time windows
+##########
+
+def iter_time_windows(known_commits, window_length, window_step=None, symmetric=False, dates=None):
+    """
+    Slides a time window over commits and yields the histories of each window.
+
+    The windows start at the first commit date (rolled back to the beginning of a step, e.g. to the first
+    day of the month for a step of "1MS") and are `window_step` apart. Commits belong to a window if their
+    commit date is in [start, end). From one window to the next, the commits which left the window are removed
+    and those which entered it are added: each commit is added and removed at most once over all windows.
+
+    Parameters
+    ==========
+
+    `known_commits` : list of dicts, required, commit data generated by perceval, in any order
+    `window_length` : str, required, length of the windows as a pandas frequency, e.g. "30D" or "1MS"
+    `window_step` : str, optional, time between the starts of two windows as a pandas frequency (by default `window_length`)
+    `symmetric` : bool, optional, count the interactions between two authors regardless of their order
+    `dates` : CommitDates, optional, dates of the commits if already parsed (see `timestamps.CommitDates`)
+
+    Yields
+    ======
+
+    tuple: start (pandas Timestamp), end (pandas Timestamp) and `WindowHistory` of each window;
+    the same `WindowHistory` is updated from one window to the next
+    """
+    length = pd.tseries.frequencies.to_offset(window_length)
+    step = pd.tseries.frequencies.to_offset(window_step if window_step else window_length)
+    if len(known_commits) == 0:
+        return
+
+    if dates is None:
+        dates = CommitDates.from_commits(known_commits)
+    commit_dates, author_dates = dates.commit_dates, dates.author_dates
+    order = np.argsort(commit_dates, kind='stable') # rows of the commits sorted by commit date
+    sorted_dates = commit_dates[order]
+
+    window = WindowHistory(symmetric=symmetric)
+    entering, leaving = 0, 0 # next commit to add, next commit to remove (positions in `order`)
+    start = step.rollback(pd.Timestamp(int(sorted_dates[0]), unit='s').normalize())
+    while start.timestamp() <= sorted_dates[-1]:
+        end = start + length
+        if end <= start:
+            raise ValueError(f"the window length {window_length} is not positive")
+        # commits which left the window
+        while leaving < len(order) and sorted_dates[leaving] < start.timestamp():
+            if leaving < entering:
+                row = int(order[leaving])
+                window.remove(known_commits[row], row, int(author_dates[row]))
+            leaving += 1
+        # commits which entered the window
+        entering = max(entering, leaving)
+        while entering < len(order) and sorted_dates[entering] < end.timestamp():
+            row = int(order[entering])
+            window.add(known_commits[row], row, int(author_dates[row]))
+            entering += 1
+        yield start, end, window
+
+        next_start = start + step
+        if next_start <= start:
+            raise ValueError(f"the window step {window_step} is not positive")
+        start = next_start
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# conversion between the dates generated by perceval (`AuthorDate`, `CommitDate`)
+# and numbers: seconds since epoch (UTC) and time zone offset in minutes
+##########
+
+##########
+# Import libraries
+##########
+import calendar
+from datetime import datetime, timedelta
+
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+# example of a date generated by perceval: Mon Mar 26 16:04:21 2018 +0100
+# (git does not pad the day of the month: Mon Mar 5 16:04:21 2018 +0100)
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+MONTH_NUMBERS = {month: i + 1 for i, month in enumerate(MONTHS)}
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+EPOCH = datetime(1970, 1, 1)
+
+def parse_git_date(date_string):
+    """
+    Converts a date generated by perceval into seconds since epoch (UTC) and a time zone offset in minutes.
+
+    Example: "Mon Mar 26 16:04:21 2018 +0100" -> (1522076661, 60)
+    """
+    weekday, month, day, time_of_day, year, zone = date_string.split()
+    hours, minutes, seconds = time_of_day.split(':')
+    offset = int(zone[1:3]) * 60 + int(zone[3:5])
+    if zone[0] == '-':
+        offset = -offset
+    epoch = calendar.timegm((int(year), MONTH_NUMBERS[month], int(day), int(hours), int(minutes), int(seconds))) - offset * 60
+    return epoch, offset
+
+def format_git_date(epoch, offset):
+    """
+    Converts seconds since epoch (UTC) and a time zone offset in minutes back into a date formatted as by perceval.
+
+    Example: (1522076661, 60) -> "Mon Mar 26 16:04:21 2018 +0100"
+    """
+    offset = int(offset)
+    local_time = EPOCH + timedelta(seconds=int(epoch) + offset * 60)
+    sign = '-' if offset < 0 else '+'
+    return (f"{WEEKDAYS[local_time.weekday()]} {MONTHS[local_time.month - 1]} {local_time.day} "
+            f"{local_time.hour:02d}:{local_time.minute:02d}:{local_time.second:02d} {local_time.year} "
+            f"{sign}{abs(offset) // 60:02d}{abs(offset) % 60:02d}")
+
+##########
+# Parse many dates at once
+##########
+
+# layout of a date once the day of the month is padded to two digits: "Mon Mar 05 16:04:21 2018 +0100"
+DATE_LENGTH = 30
+SEPARATORS = {3: b' ', 7: b' ', 10: b' ', 13: b':', 16: b':', 19: b' ', 24: b' '}
+DIGITS = [8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 22, 23, 26, 27, 28, 29]
+# months encoded as 3-byte integers, sorted, and the number of each month
+MONTH_CODES = sorted((month.encode('ascii')[0] << 16 | month.encode('ascii')[1] << 8 | month.encode('ascii')[2], i + 1)
+                     for i, month in enumerate(MONTHS))
+
+def _days_from_civil(year, month, day):
+    # number of days since 1970-01-01 of a date of the proleptic Gregorian calendar, for arrays of dates
+    # (algorithm "days_from_civil" by Howard Hinnant)
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def parse_git_dates(date_strings):
+    """
+    Converts many dates generated by perceval at once into seconds since epoch (UTC) and time zone offsets in minutes,
+    like `parse_git_date()` but with array operations instead of one Python call per date.
+    Dates which don't have the usual layout are converted with `parse_git_date()`.
+
+    Parameters
+    ==========
+
+    `date_strings` : list of str, required, e.g. the `AuthorDate` of all commits
+
+    Returns
+    =======
+
+    tuple: numpy array of int64 (seconds since epoch) and numpy array of int16 (time zone offsets), in the order of `date_strings`
+    """
+    n_dates = len(date_strings)
+    if n_dates == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int16)
+
+    # one row of bytes per date, padded with zeros
+    raw = np.array(date_strings, dtype='S' + str(DATE_LENGTH + 1)).view(np.uint8).reshape(n_dates, DATE_LENGTH + 1)
+    # pad the day of the month to two digits: "Mon Mar 5 ..." -> "Mon Mar 05 ..."
+    dates = raw[:, :DATE_LENGTH].copy()
+    single_digit_day = raw[:, 9] == ord(' ')
+    dates[single_digit_day, 9:] = raw[single_digit_day, 8:DATE_LENGTH - 1]
+    dates[single_digit_day, 8] = ord('0')
+
+    valid = raw[:, DATE_LENGTH] == 0
+    for position, separator in SEPARATORS.items():
+        valid &= dates[:, position] == separator[0]
+    digits = dates[:, DIGITS].astype(np.int64) - ord('0')
+    valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    valid &= (dates[:, 25] == ord('+')) | (dates[:, 25] == ord('-'))
+
+    month_codes = dates[:, 4].astype(np.int64) << 16 | dates[:, 5].astype(np.int64) << 8 | dates[:, 6].astype(np.int64)
+    known_codes = np.array([code for code, number in MONTH_CODES], dtype=np.int64)
+    month_positions = np.minimum(np.searchsorted(known_codes, month_codes), len(known_codes) - 1)
+    valid &= known_codes[month_positions] == month_codes
+    months = np.array([number for code, number in MONTH_CODES], dtype=np.int64)[month_positions]
+
+    def number(first, n_digits):
+        # value of the `n_digits` digits starting at column `first` of `digits`
+        value = np.zeros(n_dates, dtype=np.int64)
+        for column in range(first, first + n_digits):
+            value = value * 10 + digits[:, column]
+        return value
+
+    day, hours, minutes, seconds = number(0, 2), number(2, 2), number(4, 2), number(6, 2)
+    year = number(8, 4)
+    offsets = number(12, 2) * 60 + number(14, 2)
+    offsets = np.where(dates[:, 25] == ord('-'), -offsets, offsets)
+    epochs = _days_from_civil(year, months, day) * 86400 + hours * 3600 + minutes * 60 + seconds - offsets * 60
+
+    # unusual dates (e.g. a year with more than 4 digits) are parsed one at a time
+    for i in np.flatnonzero(~valid):
+        epochs[i], offsets[i] = parse_git_date(date_strings[i])
+    return epochs, offsets.astype(np.int16)
+
+class CommitDates:
+    """
+    `AuthorDate` and `CommitDate` of a list of commits, each parsed once (see `parse_git_dates()`),
+    so the consumers of the commits (commit DAG, commit table, file change history, time windows) don't parse them again.
+
+    Attributes
+    ==========
+
+    `author_dates`, `commit_dates` : numpy arrays of int64, seconds since epoch (UTC), in the order of the commits
+    `author_tzs`, `commit_tzs` : numpy arrays of int16, time zone offsets in minutes, in the order of the commits
+    """
+
+    def __init__(self, author_date_strings, commit_date_strings):
+        self.author_dates, self.author_tzs = parse_git_dates(author_date_strings)
+        self.commit_dates, self.commit_tzs = parse_git_dates(commit_date_strings)
+
+    @classmethod
+    def from_commits(cls, commits):
+        """
+        Parses the dates of a list of commits (perceval format).
+        """
+        return cls([commit['AuthorDate'] for commit in commits], [commit['CommitDate'] for commit in commits])
+
+    def __len__(self):
+        return len(self.commit_dates)
+
+    def rows(self):
+        """
+        Returns the dates of each commit as a tuple of ints (author date, author time zone, commit date, commit time zone),
+        in the order of the commits, e.g. for the `add()` method of the builders.
+        """
+        return list(zip(self.author_dates.tolist(), self.author_tzs.tolist(), self.commit_dates.tolist(), self.commit_tzs.tolist()))
+
+def parse_commit_dates(commit):
+    """
+    Returns the dates of one commit (perceval format) as a row of `CommitDates.rows()`.
+    """
+    return parse_git_date(commit['AuthorDate']) + parse_git_date(commit['CommitDate'])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+##########
+# the commits mined from partial clones (see partial_clones.py) are the same as those mined from full clones,
+# checked against a local bare repository which allows filters, cloned through a file:// URL
+# example: python -m unittest discover tests   (or: python -m pytest tests)
+##########
+
+##########
+# Import libraries
+##########
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# the modules of the pipeline are in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from get_commits import fetch_git_log
+
+# fixed identity and dates, so the commits don't depend on the git configuration of the machine
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Ada', 'GIT_AUTHOR_EMAIL': 'ada@example.org',
+    'GIT_COMMITTER_NAME': 'Ada', 'GIT_COMMITTER_EMAIL': 'ada@example.org',
+    'GIT_CONFIG_NOSYSTEM': '1', 'GIT_CONFIG_GLOBAL': os.devnull,
+}
+
+def git(args, cwd, date=None):
+    env = dict(os.environ, **GIT_ENV)
+    if date is not None:
+        env['GIT_AUTHOR_DATE'] = env['GIT_COMMITTER_DATE'] = f"{date} +0200"
+    subprocess.run(['git'] + args, cwd=cwd, env=env, check=True, capture_output=True)
+
+def write(work_path, file_path, content):
+    path = os.path.join(work_path, file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+def without_line_stats(commits, pattern_suffix):
+    # the commits without the line counts of the files ending with `pattern_suffix`, and without
+    # the file changes of those files only listed in the line counts (e.g. by merges)
+    stripped = list()
+    for commit in commits:
+        files = list()
+        for changed_file in commit['files']:
+            if changed_file['file'].rstrip('}').endswith(pattern_suffix):
+                if 'action' not in changed_file:
+                    continue
+                changed_file = {key: value for key, value in changed_file.items() if key not in ('added', 'removed')}
+            files.append(changed_file)
+        stripped.append(dict(commit, files=files))
+    return stripped
+
+class PartialCloneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.work_path = os.path.join(self.directory, 'work')
+        self.bare_path = os.path.join(self.directory, 'repository.git')
+        self.URL = 'file://' + self.bare_path
+        git(['init', '--quiet', '-b', 'master', self.work_path], cwd=self.directory)
+        self.date = 1600000000
+
+        # text files, a mesh, a rename, a copy, a deletion, a tag and a merge of a branch
+        self.commit({'README.md': 'hardware\n', 'cad/frame.stl': 'solid frame\nfacet\nendsolid\n'}, 'Add frame')
+        self.commit({'README.md': 'hardware\nassembly\n', 'doc/bom.csv': 'part,count\nscrew,4\n'}, 'Add bill of materials')
+        git(['mv', 'doc/bom.csv', 'doc/parts.csv'], cwd=self.work_path)
+        self.commit({}, 'Rename bill of materials')
+        git(['tag', '-a', 'v1', '-m', 'v1'], cwd=self.work_path)
+        git(['checkout', '--quiet', '-b', 'feature'], cwd=self.work_path)
+        self.commit({'cad/frame.stl': 'solid frame\nfacet\nfacet\nendsolid\n', 'cad/copy.stl': 'solid frame\nfacet\nendsolid\n'}, 'Refine frame')
+        git(['checkout', '--quiet', 'master'], cwd=self.work_path)
+        self.commit({'README.md': 'hardware\nassembly\nwiring\n'}, 'Document wiring')
+        self.date += 60
+        git(['merge', '--quiet', '--no-ff', '-m', 'Merge feature', 'feature'], cwd=self.work_path, date=self.date)
+        git(['rm', '--quiet', 'cad/copy.stl'], cwd=self.work_path)
+        self.commit({}, 'Remove copy')
+
+        git(['clone', '--quiet', '--bare', self.work_path, self.bare_path], cwd=self.directory)
+        git(['config', 'uploadpack.allowFilter', 'true'], cwd=self.bare_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def commit(self, files, message):
+        for file_path, content in files.items():
+            write(self.work_path, file_path, content)
+        self.date += 60
+        git(['add', '--all'], cwd=self.work_path)
+        git(['commit', '--quiet', '-m', message], cwd=self.work_path, date=self.date)
+
+    def push(self):
+        git(['push', '--quiet', '--all', self.bare_path], cwd=self.work_path)
+
+    def fetch(self, clone_name, **options):
+        return list(fetch_git_log(self.URL, os.path.join(self.directory, clone_name), **options))
+
+    def test_same_commits_as_full_clone(self):
+        full = self.fetch('full')
+        partial = self.fetch('partial', clone_filter='blob:none')
+        self.assertEqual(len(full), 7)
+        self.assertEqual(partial, full)
+
+    def test_line_stats_exclude(self):
+        full = self.fetch('full')
+        partial = self.fetch('partial', clone_filter='blob:none', line_stats_exclude=['*.stl'])
+        self.assertEqual(partial, without_line_stats(full, '.stl'))
+
+    def test_no_line_stats(self):
+        full = self.fetch('full')
+        partial = self.fetch('partial', clone_filter='blob:none', line_stats=False)
+        self.assertEqual(partial, without_line_stats(full, ''))
+
+    def test_incremental_fetch(self):
+        full = self.fetch('full')
+        partial = self.fetch('partial', clone_filter='blob:none')
+        known_tips = [commit['commit'] for commit in full]
+
+        self.commit({'README.md': 'hardware\nassembly\nwiring\ntesting\n', 'cad/base.stl': 'solid base\nendsolid\n'}, 'Add base')
+        self.commit({'cad/base.stl': 'solid base\nfacet\nendsolid\n'}, 'Refine base')
+        self.push()
+
+        new_full = self.fetch('full', known_tips=known_tips)
+        new_partial = self.fetch('partial', clone_filter='blob:none', known_tips=known_tips)
+        self.assertEqual([commit['message'] for commit in new_full], ['Add base', 'Refine base'])
+        self.assertEqual(new_partial, new_full)
+
+if __name__ == "__main__":
+    unittest.main()